@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: write-behind group commit vs one commit per completion
+
+Records N activity completions from several threads, the way concurrent
+/complete requests would. First it commits each one synchronously, as a
+handler writing straight to SQLite would. Then it uses the write-behind
+ActivityStore. Reports request-path latency, sustained completions per
+second until everything is durable, and the store's batch and commit
+metrics.
+
+Usage: python3.11 benchmarks/bench_activity_writes.py [completions] [threads]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.activities import ActivityStore
+from src.services.metrics import percentile
+
+def activity(i):
+    return {'id': f"prayer_daily_{i}", 'user_id': f"user_{i % 500}", 'type': 'prayer', 'topic_id': 'daily',
+            'topic': {}, 'timestamp': datetime.now().isoformat(), 'duration': 5, 'notes': '', 'rating': None}
+
+def run(threads, count, record):
+    """Call ``record(i)`` for every i across threads; returns per-call latencies"""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        for i in range(offset, count, threads):
+            start = time.perf_counter()
+            record(i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies
+
+def report(label, latencies, elapsed, count):
+    print(f"{label:<26} {count / elapsed:>9,.0f} completions/s   request path p50 "
+          f"{percentile(latencies, 50) * 1e6:7.1f} µs  p99 {percentile(latencies, 99) * 1e6:8.1f} µs")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct = ActivityStore(os.path.join(tmp, 'direct.db'))
+        db = direct._connect()
+        db_lock = threading.Lock()
+
+        def commit_each(i):
+            a = activity(i)
+            with db_lock:
+                db.execute('INSERT OR IGNORE INTO activities (id, user_id, type, topic_id, timestamp, duration, body) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (a['id'], a['user_id'], a['type'], a['topic_id'], a['timestamp'], a['duration'], '{}'))
+        direct_count = max(1, count // 10)
+        start = time.perf_counter()
+        latencies = run(threads, direct_count, commit_each)
+        report(f"Commit per request ({direct_count})", latencies, time.perf_counter() - start, direct_count)
+        db.close()
+
+        store = ActivityStore(os.path.join(tmp, 'activities.db'))
+        start = time.perf_counter()
+        latencies = run(threads, count, lambda i: store.record(activity(i)))
+        store.flush()
+        report(f"Write-behind ({count})", latencies, time.perf_counter() - start, count)
+        store.close()
+
+        stats = store.stats()
+        print(f"  {stats['batches']} group commits, avg batch {stats['avg_batch']}, max {stats['max_batch']}; "
+              f"commit p50 {stats['flush_p50_ms']} ms, p99 {stats['flush_p99_ms']} ms; "
+              f"synchronous={stats['synchronous']}")
+        rows = sqlite3.connect(os.path.join(tmp, 'activities.db')).execute('SELECT COUNT(*) FROM activities')
+        print(f"  rows on disk: {rows.fetchone()[0]}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full calendar resync vs incremental sync
+
+Starts the local stand-in for the Google Calendar API (``fake_calendar``)
+and syncs N programs through ``CalendarSync`` with a throwaway state
+database. It then runs the sync repeatedly. First nothing changes, as with
+auto-sync. Then a few programs are edited, a few dropped, and one event is
+edited in the calendar itself. Finally the sync token is expired. For
+comparison, a full resync inserts every program's event again on every
+run. Reports wall time, HTTP requests and calls for each run.
+
+Usage: python3.11 benchmarks/bench_calendar_sync.py [programs] [changed]
+"""
+import os
+import sys
+import tempfile
+import time
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.calendar_sync import CalendarSync, CalendarSyncStore, content_hash
+from src.services.fake_calendar import FakeCalendar, FakeCalendarServer
+from src.services.google_calendar import CalendarClient, event_id
+
+def programs(count, edited=0):
+    desired = {}
+    for i in range(count):
+        program = {'title': f'Morning Prayer {i}', 'time': '08:00' if i < edited else '07:00', 'days': 30}
+        event = {
+            'summary': f"Prayer: {program['title']}",
+            'start': {'dateTime': f"2026-10-18T{program['time']}:00", 'timeZone': 'America/New_York'},
+            'end': {'dateTime': f"2026-10-18T{program['time'][:2]}:30:00", 'timeZone': 'America/New_York'},
+            'recurrence': [f"RRULE:FREQ=DAILY;COUNT={program['days']}"],
+            'status': 'confirmed'
+        }
+        desired[f'program-{i}'] = (content_hash(program), lambda event=event: dict(event))
+    return desired
+
+def run(label, server, fn):
+    before = dict(server.calendar.stats)
+    start = time.perf_counter()
+    summary = fn()
+    elapsed = time.perf_counter() - start
+    requests_made = server.calendar.stats['http_requests'] - before['http_requests']
+    calls = server.calendar.stats['calls'] - before['calls']
+    print(f"{label:<34} {elapsed * 1000:8.1f} ms  {requests_made:>4} HTTP requests  {calls:>5} calls  {summary}")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    changed = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    server = FakeCalendarServer(FakeCalendar(call_latency=0)).start()
+    print(f"Stand-in server at {server.api_base}, {server.latency * 1000:.0f} ms per HTTP request")
+    client = CalendarClient('benchmark-token', server.api_base, server.batch_url, backoff=0.05)
+    sync = CalendarSync(CalendarSyncStore(os.path.join(tempfile.mkdtemp(), 'calendar_sync.db')))
+
+    def full_resync():
+        events = [dict(build(), id=event_id('full', key)) for key, (_, build) in programs(count).items()]
+        results = client.insert_events('full-resync', events)
+        return f"{sum(1 for result in results if result['ok'])} inserted"
+
+    def incremental(desired):
+        def fn():
+            _, summary = sync.sync('benchmark-user', desired, client)
+            return ', '.join(f'{name} {value}' for name, value in summary.items() if value)
+        return fn
+
+    run('Full resync (every program)', server, full_resync)
+    run('Incremental, first sync', server, incremental(programs(count)))
+    run('Incremental, nothing changed', server, incremental(programs(count)))
+    run(f'Incremental, {changed} edited, {changed} dropped', server,
+        incremental(programs(count - changed, edited=changed)))
+
+    event = next(e for e in server.calendar.live_events() if e['summary'].endswith(f' {changed + 1}'))
+    server.calendar.call('PATCH', f"/calendar/v3/calendars/primary/events/{event['id']}", {'summary': 'Edited'})
+    run('Incremental, 1 edited in calendar', server, incremental(programs(count - changed, edited=changed)))
+
+    server.calendar.expire_sync_tokens()
+    run('Incremental, sync token expired', server, incremental(programs(count - changed, edited=changed)))
+    server.stop()
+
+if __name__ == '__main__':
+    main()
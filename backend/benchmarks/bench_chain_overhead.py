@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-request chain overhead before and after the chain factory
+
+The LLM call is stubbed with a fake chat model so the numbers only reflect
+prompt template parsing, chain composition and variable binding.
+
+Usage: python3.11 benchmarks/bench_chain_overhead.py [iterations]
+"""
+import os
+import sys
+import time
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.services.chains import SPIRITUAL_SYSTEM_PROMPT, ChainFactory
+from src.services.llm_registry import registry
+
+STUB_REPLY = 'Peace be with you.'
+
+def build_stub_client(model, api_key, temperature):
+    """Fake model that answers instantly"""
+    return FakeListChatModel(responses=[STUB_REPLY])
+
+def request_before(client, variables):
+    """Old request path: parse the template and compose the chain every time"""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", SPIRITUAL_SYSTEM_PROMPT),
+        ("human", "{context}\n\nUser: {message}")
+    ])
+    chain = prompt | client
+    return chain.invoke(variables)
+
+def request_after(factory, variables):
+    """New request path: fetch the cached chain and bind variables"""
+    return factory.get('chat', 'stub').invoke(variables)
+
+def measure(label, fn, iterations):
+    # Warm up so imports and first-use costs don't skew the numbers
+    for _ in range(50):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    per_request_us = elapsed / iterations * 1e6
+    print(f"{label:<28} {per_request_us:10.1f} µs/request")
+    return per_request_us
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    registry.register('stub', build_stub_client, default_model='stub')
+    factory = ChainFactory()
+    client = registry.get('stub')
+    variables = {'context': 'Previous context: I feel anxious', 'message': 'I need peace'}
+
+    print(f"Running {iterations} stubbed requests per variant...")
+    before = measure('before (rebuild per request)', lambda: request_before(client, variables), iterations)
+    after = measure('after (cached chain)', lambda: request_after(factory, variables), iterations)
+    print(f"Saved {before - after:.1f} µs per request ({before / after:.2f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark: startup time and memory of a large generated content pack
+
+Generates N synthetic topics (about 1.5 KB each) and compares loading them as
+in-process dicts, the way the old module literals were, with opening a
+content pack. A pack reads only its catalog at startup and loads bodies
+lazily. The script also times lazy lookups and an atomic hot reload. Memory is
+the Python heap as measured by tracemalloc. The pack's pages are
+memory-mapped from the OS page cache, shared by every worker, and are not
+counted.
+
+Usage: python3.11 benchmarks/bench_content_pack.py [topics]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.content_pack import ContentCollection, ContentPack, ContentStore, build_pack, read_source
+
+KINDS = ('devotion', 'prayer', 'meditation', 'accountability')
+WORDS = ('grace faith hope love peace mercy strength trust rest light joy patience comfort '
+         'wisdom courage healing forgiveness prayer scripture spirit').split()
+
+def generate(count, seed=0):
+    rng = random.Random(seed)
+    sentence = lambda n: ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+    content = {kind: {} for kind in KINDS}
+    for i in range(count):
+        kind = KINDS[i % len(KINDS)]
+        content[kind][f"{kind}_{i}"] = {
+            'title': f"{sentence(3)[:-1]} {i}",
+            'category': rng.choice(WORDS).title(),
+            'scripture': {'reference': 'Philippians 4:6-7', 'text': sentence(40)},
+            'prayer': sentence(40),
+            'declaration': sentence(20),
+            'reflection': sentence(120),
+            'video': {'title': sentence(6), 'url': 'https://www.youtube.com/watch?v=example'}
+        }
+    return content
+
+def measure(fn):
+    """``(seconds, heap_bytes)``: one untraced run for time, one traced run for memory"""
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = fn()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, current
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'content.json')
+        path = os.path.join(tmp, 'content.db')
+        content = generate(count)
+        with open(source, 'w', encoding='utf-8') as f:
+            json.dump(content, f)
+        del content
+        print(f"Generated {count} topics: source {os.path.getsize(source) / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        build_pack(read_source(source), path)
+        print(f"Build pack:              {time.perf_counter() - start:8.2f} s   {os.path.getsize(path) / 1e6:.1f} MB")
+
+        seconds, heap = measure(lambda: read_source(source))
+        print(f"In-process dicts:        {seconds * 1000:8.1f} ms  {heap / 1e6:7.1f} MB heap per worker")
+
+        seconds, heap = measure(lambda: ContentPack(path))
+        print(f"Open pack (catalog):     {seconds * 1000:8.1f} ms  {heap / 1e6:7.1f} MB heap per worker")
+
+        store = ContentStore(path, reload_interval=-1)
+
+        collections = {kind: ContentCollection(store, kind) for kind in KINDS}
+        rng = random.Random(1)
+        keys = [(kind, f"{kind}_{i}") for i in range(count) for kind in (KINDS[i % len(KINDS)],)]
+        sample = rng.sample(keys, min(len(keys), store.cache_size // 2))
+
+        start = time.perf_counter()
+        for kind, item_id in sample:
+            collections[kind][item_id]
+        cold = (time.perf_counter() - start) / len(sample) * 1e6
+        start = time.perf_counter()
+        for kind, item_id in sample:
+            collections[kind][item_id]
+        warm = (time.perf_counter() - start) / len(sample) * 1e6
+        print(f"Item lookup:             {cold:8.1f} µs cold, {warm:.1f} µs cached "
+              f"(LRU of {store.cache_size} bodies)")
+
+        content = read_source(source)
+        content['devotion']['devotion_0']['title'] = 'Revised title'
+        build_pack(content, path)
+        start = time.perf_counter()
+        reloaded = store.check_for_update()
+        print(f"Hot reload:              {(time.perf_counter() - start) * 1000:8.1f} ms  "
+              f"(swapped={reloaded}, version {store.pack().version})")
+
+if __name__ == '__main__':
+    main()
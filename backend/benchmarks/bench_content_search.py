@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /content/search latency over a large generated catalog
+
+Indexes N synthetic items across the four content types. It then times a
+mix of searches: keyword queries, prefix (search-as-you-type) queries,
+type/category filters, browsing without a query, and following cursors to
+later pages. Each search returns one page plus facet counts. Reports index
+build time and per-query latency percentiles.
+
+Usage: python3.11 benchmarks/bench_content_search.py [items]
+"""
+import os
+import random
+import sys
+import time
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.content_search import ContentSearchIndex
+
+KINDS = ('devotion', 'prayer', 'meditation', 'accountability')
+WORDS = ('grace faith hope love peace mercy strength trust rest light joy patience comfort '
+         'wisdom courage healing forgiveness prayer scripture spirit anxiety purpose').split()
+
+def generate(count, seed=0):
+    rng = random.Random(seed)
+    sentence = lambda n: ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+    collections = {kind: {} for kind in KINDS}
+    for i in range(count):
+        kind = KINDS[i % len(KINDS)]
+        collections[kind][f"{kind}_{i}"] = {
+            'title': f"{sentence(3)[:-1]} {i}",
+            'category': rng.choice(WORDS).title(),
+            'scripture': {'reference': 'Philippians 4:6-7', 'text': sentence(40)},
+            'prayer': sentence(40),
+            'reflection': sentence(80)
+        }
+    return collections
+
+def queries(count, seed=1):
+    rng = random.Random(seed)
+    mix = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.4:
+            mix.append({'query': ' '.join(rng.sample(WORDS, rng.randint(1, 3)))})
+        elif roll < 0.6:
+            mix.append({'query': rng.choice(WORDS)[:rng.randint(3, 5)]})
+        elif roll < 0.8:
+            mix.append({'query': rng.choice(WORDS), 'types': [rng.choice(KINDS)],
+                        'categories': [rng.choice(WORDS)]})
+        else:
+            mix.append({'types': [rng.choice(KINDS)]})
+    return mix
+
+def percentile(values, p):
+    return sorted(values)[min(len(values) - 1, int(len(values) * p))]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    collections = generate(count)
+
+    start = time.perf_counter()
+    index = ContentSearchIndex().build(collections)
+    print(f"Indexed {count} items in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    mix = queries(2000)
+    for params in mix[:100]:
+        index.search(**params)
+
+    latencies, pages = [], 0
+    for params in mix:
+        start = time.perf_counter()
+        page = index.search(**params)
+        latencies.append(time.perf_counter() - start)
+        if page['next_cursor']:
+            start = time.perf_counter()
+            index.search(cursor=page['next_cursor'], **params)
+            latencies.append(time.perf_counter() - start)
+            pages += 1
+    print(f"{len(latencies)} searches ({pages} next-page cursors), one page of 20 plus facets each:")
+    for label, p in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        print(f"  {label}: {percentile(latencies, p) * 1000:.3f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: fast-path intent classification for /chat
+
+Classifies a generated mix of chat messages (quick-response prompts,
+greetings, short topic messages, negated and long free-form questions) and
+reports messages per second, the per-message cost, and how many LLM calls the
+fast path would have avoided at the configured threshold.
+
+Usage: python3.11 benchmarks/bench_intent_router.py [messages]
+"""
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.routes.ai_chat import CURATED_CONTENT, QUICK_RESPONSES
+from src.services.intents import IntentRouter
+
+SHORT_MESSAGES = [
+    'hi', 'Hello!', 'good morning', 'thanks so much', 'I feel anxious', 'I am so stressed out',
+    "I'm afraid of the future", 'I need strength today', 'How do I pray?', 'I feel hopeless',
+    'Please pray for healing', 'I want to grow closer to God', 'I feel lost', 'Tell me about forgiveness',
+    'I am grateful today', 'My marriage is struggling',
+]
+
+OPEN_MESSAGES = [
+    'What does Romans 8 say about suffering?', 'Can you explain the parable of the prodigal son?',
+    'Who wrote the book of Hebrews?', "I'm not anxious anymore, just curious about Psalm 23",
+    'What is the difference between grace and mercy?', 'How should Christians think about money?',
+    'Why did Jesus speak in parables?', 'Is it okay to doubt sometimes?',
+]
+
+FILLER = ('yesterday at work my manager said something that really stuck with me and since then '
+          'I keep thinking about it late at night when everyone else is asleep').split()
+
+def sample_messages(count, seed=0):
+    """Mix of quick-response taps, short intents, open questions and long messages"""
+    rng = random.Random(seed)
+    quick = [q['prompt'] for q in QUICK_RESPONSES] + [q['text'] for q in QUICK_RESPONSES]
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.25:
+            messages.append(rng.choice(quick))
+        elif roll < 0.55:
+            messages.append(rng.choice(SHORT_MESSAGES))
+        elif roll < 0.85:
+            messages.append(rng.choice(OPEN_MESSAGES))
+        else:
+            words = rng.sample(FILLER, rng.randint(15, len(FILLER)))
+            messages.append(f"{rng.choice(SHORT_MESSAGES)} because {' '.join(words)}")
+    return messages
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    start = time.perf_counter()
+    router = IntentRouter().build(QUICK_RESPONSES, CURATED_CONTENT)
+    print(f"Build (compile automaton + render replies): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    messages = sample_messages(count)
+    for message in messages[:1000]:
+        router.classify(message)
+
+    start = time.perf_counter()
+    for message in messages:
+        router.route(message)
+    elapsed = time.perf_counter() - start
+    print(f"Classified {count} messages in {elapsed:.2f} s: "
+          f"{count / elapsed:,.0f} msg/s, {elapsed / count * 1e6:.2f} µs/message")
+
+    stats = router.stats()
+    print(f"Threshold {stats['threshold']}: {stats['served']} served from curated content, "
+          f"{stats['fell_through']} sent to the model ({stats['crisis']} for crisis language)")
+    print(f"LLM calls avoided: {stats['llm_calls_avoided']} ({stats['fast_path_rate']:.1%} of messages)")
+    for intent_id, served in Counter(stats['served_by_intent']).most_common():
+        print(f"  {intent_id:<14} {served:>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: reference parsing and verse lookups in the memory-mapped corpus
+
+Builds a synthetic corpus the size of a full Bible (~31k verses) in a
+temporary file, then times cold open, single-verse lookups and passage
+lookups against it, along with the bundled corpus.
+
+Usage: python3.11 benchmarks/bench_verse_lookup.py [iterations]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.verses import BOOKS, VerseCorpus, build_corpus, parse_reference, verse_corpus
+
+VERSES_PER_CHAPTER = 26  # ~31k verses over 1189 chapters, like a full Bible
+
+def synthetic_rows():
+    for name, chapters in BOOKS:
+        for chapter in range(1, chapters + 1):
+            for verse in range(1, VERSES_PER_CHAPTER + 1):
+                yield name, chapter, verse, f"Synthetic text of {name} {chapter}:{verse}, long enough to look like a real verse."
+
+def measure(label, fn, iterations):
+    for _ in range(100):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<34} {per_call_us:8.2f} µs/lookup")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'verses.bin')
+        count = build_corpus(synthetic_rows(), path)
+        print(f"Synthetic corpus: {count} verses, {os.path.getsize(path) / 1024:.0f} KiB")
+
+        corpus = VerseCorpus(path)
+        start = time.perf_counter()
+        corpus.verse(1, 1, 1)
+        print(f"{'cold open + first lookup':<34} {(time.perf_counter() - start) * 1e6:8.2f} µs")
+
+        rng = random.Random(0)
+        references = [parse_reference(f"{name} {rng.randint(1, chapters)}:{rng.randint(1, 20)}-{rng.randint(21, 26)}")
+                      for name, chapters in BOOKS]
+        singles = [(ref.book, ref.chapter, ref.start) for ref in references]
+
+        measure('parse "Philippians 4:6-7"', lambda: parse_reference('Philippians 4:6-7'), iterations)
+        measure('single verse (synthetic)', lambda: corpus.verse(*singles[rng.randrange(len(singles))]), iterations)
+        measure('passage (synthetic)', lambda: corpus.passage(references[rng.randrange(len(references))]), iterations)
+
+    reference = parse_reference('Philippians 4:6-7')
+    measure('passage (bundled corpus)', lambda: verse_corpus.passage(reference), iterations)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Load test for /api/chat, /api/chat/stream and /api/chat/scripture
+
+By default it starts the app in-process on a free port and uses the offline
+``fake`` provider, so it needs no network access or API keys. Latency is
+shaped with the FAKE_LLM_* environment variables. Each endpoint is driven at
+the target concurrency, and the script reports throughput plus p50/p95/p99
+latency (and time to first token for streams).
+
+Usage: python3.11 benchmarks/load_chat.py [--concurrency 16] [--requests 200]
+                                          [--endpoints chat,stream,scripture]
+                                          [--server flask|asgi] [--url URL]
+                                          [--provider fake] [--fail-p95-ms MS]
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the backend directory to the path so `src` is importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The fake provider is opt-in; enable it before the registry is imported
+os.environ.setdefault('FAKE_LLM_ENABLED', 'true')
+# Every load-test request comes from one address; measure the app, not the rate limiter
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+import requests
+
+from src.services.metrics import percentile
+
+_local = threading.local()
+
+def session():
+    """One pooled HTTP session per worker thread"""
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_up(base_url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/api/health", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+def start_server(kind):
+    """Serve the app from a background thread; returns its base URL"""
+    port = free_port()
+    if kind == 'asgi':
+        import uvicorn
+        from src.asgi import app
+        server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+        threading.Thread(target=server.run, daemon=True).start()
+    else:
+        from werkzeug.serving import make_server
+        from src.main import app
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = make_server('127.0.0.1', port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_up(base_url)
+    return base_url
+
+def call_chat(base_url, provider, i):
+    response = session().post(f"{base_url}/api/chat",
+                              json={'message': f'Load test message {i}', 'provider': provider}, timeout=60)
+    return response.status_code == 200, None
+
+def call_scripture(base_url, provider, i):
+    # Distinct topics so every request misses the scripture cache
+    response = session().post(f"{base_url}/api/chat/scripture",
+                              json={'topic': f'load test topic {i}', 'provider': provider}, timeout=60)
+    return response.status_code == 200 and 'verses' in response.json(), None
+
+def call_stream(base_url, provider, i):
+    start = time.perf_counter()
+    ttft = None
+    ok = False
+    with session().post(f"{base_url}/api/chat/stream",
+                        json={'message': f'Load test message {i}', 'provider': provider},
+                        stream=True, timeout=60) as response:
+        if response.status_code != 200:
+            return False, None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data: '):
+                continue
+            event = json.loads(line[len('data: '):])
+            if 'content' in event and ttft is None:
+                ttft = time.perf_counter() - start
+            if 'error' in event:
+                break
+            if event.get('done'):
+                ok = True
+                break
+    return ok, ttft
+
+ENDPOINTS = {
+    'chat': call_chat,
+    'stream': call_stream,
+    'scripture': call_scripture,
+}
+
+def run_endpoint(name, base_url, provider, total, concurrency):
+    """Drive one endpoint at the target concurrency and collect latencies"""
+    call = ENDPOINTS[name]
+    latencies = []
+    ttfts = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok, ttft = call(base_url, provider, i)
+        except requests.RequestException:
+            ok, ttft = False, None
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+                if ttft is not None:
+                    ttfts.append(ttft)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    return {
+        'endpoint': name,
+        'requests': total,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+        'ttft_p50_ms': _ms(percentile(ttfts, 50)),
+        'ttft_p95_ms': _ms(percentile(ttfts, 95)),
+    }
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+def print_report(results):
+    header = f"{'endpoint':<10} {'reqs':>5} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttft p50':>9} {'ttft p95':>9}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        cells = [r['p50_ms'], r['p95_ms'], r['p99_ms'], r['ttft_p50_ms'], r['ttft_p95_ms']]
+        p50, p95, p99, t50, t95 = ['-' if v is None else f"{v:.1f}" for v in cells]
+        print(f"{r['endpoint']:<10} {r['requests']:>5} {r['errors']:>5} {r['throughput_rps']:>8.1f} "
+              f"{p50:>8} {p95:>8} {p99:>8} {t50:>9} {t95:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--endpoints', default='chat,stream,scripture')
+    parser.add_argument('--server', choices=('flask', 'asgi'), default='flask',
+                        help='in-process server to start when --url is not given')
+    parser.add_argument('--url', help='benchmark an already running server instead')
+    parser.add_argument('--provider', default='fake')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--fail-p95-ms', type=float,
+                        help='exit non-zero on errors or if any endpoint p95 exceeds this (for CI)')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    base_url = args.url.rstrip('/') if args.url else start_server(args.server)
+    print(f"Load testing {base_url} with provider={args.provider}, "
+          f"concurrency={args.concurrency}, {args.requests} requests per endpoint...")
+
+    results = [run_endpoint(name, base_url, args.provider, args.requests, args.concurrency)
+               for name in endpoints]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    failed = [r for r in results if r['errors'] or (
+        args.fail_p95_ms is not None and (r['p95_ms'] or 0) > args.fail_p95_ms)]
+    if failed and args.fail_p95_ms is not None:
+        print(f"Regression: {', '.join(r['endpoint'] for r in failed)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+"""
+Async ASGI entry point for the DSCPL API.
+
+The AI chat endpoints are served natively with FastAPI and LangChain's
+``ainvoke``/``astream`` APIs, so a slow LLM round trip holds no thread.
+Concurrency has one cap, ADMISSION_MAX_INFLIGHT: the admission limiter
+enforces it per request, or, when rate limiting is off, a semaphore of the
+same size guards provider calls. Every other route is served by the existing Flask app,
+which is mounted underneath.
+
+Run with: uvicorn src.asgi:app --host 0.0.0.0 --port 5001
+"""
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.main import app as flask_app
+from src.routes.ai_chat import QUICK_RESPONSES, cache_scripture_guidance, curated_reply, resolve_provider
+from src.services.batch import BatchRequestError, arun_batch, ndjson_line, ordered_response, parse_batch, wants_ndjson
+from src.services.chains import SPIRITUAL_SYSTEM_PROMPT, call_config, get_chat_chain, get_scripture_chain
+from src.services.conversations import InvalidConversationId, conversations, legacy_context, usage_for
+from src.services.coalescing import async_inflight, make_key
+from src.services.scripture_cache import normalize_topic, scripture_cache
+from src.services.retrieval import topic_retriever
+from src.services.structured import aparse_guidance_stream, guidance_events, structured_stats
+from src.services.resilience import (CircuitOpenError, Deadline, DeadlineExceeded, acall_with_resilience,
+                                     aresilient_stream, get_breaker)
+from src.services.routing import HEDGE_REQUESTS, router
+from src.services.rate_limit import RateLimited, client_id, rate_limiter, request_cost
+from src.services.sse import FRAME_MAX_DELAY, HEARTBEAT_SECONDS, SSE_HEADERS, asse_events, asse_stream
+
+app = FastAPI(title='DSCPL Spiritual Companion API')
+
+# Bounds concurrent provider calls across all requests on this event loop
+_llm_slots = None
+
+
+def llm_slots():
+    """Semaphore guarding provider calls, created on the running loop"""
+    global _llm_slots
+    if _llm_slots is None:
+        _llm_slots = asyncio.BoundedSemaphore(rate_limiter.max_inflight)
+    return _llm_slots
+
+
+async def read_json(request):
+    """Request body as a JSON object, or None when it is missing, malformed or not an object"""
+    try:
+        data = await request.json()
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def provider_unavailable(e):
+    """Fast 503/504 response while a provider is down or out of time"""
+    if isinstance(e, CircuitOpenError):
+        return JSONResponse({
+            'error': str(e),
+            'provider': e.provider,
+            'retry_after': e.retry_after
+        }, status_code=503, headers={'Retry-After': str(e.retry_after)})
+    return JSONResponse({'error': str(e), 'provider': e.provider}, status_code=504)
+
+
+
+@app.middleware('http')
+async def limit_ai_requests(request: Request, call_next):
+    """Rate-limit AI requests per client and cap how many run at once"""
+    path = request.url.path
+    data = await read_json(request) if path.rstrip('/') == '/api/chat/batch' else None
+    cost = request_cost(request.method, path, data)
+    if cost is None or not rate_limiter.enabled:
+        return await call_next(request)
+
+    tokens, slots = cost
+    try:
+        await rate_limiter.acheck(client_id(request.headers, request.client.host if request.client else None), tokens)
+        slot = await rate_limiter.aadmit(slots)
+    except RateLimited as e:
+        return JSONResponse({'error': str(e), 'reason': e.reason, 'retry_after': e.retry_after},
+                            status_code=429, headers={'Retry-After': str(e.retry_after)})
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        await rate_limiter.arelease(slot)
+        raise
+
+    # Streamed responses keep their slot until the body has been sent
+    body = response.body_iterator
+
+    async def release_when_sent():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            await rate_limiter.arelease(slot)
+
+    response.body_iterator = release_when_sent()
+    return response
+
+@asynccontextmanager
+async def llm_slot(provider, deadline):
+    """Hold a provider slot for a whole call, retries included
+
+    Waiting for a slot counts against the request's deadline, but it is taken
+    before the breaker and the router see the call: running out of time in
+    the queue is local saturation, not a provider failure.
+    """
+    if rate_limiter.enabled:
+        # Admission already caps AI requests; a second, different cap would disagree with it
+        yield
+        return
+    slots = llm_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(provider, deadline.seconds)
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+async def astream_limited(provider, deadline, open_chunks):
+    """Stream ``open_chunks()`` while holding a provider slot"""
+    async with llm_slot(provider, deadline):
+        chunks = open_chunks()
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+
+async def ainvoke_chat(model_provider, variables, deadline=None):
+    """Invoke the chat chain on one provider, coalescing identical requests"""
+    chain = get_chat_chain(model_provider)
+    key = make_key('chat', model_provider, variables['context'], variables['message'])
+    deadline = deadline or Deadline()
+
+    def call(timeout):
+        return chain.ainvoke(variables, config=call_config(model_provider, timeout))
+
+    async def invoke():
+        async with llm_slot(model_provider, deadline):
+            return await router.aobserve(
+                model_provider, lambda: acall_with_resilience(model_provider, call, deadline))
+
+    return await async_inflight.do(key, invoke)
+
+
+def aopen_chat_stream(model_provider, variables, deadline=None):
+    """Subscribe to a chat stream on one provider, attaching to an identical one in progress"""
+    chain = get_chat_chain(model_provider)
+    key = make_key('chat', model_provider, variables['context'], variables['message'])
+
+    deadline = deadline or Deadline()
+
+    def open_upstream(timeout):
+        return chain.astream(variables, config=call_config(model_provider, timeout))
+
+    return async_inflight.stream(
+        key,
+        lambda: astream_limited(model_provider, deadline, lambda: router.aobserve_stream(
+            model_provider, aresilient_stream(model_provider, open_upstream, deadline))),
+        idle_timeout=FRAME_MAX_DELAY
+    )
+
+
+@app.post('/api/chat')
+async def chat(request: Request):
+    """Handle chat requests with AI spiritual guidance"""
+    try:
+        data = await read_json(request)
+
+        if not data or 'message' not in data:
+            return JSONResponse({'error': 'Message is required'}, status_code=400)
+
+        user_message = data['message']
+        provider = data.get('provider', 'gemini')
+        context = data.get('context', '')
+
+        conversation = conversations.resolve(data)
+        context_str = conversation.context_window() if conversation else legacy_context(context)
+        variables = {
+            "context": context_str,
+            "message": user_message
+        }
+
+        # Classification is a single pass over the message, cheap enough to run inline;
+        # enrichment may take an in-flight slot from a shared SQLite limiter, so not on the loop
+        if data.get('enrich'):
+            curated = await asyncio.to_thread(curated_reply, data, conversation, context_str, variables)
+        else:
+            curated = curated_reply(data, conversation, context_str, variables)
+        if curated:
+            return JSONResponse(curated)
+
+        deadline = Deadline.from_request(data)
+        if provider == 'auto':
+            response, provider = await router.ahedged(
+                lambda name: ainvoke_chat(name, variables, deadline),
+                hedge=bool(data.get('hedge', HEDGE_REQUESTS))
+            )
+        else:
+            response = await ainvoke_chat(resolve_provider(provider), variables, deadline)
+
+        usage = usage_for(SPIRITUAL_SYSTEM_PROMPT, context_str, user_message, response)
+        result = {
+            'response': response.content,
+            'provider': provider,
+            'timestamp': str(int(os.times().elapsed * 1000)),
+            'usage': usage
+        }
+        if conversation:
+            conversation.record(user_message, response.content, usage['prompt_tokens'])
+            result['conversation_id'] = conversation.id
+
+        return JSONResponse(result)
+
+    except InvalidConversationId as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        return provider_unavailable(e)
+    except Exception as e:
+        print(f"Error in chat endpoint: {str(e)}")
+        return JSONResponse({
+            'error': 'An error occurred while processing your request',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.post('/api/chat/stream')
+async def chat_stream(request: Request):
+    """Handle streaming chat requests for real-time responses"""
+    try:
+        data = await read_json(request)
+
+        if not data or 'message' not in data:
+            return JSONResponse({'error': 'Message is required'}, status_code=400)
+
+        user_message = data['message']
+        provider = data.get('provider', 'gemini')
+        context = data.get('context', '')
+
+        conversation = conversations.resolve(data)
+        context_str = conversation.context_window() if conversation else legacy_context(context)
+        variables = {
+            "context": context_str,
+            "message": user_message
+        }
+
+        on_complete = None
+        if conversation:
+            usage = usage_for(SPIRITUAL_SYSTEM_PROMPT, context_str, user_message)
+            on_complete = lambda reply: conversation.record(user_message, reply, usage['prompt_tokens'])
+
+        deadline = Deadline.from_request(data)
+        if provider == 'auto':
+            model_provider = None
+            chunks = router.ahedged_stream(
+                lambda name: aopen_chat_stream(name, variables, deadline),
+                hedge=bool(data.get('hedge', HEDGE_REQUESTS))
+            )
+        else:
+            model_provider = resolve_provider(provider)
+            get_breaker(model_provider).check()
+            chunks = aopen_chat_stream(model_provider, variables, deadline)
+
+        headers = dict(SSE_HEADERS)
+        if conversation:
+            headers['X-Conversation-Id'] = conversation.id
+
+        return StreamingResponse(
+            asse_stream(chunks, provider, metrics_provider=model_provider, on_complete=on_complete),
+            media_type='text/event-stream',
+            headers=headers
+        )
+
+    except InvalidConversationId as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except CircuitOpenError as e:
+        return provider_unavailable(e)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@app.post('/api/chat/batch')
+async def chat_batch(request: Request):
+    """Answer many chat messages concurrently, each with its own provider and context"""
+    data = await read_json(request)
+    try:
+        items, max_concurrency = parse_batch(data)
+    except BatchRequestError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    if wants_ndjson(data, request.headers.get('accept')):
+        async def lines():
+            async for _, result in arun_batch(items, max_concurrency):
+                yield ndjson_line(result)
+
+        return StreamingResponse(lines(), media_type='application/x-ndjson',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    try:
+        pairs = [pair async for pair in arun_batch(items, max_concurrency)]
+        return JSONResponse(ordered_response(pairs, len(items)))
+    except Exception as e:
+        print(f"Error in batch chat endpoint: {str(e)}")
+        return JSONResponse({
+            'error': 'An error occurred while processing your request',
+            'details': str(e)
+        }, status_code=500)
+
+
+@app.get('/api/chat/quick-responses')
+async def get_quick_responses():
+    """Get predefined quick response options for spiritual guidance"""
+    return JSONResponse({'quick_responses': QUICK_RESPONSES})
+
+
+def aopen_scripture_stream(provider, topic, deadline=None, idle_timeout=None):
+    """Async counterpart of ai_chat.open_scripture_stream"""
+    chain = get_scripture_chain(provider)
+    key = make_key('scripture', provider, normalize_topic(topic))
+
+    deadline = deadline or Deadline()
+
+    def open_upstream(timeout):
+        return chain.astream({"topic": topic}, config=call_config(provider, timeout))
+
+    return async_inflight.stream(
+        key,
+        lambda: astream_limited(provider, deadline, lambda: aresilient_stream(provider, open_upstream, deadline)),
+        idle_timeout=idle_timeout
+    )
+
+
+async def agenerate_scripture_guidance(topic, deadline=None, provider='gemini'):
+    """Async counterpart of ai_chat.generate_scripture_guidance"""
+    chain = get_scripture_chain(provider)
+    deadline = deadline or Deadline()
+    chunks = astream_limited(provider, deadline, lambda: aresilient_stream(
+        provider,
+        lambda timeout: chain.astream({"topic": topic}, config=call_config(provider, timeout)),
+        deadline
+    ))
+    guidance = None
+    async for event in aparse_guidance_stream(topic, chunks, structured_stats, cache_scripture_guidance(topic)):
+        if event[0] == 'guidance':
+            guidance = event[1]
+    return guidance
+
+
+@app.post('/api/chat/scripture')
+async def get_scripture_guidance(request: Request):
+    """Get scripture-based guidance for specific topics"""
+    try:
+        data = await read_json(request)
+        topic = (data or {}).get('topic', '')
+
+        if not topic or not isinstance(topic, str):
+            return JSONResponse({'error': 'Topic is required'}, status_code=400)
+
+        retrieval = None
+        if data.get('retrieval', True):
+            curated, retrieval = topic_retriever.answer(topic)
+            if curated is not None:
+                return JSONResponse(curated)
+
+        cached = await asyncio.to_thread(scripture_cache.get, topic)
+        if cached is not None:
+            cached['topic'] = topic
+            return JSONResponse(cached)
+
+        provider = resolve_provider(data.get('provider', 'gemini'))
+        key = make_key('scripture', provider, normalize_topic(topic))
+        deadline = Deadline.from_request(data)
+        guidance = await async_inflight.do(key, lambda: agenerate_scripture_guidance(topic, deadline, provider))
+        if retrieval is not None:
+            guidance = dict(guidance, retrieval=retrieval)
+
+        return JSONResponse(guidance)
+
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        return provider_unavailable(e)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@app.post('/api/chat/scripture/stream')
+async def stream_scripture_guidance(request: Request):
+    """Stream scripture guidance, sending each verse as soon as it is complete"""
+    try:
+        data = await read_json(request)
+        topic = (data or {}).get('topic', '')
+
+        if not topic or not isinstance(topic, str):
+            return JSONResponse({'error': 'Topic is required'}, status_code=400)
+
+        curated = None
+        if data.get('retrieval', True):
+            curated, _ = topic_retriever.answer(topic)
+        cached = await asyncio.to_thread(scripture_cache.get, topic) if curated is None else None
+        if curated is not None:
+            events = _aiter(guidance_events(curated, 'retrieved'))
+        elif cached is not None:
+            cached['topic'] = topic
+            events = _aiter(guidance_events(cached))
+        else:
+            provider = resolve_provider(data.get('provider', 'gemini'))
+            get_breaker(provider).check()
+            chunks = aopen_scripture_stream(provider, topic, Deadline.from_request(data),
+                                            idle_timeout=HEARTBEAT_SECONDS)
+            events = aparse_guidance_stream(topic, chunks, structured_stats, cache_scripture_guidance(topic))
+
+        return StreamingResponse(asse_events(events), media_type='text/event-stream', headers=SSE_HEADERS)
+
+    except CircuitOpenError as e:
+        return provider_unavailable(e)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+# Everything else (health, content, calendar, stats) is served by Flask
+app.mount('/', WSGIMiddleware(flask_app))
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 5001))
+    print(f"Starting ASGI app on port {port}")
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -1,17 +1,59 @@
 import os
 import sys
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 
 # Add the src directory to the path
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from src.routes.ai_chat import ai_chat_bp
+from src.routes.spiritual_programs import spiritual_programs_bp
+from src.routes.calendar_integration import calendar_bp
+from src.routes.scripture import scripture_bp
+from src.services.rate_limit import RateLimited, client_id, rate_limiter, request_cost
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
 
 # Enable CORS for all routes
 CORS(app, origins=['*'])
 
+# Register API blueprints
+app.register_blueprint(ai_chat_bp, url_prefix='/api')
+app.register_blueprint(spiritual_programs_bp, url_prefix='/api')
+app.register_blueprint(calendar_bp, url_prefix='/api/calendar')
+app.register_blueprint(scripture_bp, url_prefix='/api')
+
+# Rate-limit AI requests per client and cap how many run at once
+@app.before_request
+def limit_ai_requests():
+    cost = request_cost(request.method, request.path, request.get_json(silent=True))
+    if cost is None or not rate_limiter.enabled:
+        return None
+    tokens, slots = cost
+    try:
+        rate_limiter.check(client_id(request.headers, request.remote_addr), tokens)
+        g.llm_slot = rate_limiter.admit(slots)
+    except RateLimited as e:
+        response = jsonify({'error': str(e), 'reason': e.reason, 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    return None
+
+@app.after_request
+def release_llm_slot(response):
+    # Streamed responses keep their slot until the body has been sent
+    slot = g.pop('llm_slot', None)
+    if slot is not None:
+        response.call_on_close(lambda: rate_limiter.release(slot))
+    return response
+
+@app.teardown_request
+def release_llm_slot_on_error(error):
+    slot = g.pop('llm_slot', None)
+    if slot is not None:
+        rate_limiter.release(slot)
+
 # Health check endpoint for Railway
 @app.route('/api/health')
 def health_check():
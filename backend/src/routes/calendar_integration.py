@@ -1,9 +1,15 @@
 from flask import Blueprint, request, jsonify, session, redirect, url_for
 import json
 import os
+import uuid
 from datetime import datetime, timedelta
 import requests
 
+from src.services.calendar_sync import calendar_sync, content_hash
+from src.services.google_calendar import GOOGLE_CALENDAR_ENABLED, CalendarClient, CalendarError, metrics
+from src.services.google_calendar import event_id as calendar_event_id
+from src.services.recurrence import Recurrence, RecurrenceError, expand_requested, expansion_window
+
 calendar_bp = Blueprint('calendar', __name__)
 
 # Google Calendar API configuration
@@ -54,6 +60,8 @@ def google_callback():
         session['google_access_token'] = access_token
         session['google_refresh_token'] = refresh_token
         session['calendar_connected'] = True
+        # Sync state belongs to this connection, never to an id the client sends
+        session['calendar_sync_id'] = uuid.uuid4().hex
         
         return jsonify({
             'message': 'Google Calendar connected successfully',
@@ -71,17 +79,24 @@ def calendar_status():
     
     return jsonify({
         'connected': connected,
-        'provider': 'google_calendar' if connected else None
+        'provider': 'google_calendar' if connected else None,
+        'live': GOOGLE_CALENDAR_ENABLED,
+        'client': metrics.summary()
     })
 
 @calendar_bp.route('/disconnect', methods=['POST'])
 def disconnect_calendar():
     """Disconnect Google Calendar"""
     try:
+        # A reconnected calendar may be a different account, so its next sync starts over
+        if session.get('calendar_sync_id'):
+            calendar_sync.store.forget(session['calendar_sync_id'])
+        
         # Clear session data
         session.pop('google_access_token', None)
         session.pop('google_refresh_token', None)
         session.pop('calendar_connected', None)
+        session.pop('calendar_sync_id', None)
         
         return jsonify({
             'message': 'Google Calendar disconnected successfully',
@@ -91,6 +106,52 @@ def disconnect_calendar():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def calendar_client():
+    """Google Calendar client for the connected user's access token"""
+    return CalendarClient(session.get('google_access_token'))
+
+def sync_owner():
+    """Key for the connected calendar's sync state, kept in the (signed) session"""
+    if 'calendar_sync_id' not in session:
+        session['calendar_sync_id'] = uuid.uuid4().hex
+    return session['calendar_sync_id']
+
+def program_event(program_type, title, start_date, time_str, duration_days, timezone):
+    """One recurring Google event for a whole program, and its recurrence
+
+    Google expands the rule itself, so the request size does not grow with the
+    number of days. The event id is derived from the program, so creating the
+    same program again (or retrying) never duplicates it.
+    """
+    recurrence = Recurrence.daily(start_date.date().isoformat(), time_str, duration_days,
+                                  duration=30, timezone=timezone)
+    event_datetime = recurrence.start
+    
+    event_data = {
+        'id': calendar_event_id('dscpl', program_type, title, recurrence.start.isoformat(), recurrence.rrule()),
+        'summary': f"{program_type.title()}: {title}",
+        'description': f"Daily {program_type} session - {title}\n\nGenerated by DSCPL AI Spiritual Companion",
+        'start': {
+            'dateTime': event_datetime.isoformat(),
+            'timeZone': timezone
+        },
+        'end': {
+            'dateTime': (event_datetime + timedelta(minutes=recurrence.duration)).isoformat(),
+            'timeZone': timezone
+        },
+        'recurrence': [f"RRULE:{recurrence.rrule()}"],
+        # Explicit, so that rewriting an event the user deleted restores it
+        'status': 'confirmed',
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'popup', 'minutes': 10},
+                {'method': 'email', 'minutes': 60}
+            ]
+        }
+    }
+    return event_data, recurrence
+
 @calendar_bp.route('/events', methods=['POST'])
 def create_calendar_events():
     """Create calendar events for spiritual programs"""
@@ -110,63 +171,59 @@ def create_calendar_events():
         start_date = datetime.fromisoformat(data['start_date'])
         time_str = data['time']  # Format: "HH:MM"
         duration_days = int(data['duration_days'])
-        
-        # Parse time
-        hour, minute = map(int, time_str.split(':'))
-        
-        events_created = []
-        
-        # Create daily events for the specified duration
-        for i in range(duration_days):
-            event_date = start_date + timedelta(days=i)
-            event_datetime = event_date.replace(hour=hour, minute=minute)
-            
-            event_data = {
-                'summary': f"{program_type.title()}: {title}",
-                'description': f"Daily {program_type} session - {title}\n\nGenerated by DSCPL AI Spiritual Companion",
-                'start': {
-                    'dateTime': event_datetime.isoformat(),
-                    'timeZone': 'America/New_York'  # Default timezone
-                },
-                'end': {
-                    'dateTime': (event_datetime + timedelta(minutes=30)).isoformat(),
-                    'timeZone': 'America/New_York'
-                },
-                'reminders': {
-                    'useDefault': False,
-                    'overrides': [
-                        {'method': 'popup', 'minutes': 10},
-                        {'method': 'email', 'minutes': 60}
-                    ]
-                }
-            }
-            
-            # In a real implementation, you would make an API call to Google Calendar
-            # For this demo, we'll simulate event creation
-            event_id = f"dscpl_event_{program_type}_{i}_{int(datetime.now().timestamp())}"
-            
-            created_event = {
-                'id': event_id,
-                'title': event_data['summary'],
-                'date': event_date.date().isoformat(),
-                'time': time_str,
-                'created': True,
-                'calendar_id': 'primary'
-            }
-            
-            events_created.append(created_event)
-        
-        return jsonify({
-            'message': f'Successfully created {len(events_created)} calendar events',
-            'events': events_created,
+        timezone = data.get('timezone', 'America/New_York')  # Default timezone
+        
+        event_data, recurrence = program_event(program_type, title, start_date, time_str, duration_days, timezone)
+        
+        if GOOGLE_CALENDAR_ENABLED:
+            result = calendar_client().insert_events('primary', [event_data])[0]
+            if not result['ok']:
+                return jsonify({'error': f"Google Calendar rejected the event: {result['error']}"}), 502
+        # Without the integration enabled, event creation is simulated
+        event_id = event_data['id']
+        
+        created_event = {
+            'id': event_id,
+            'title': event_data['summary'],
+            'recurrence': recurrence.to_dict(),
+            'occurrences': len(recurrence),
+            'created': True,
+            'calendar_id': 'primary'
+        }
+        
+        response = {
+            'message': f'Successfully created a recurring calendar event with {len(recurrence)} occurrences',
+            'event': created_event,
             'program': {
                 'type': program_type,
                 'title': title,
                 'duration_days': duration_days,
                 'start_date': start_date.date().isoformat()
             }
-        })
+        }
+        
+        # Instances for one window (as Google names them), unless the client only wants the rule
+        if expand_requested(request.args, data):
+            window_start, window_end = expansion_window(recurrence, data.get('window_start'), data.get('window_end'))
+            response['events'] = [
+                {
+                    'id': f"{event_id}_{occurrence.strftime('%Y%m%dT%H%M%S')}",
+                    'recurring_event_id': event_id,
+                    'title': event_data['summary'],
+                    'date': occurrence.date().isoformat(),
+                    'time': time_str,
+                    'created': True,
+                    'calendar_id': 'primary'
+                }
+                for occurrence in recurrence.occurrences(window_start, window_end)
+            ]
         
+        return jsonify(response)
+        
+    except RecurrenceError as e:
+        return jsonify({'error': str(e)}), 400
+    except CalendarError as e:
+        return jsonify({'error': str(e)}), e.status_code or 502
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -220,56 +277,98 @@ def delete_calendar_event(event_id):
         if not session.get('calendar_connected'):
             return jsonify({'error': 'Google Calendar not connected'}), 401
         
-        # In a real implementation, delete from Google Calendar
-        # For this demo, simulate deletion
+        if GOOGLE_CALENDAR_ENABLED:
+            result = calendar_client().delete_events('primary', [event_id])[0]
+            if not result['ok']:
+                return jsonify({'error': f"Google Calendar could not delete the event: {result['error']}"}), 502
         
         return jsonify({
             'message': f'Event {event_id} deleted successfully',
             'deleted': True
         })
         
+    except CalendarError as e:
+        return jsonify({'error': str(e)}), e.status_code or 502
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @calendar_bp.route('/sync', methods=['POST'])
 def sync_calendar():
-    """Sync spiritual programs with Google Calendar"""
+    """Sync spiritual programs with Google Calendar, sending only what changed"""
     try:
         if not session.get('calendar_connected'):
             return jsonify({'error': 'Google Calendar not connected'}), 401
         
         data = request.get_json()
         programs = data.get('programs', [])
+        timezone = data.get('timezone', 'America/New_York')
+        # Programs missing from the list are removed from the calendar unless prune is off
+        prune = str(data.get('prune', True)).lower() not in ('false', '0', 'no')
         
-        synced_programs = []
+        # Programs are keyed by id (or type and title), so an edited program updates its event
+        desired = {}
+        for program in programs:
+            key = str(program.get('id') or f"{program['type']}:{program['title']}")
+            fields = {name: program[name] for name in ('type', 'title', 'start_date', 'time', 'duration_days')}
+            desired[key] = (
+                content_hash(dict(fields, timezone=timezone)),
+                lambda program=program: program_event(
+                    program['type'], program['title'], datetime.fromisoformat(program['start_date']),
+                    program['time'], int(program['duration_days']), timezone)[0]
+            )
+        
+        # Without the integration enabled, calendar calls are simulated
+        client = calendar_client() if GOOGLE_CALENDAR_ENABLED else None
+        results, summary = calendar_sync.sync(sync_owner(), desired, client, prune=prune)
         
+        synced_programs = []
         for program in programs:
-            # Create calendar events for each program
-            events_data = {
-                'program_type': program['type'],
-                'title': program['title'],
-                'start_date': program['start_date'],
-                'time': program['time'],
-                'duration_days': program['duration_days']
-            }
-            
-            # Simulate event creation (in real implementation, call create_calendar_events)
+            key = str(program.get('id') or f"{program['type']}:{program['title']}")
+            result = results[key]
             synced_program = {
                 'id': program.get('id'),
                 'type': program['type'],
                 'title': program['title'],
-                'events_created': int(program['duration_days']),
-                'sync_status': 'success'
+                'event_id': result['event_id'],
+                'action': result['action'],
+                # One recurring event per program
+                'events_created': 1 if result['action'] == 'created' and result['ok'] else 0,
+                'occurrences': int(program['duration_days']),
+                'sync_status': 'success' if result['ok'] else 'failed'
             }
+            if not result['ok']:
+                synced_program['error'] = result['error']
             
             synced_programs.append(synced_program)
         
+        removed_programs = []
+        for key, result in results.items():
+            if result['action'] != 'deleted':
+                continue
+            removed_program = {
+                'id': key,
+                'event_id': result['event_id'],
+                'sync_status': 'success' if result['ok'] else 'failed'
+            }
+            if not result['ok']:
+                removed_program['error'] = result['error']
+            removed_programs.append(removed_program)
+        
+        synced = sum(1 for program in synced_programs if program['sync_status'] == 'success')
         return jsonify({
-            'message': f'Successfully synced {len(synced_programs)} programs',
+            'message': f'Successfully synced {synced} of {len(synced_programs)} programs '
+                       f"({summary['created']} created, {summary['updated']} updated, "
+                       f"{summary['deleted']} removed, {summary['unchanged']} unchanged)",
             'synced_programs': synced_programs,
+            'removed_programs': removed_programs,
+            'sync': summary,
             'sync_timestamp': datetime.now().isoformat()
         })
         
+    except RecurrenceError as e:
+        return jsonify({'error': str(e)}), 400
+    except CalendarError as e:
+        return jsonify({'error': str(e)}), e.status_code or 502
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,29 @@
+from flask import Blueprint, jsonify
+from src.services.verses import InvalidReference, parse_reference, verse_corpus
+
+scripture_bp = Blueprint('scripture', __name__)
+
+@scripture_bp.route('/scripture/<path:reference>', methods=['GET'])
+def get_scripture(reference):
+    """Look up a passage such as "Philippians 4:6-7" in the bundled verse corpus"""
+    try:
+        parsed = parse_reference(reference)
+    except InvalidReference as e:
+        return jsonify({'error': str(e), 'reference': reference}), 400
+    
+    verses = verse_corpus.passage(parsed)
+    if not verses:
+        return jsonify({'error': 'Passage not found in the verse corpus', 'reference': parsed.label}), 404
+    
+    result = {
+        'reference': parsed.label,
+        'book': parsed.book_name,
+        'chapter': parsed.chapter,
+        'verses': [{'verse': number, 'text': text} for number, text in verses],
+        'text': ' '.join(text for _, text in verses)
+    }
+    if parsed.start is not None:
+        # False when the corpus holds only part of the requested range
+        result['complete'] = len(verses) == parsed.end - parsed.start + 1
+    
+    return jsonify(result)
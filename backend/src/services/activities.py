@@ -0,0 +1,373 @@
+"""
+Durable write-behind store for completed spiritual activities.
+
+POST /complete only validates the activity and appends it to an in-memory
+queue; it never waits on the disk. A background writer drains the queue and
+inserts everything waiting into SQLite in a single transaction (group
+commit). One fsync therefore covers the whole batch. While a commit is in
+progress new completions accumulate, so batches grow under load instead of
+the fsync rate becoming the limit.
+
+Activity ids are idempotency keys, scoped to the user: two users may send
+the same id. A client retry with the same user and id gets the original
+record back, from a bounded in-memory table of recent ids or, for ids that
+have left it (or were saved before a restart), from the database. The
+table's primary key, (user_id, id), drops any duplicate that still reaches
+the database.
+
+Other stores can hook into the writer with ``on_write``. Their ``stage``
+function runs inside the same transaction and receives only the activities
+that were actually inserted, so derived data such as progress counters is
+never applied twice. Their ``committed`` function runs after the commit.
+
+The queue is bounded by ACTIVITY_QUEUE_MAX. When it is full, completions are
+refused with QueueFull rather than letting memory grow without limit.
+Commits that fail because the database is locked or busy are retried with
+backoff. If a batch fails for any other reason, its activities are written
+one by one. Any activity that still fails is moved to the
+``activities_rejected`` table rather than stalling the writer. If the
+database cannot be opened, the writer keeps retrying with backoff, and a
+writer thread that died is restarted by the next completion. ``close()``
+runs at interpreter exit and flushes whatever is still queued.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from src.services.metrics import LatencyWindow, _ms
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+ACTIVITY_DB = os.getenv('ACTIVITY_DB') or os.path.join(DATA_DIR, 'activities.db')
+ACTIVITY_QUEUE_MAX = int(os.getenv('ACTIVITY_QUEUE_MAX', 100000))
+ACTIVITY_BATCH_MAX = int(os.getenv('ACTIVITY_BATCH_MAX', 1000))
+# How long the writer lingers for more completions before committing a batch
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_FLUSH_INTERVAL', 0.005))
+# FULL fsyncs every group commit; NORMAL may lose the last commits on power loss
+ACTIVITY_SYNCHRONOUS = os.getenv('ACTIVITY_SYNCHRONOUS', 'FULL').upper()
+ACTIVITY_RECENT_IDS = int(os.getenv('ACTIVITY_RECENT_IDS', 100000))
+
+ACTIVITIES_TABLE = (
+    'CREATE TABLE IF NOT EXISTS activities ('
+    'id TEXT NOT NULL, user_id TEXT NOT NULL, type TEXT NOT NULL, topic_id TEXT NOT NULL, '
+    'timestamp TEXT NOT NULL, duration REAL, body TEXT NOT NULL, PRIMARY KEY (user_id, id))'
+)
+
+# Longest wait between retries of a failed commit
+MAX_RETRY_SECONDS = 5.0
+
+
+def is_transient(error):
+    """Whether a failed commit may succeed if repeated (the database was locked or busy)"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+class QueueFull(Exception):
+    """Raised when the write-behind queue cannot take another activity"""
+
+
+class ActivityStore:
+    """Write-behind queue and background group-commit writer for activities"""
+
+    def __init__(self, db_path=ACTIVITY_DB, queue_max=ACTIVITY_QUEUE_MAX, batch_max=ACTIVITY_BATCH_MAX,
+                 flush_interval=ACTIVITY_FLUSH_INTERVAL, synchronous=ACTIVITY_SYNCHRONOUS,
+                 recent_ids=ACTIVITY_RECENT_IDS):
+        self.db_path = db_path
+        self.queue_max = queue_max
+        self.batch_max = batch_max
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.recent_ids = recent_ids
+        self._queue = deque()
+        self._recent = OrderedDict()
+        self._pending_users = {}
+        self._hooks = []
+        self._cond = threading.Condition()
+        self._writer = None
+        self._pid = None
+        # Read-only lookups of ids that are no longer in _recent; (pid, connection)
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        self._closed = False
+        # Sequence numbers: activities accepted, and activities committed (or dropped as duplicates)
+        self._accepted = 0
+        self._committed = 0
+        self._flush_latency = LatencyWindow()
+        self._stats = {'accepted': 0, 'duplicates': 0, 'rejected': 0, 'written': 0,
+                       'ignored_in_db': 0, 'rejected_in_db': 0, 'batches': 0, 'errors': 0, 'max_batch': 0}
+
+    def record(self, activity):
+        """Queue ``activity`` for writing; returns ``(activity, duplicate)``
+
+        A duplicate id returns the activity stored first and queues nothing.
+        """
+        self._ensure_writer()
+        key = (activity.get('user_id', ''), activity['id'])
+        with self._cond:
+            existing = self._recent.get(key)
+            if existing is not None:
+                self._recent.move_to_end(key)
+                self._stats['duplicates'] += 1
+                return existing, True
+        # Not seen recently: it may still have been saved earlier, or before a restart
+        stored = self._stored(key)
+        with self._cond:
+            existing = self._recent.get(key) or stored
+            if existing is not None:
+                self._remember(key, existing)
+                self._stats['duplicates'] += 1
+                return existing, True
+            if self._closed or len(self._queue) >= self.queue_max:
+                self._stats['rejected'] += 1
+                raise QueueFull('Too many completions waiting to be saved; please retry')
+            self._remember(key, activity)
+            self._queue.append(activity)
+            user_id = activity.get('user_id', '')
+            self._pending_users[user_id] = self._pending_users.get(user_id, 0) + 1
+            self._accepted += 1
+            self._stats['accepted'] += 1
+            # Wake the writer when work appears or a full batch is ready, not on every record
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_max:
+                self._cond.notify_all()
+        return activity, False
+
+    def _remember(self, key, activity):
+        # Expects self._cond to be held
+        self._recent[key] = activity
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.recent_ids:
+            self._recent.popitem(last=False)
+
+    def _stored(self, key):
+        """The saved activity for ``(user_id, id)``, or None"""
+        with self._reader_lock:
+            if self._reader is None or self._reader[0] != os.getpid():
+                self._reader = (os.getpid(), self._connect())
+            row = self._reader[1].execute('SELECT body FROM activities WHERE user_id = ? AND id = ?', key).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is committed; returns whether it was"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._accepted
+            while self._committed < target:
+                if self._writer is None or not self._writer.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def pending_for(self, user_id):
+        """Activities of one user accepted by this process but not yet committed"""
+        with self._cond:
+            return self._pending_users.get(user_id, 0)
+
+    def on_write(self, stage, committed=None):
+        """Run ``stage(db, inserted)`` in every write transaction and ``committed()`` after it"""
+        self._hooks.append((stage, committed))
+        return stage
+
+    def close(self, timeout=10.0):
+        """Flush queued activities and stop the writer (run at exit)"""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None and writer.is_alive():
+            writer.join(timeout)
+        return flushed
+
+    def stats(self):
+        """Queue depth, throughput counters and commit latency"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._queue)
+            stats['pending'] = self._accepted - self._committed
+            committed = self._committed
+        stats['avg_batch'] = round(committed / stats['batches'], 1) if stats['batches'] else 0.0
+        stats['flush_p50_ms'] = _ms(self._flush_latency.percentile(50))
+        stats['flush_p95_ms'] = _ms(self._flush_latency.percentile(95))
+        stats['flush_p99_ms'] = _ms(self._flush_latency.percentile(99))
+        stats['queue_max'] = self.queue_max
+        stats['synchronous'] = self.synchronous
+        stats['db_path'] = self.db_path
+        return stats
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(f'PRAGMA synchronous={self.synchronous}')
+        db.execute(ACTIVITIES_TABLE)
+        primary_key = [column[1] for column in db.execute('PRAGMA table_info(activities)') if column[5]]
+        if primary_key == ['id']:
+            self._scope_ids_per_user(db)
+        db.execute('CREATE INDEX IF NOT EXISTS activities_user ON activities (user_id, timestamp)')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS activities_rejected ('
+            'id TEXT, user_id TEXT, body TEXT NOT NULL, error TEXT NOT NULL, rejected_at REAL NOT NULL)'
+        )
+        return db
+
+    @staticmethod
+    def _scope_ids_per_user(db):
+        """Move a table keyed by id alone to the (user_id, id) key"""
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            primary_key = [column[1] for column in db.execute('PRAGMA table_info(activities)') if column[5]]
+            if primary_key == ['id']:  # Not migrated by another process meanwhile
+                db.execute('ALTER TABLE activities RENAME TO activities_unscoped')
+                db.execute(ACTIVITIES_TABLE)
+                db.execute('INSERT INTO activities SELECT id, user_id, type, topic_id, timestamp, duration, body '
+                           'FROM activities_unscoped')
+                db.execute('DROP TABLE activities_unscoped')
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def _ensure_writer(self):
+        # A forked worker inherits the queue but not the writer thread
+        if self._pid == os.getpid() and self._writer is not None and self._writer.is_alive():
+            return
+        with self._cond:
+            if self._pid != os.getpid() or self._writer is None:
+                self._pid = os.getpid()
+                self._queue.clear()
+                self._pending_users.clear()
+                self._accepted = self._committed = 0
+            elif self._writer.is_alive() or self._closed:
+                return
+            else:
+                # The writer died on an unexpected error; what is still queued is picked up again
+                self._stats['errors'] += 1
+                print('Activity writer stopped unexpectedly; restarting it')
+            self._writer = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+            self._writer.start()
+
+    def _next_batch(self):
+        """Block for the next batch; None once closed and drained"""
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            if len(self._queue) < self.batch_max and self.flush_interval > 0 and not self._closed:
+                # Linger briefly so completions arriving together share one commit
+                self._cond.wait(self.flush_interval)
+            count = min(len(self._queue), self.batch_max)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        delay = 0.05
+        while True:
+            try:
+                db = self._connect()
+                break
+            except Exception as e:
+                with self._cond:
+                    self._stats['errors'] += 1
+                    if self._closed:
+                        return
+                print(f"Cannot open the activity database, retrying in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._write(db, batch)
+        finally:
+            db.close()
+
+    def _write(self, db, batch):
+        started = time.perf_counter()
+        try:
+            inserted = self._commit(db, batch)
+        except Exception as e:
+            # Something in the batch fails every time; save the rest one by one
+            print(f"Error saving {len(batch)} activities, writing them separately: {str(e)}")
+            inserted = []
+            for activity in batch:
+                try:
+                    inserted += self._commit(db, [activity])
+                except Exception as e:
+                    self._reject(db, activity, e)
+        self._flush_latency.add(time.perf_counter() - started)
+        with self._cond:
+            self._committed += len(batch)
+            self._stats['written'] += len(inserted)
+            self._stats['ignored_in_db'] += len(batch) - len(inserted)
+            self._stats['batches'] += 1
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+            for activity in batch:
+                user_id = activity.get('user_id', '')
+                left = self._pending_users.get(user_id, 0) - 1
+                if left > 0:
+                    self._pending_users[user_id] = left
+                else:
+                    self._pending_users.pop(user_id, None)
+            self._cond.notify_all()
+
+    def _commit(self, db, batch):
+        """Insert ``batch`` in one transaction; returns the activities actually inserted
+
+        Only a locked or busy database is retried (with backoff). Any other error
+        is raised, since repeating the same rows would fail the same way.
+        """
+        delay = 0.05
+        while True:
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                inserted = []
+                for activity in batch:
+                    cursor = db.execute(
+                        'INSERT OR IGNORE INTO activities (id, user_id, type, topic_id, timestamp, duration, body) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (activity['id'], activity.get('user_id', ''), activity['type'], str(activity['topic_id']),
+                         activity['timestamp'], activity.get('duration'), json.dumps(activity))
+                    )
+                    if cursor.rowcount:
+                        inserted.append(activity)
+                for stage, _ in self._hooks:
+                    stage(db, inserted)
+                db.execute('COMMIT')
+                break
+            except Exception as e:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+                with self._cond:
+                    self._stats['errors'] += 1
+                if not is_transient(e):
+                    raise
+                print(f"Error saving {len(batch)} activities, retrying in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+        for _, committed in self._hooks:
+            if committed is not None:
+                committed()
+        return inserted
+
+    def _reject(self, db, activity, error):
+        """Keep an activity that can never be saved in the rejected table instead of retrying it"""
+        with self._cond:
+            self._stats['rejected_in_db'] += 1
+        print(f"Rejected activity {activity.get('id')!r}: {str(error)}")
+        try:
+            db.execute('INSERT INTO activities_rejected (id, user_id, body, error, rejected_at) VALUES (?, ?, ?, ?, ?)',
+                       (str(activity.get('id')), str(activity.get('user_id', '')),
+                        json.dumps(activity, default=str), str(error), time.time()))
+        except Exception as e:
+            print(f"Could not keep rejected activity {activity.get('id')!r}: {str(e)}")
+
+# Shared store for completed activities; queued completions are flushed at exit
+activity_store = ActivityStore()
+atexit.register(activity_store.close)
@@ -0,0 +1,174 @@
+"""
+Concurrent fan-out of many chat prompts for /chat/batch.
+
+Items run concurrently, at most ``max_concurrency`` at a time. Each item is
+its own call through the provider's circuit breaker, deadline and retries,
+and is observed by the router, exactly like a single /chat request, so a
+batch cannot keep hammering a failing provider. Results come back as
+``(index, result)`` pairs in completion order, so the route can stream them
+as NDJSON or sort them back into input order. A failed item becomes an error
+entry; it never fails the whole batch.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from src.services.chains import call_config, get_chat_chain
+from src.services.conversations import legacy_context
+from src.services.llm_registry import registry
+from src.services.resilience import Deadline, acall_with_resilience, call_with_resilience, get_breaker
+from src.services.routing import router
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 100))
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv('BATCH_DEFAULT_CONCURRENCY', 8))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 32))
+
+
+class BatchRequestError(ValueError):
+    """The batch payload itself is invalid (as opposed to a single item)"""
+
+
+def parse_batch(data):
+    """Validate a batch payload; returns (items, max_concurrency)"""
+    items = (data or {}).get('items')
+    if not isinstance(items, list) or not items:
+        raise BatchRequestError('items must be a non-empty list of {message, provider, context}')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise BatchRequestError(f'A batch may contain at most {BATCH_MAX_ITEMS} items')
+    try:
+        concurrency = int(data.get('max_concurrency', BATCH_DEFAULT_CONCURRENCY))
+    except (TypeError, ValueError):
+        raise BatchRequestError('max_concurrency must be an integer')
+    return items, max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+
+def plan_batch(items):
+    """Group valid items by provider; returns (groups, immediate_results)
+
+    ``groups`` maps provider to a list of (index, variables).
+    ``immediate_results`` holds items that fail validation or hit an open circuit.
+    """
+    groups = {}
+    immediate = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('message'):
+            immediate.append((index, {'index': index, 'error': 'Message is required'}))
+            continue
+        requested = item.get('provider', 'gemini')
+        if requested == 'auto':
+            provider = router.choose()
+        else:
+            provider = requested if requested in registry.providers() else 'gemini'
+        variables = {
+            'context': legacy_context(item.get('context', '')),
+            'message': item['message']
+        }
+        groups.setdefault(provider, []).append((index, variables))
+
+    for provider in list(groups):
+        breaker = get_breaker(provider)
+        if not breaker.allows():
+            for index, _ in groups.pop(provider):
+                immediate.append((index, {
+                    'index': index, 'provider': provider,
+                    'error': f'{provider} is temporarily unavailable'
+                }))
+    return groups, immediate
+
+
+def _invoke_item(provider, variables):
+    """One item through the breaker, deadline, retries and router health, like /chat"""
+    chain = get_chat_chain(provider)
+    deadline = Deadline()
+
+    def call(timeout):
+        return chain.invoke(variables, config=call_config(provider, timeout))
+
+    return router.observe(provider, lambda: call_with_resilience(provider, call, deadline))
+
+
+async def _ainvoke_item(provider, variables):
+    """Async counterpart of _invoke_item()"""
+    chain = get_chat_chain(provider)
+    deadline = Deadline()
+
+    def call(timeout):
+        return chain.ainvoke(variables, config=call_config(provider, timeout))
+
+    return await router.aobserve(provider, lambda: acall_with_resilience(provider, call, deadline))
+
+
+def _item_result(provider, index, output):
+    if isinstance(output, Exception):
+        return {'index': index, 'provider': provider, 'error': str(output)}
+    return {'index': index, 'provider': provider, 'response': output.content}
+
+
+def _work(groups):
+    return [(index, provider, variables) for provider, entries in groups.items() for index, variables in entries]
+
+
+def run_batch(items, max_concurrency):
+    """Yield ``(index, result)`` for every item as it completes"""
+    groups, immediate = plan_batch(items)
+    yield from immediate
+    work = _work(groups)
+    if not work:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(max_concurrency, len(work)), thread_name_prefix='batch')
+    try:
+        futures = {executor.submit(_invoke_item, provider, variables): (index, provider)
+                   for index, provider, variables in work}
+        # Each item is its own call, so it is answered exactly once whatever its neighbours do
+        for future in as_completed(futures):
+            index, provider = futures[future]
+            output = future.exception() or future.result()
+            yield index, _item_result(provider, index, output)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def arun_batch(items, max_concurrency):
+    """Async counterpart of run_batch(); items run concurrently on the event loop"""
+    groups, immediate = plan_batch(items)
+    for entry in immediate:
+        yield entry
+
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def run_item(index, provider, variables):
+        async with slots:
+            try:
+                output = await _ainvoke_item(provider, variables)
+            except Exception as e:
+                output = e
+        return index, _item_result(provider, index, output)
+
+    tasks = [asyncio.ensure_future(run_item(*entry)) for entry in _work(groups)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def wants_ndjson(data, accept_header):
+    """Whether the client asked for results streamed one JSON line per item"""
+    return bool((data or {}).get('stream')) or 'application/x-ndjson' in (accept_header or '')
+
+
+def ndjson_line(result):
+    return json.dumps(result) + '\n'
+
+
+def ordered_response(pairs, count):
+    """Sort completed (index, result) pairs back into input order"""
+    results = [result for _, result in sorted(pairs, key=lambda pair: pair[0])]
+    return {
+        'results': results,
+        'count': count,
+        'failed': sum(1 for result in results if 'error' in result)
+    }
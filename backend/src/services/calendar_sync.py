@@ -0,0 +1,259 @@
+"""
+Incremental sync of scheduled programs to Google Calendar.
+
+For every user and calendar, the last synced state is kept in SQLite. Each
+program has one row with its event id, a hash of the program, a hash of the
+event body that was sent, and the etag Google returned. A sync compares the
+posted programs with that state and sends only the difference:
+
+- a program whose hash is unchanged costs nothing; its event is not rebuilt
+- a changed program is rebuilt, and updated only if its event hash changed
+- a new program is inserted, and a program no longer posted is deleted
+  (unless ``prune`` is off)
+
+All calls go out through ``CalendarClient.execute`` in as few batch requests
+as possible. With auto-sync re-posting the same programs, a steady-state
+sync therefore makes no writes at all.
+
+Changes made in the calendar itself are read back with Google's sync
+tokens. Only events changed since the previous sync are listed. One of our
+events whose etag no longer matches (edited or deleted by the user) is
+marked stale, and the same sync pushes the program's version again. When
+Google expires the token, a full listing rebuilds it.
+
+Event ids are derived from the calendar and a stable program key, never
+from content. A sync that is retried after a lost response, or that runs
+concurrently with another, inserts the same ids and gets 409. Such events
+are then overwritten with a PUT, so they are never duplicated. The reverse
+also holds: an update whose event is gone (404/410, e.g. purged by Google
+after the user deleted it) is inserted again.
+
+Simulated syncs (no client) keep their state apart from real ones, so the
+first real sync inserts every program instead of updating events that were
+never created.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.services.activities import DATA_DIR
+from src.services.google_calendar import Operation, SyncTokenExpired, event_id
+
+CALENDAR_SYNC_DB = os.getenv('CALENDAR_SYNC_DB') or os.path.join(DATA_DIR, 'calendar_sync.db')
+
+# Bump when the event layout changes, so every program is pushed again once
+SYNC_VERSION = 1
+
+
+def content_hash(value):
+    """Stable hash of a JSON value; key order does not matter"""
+    text = json.dumps([SYNC_VERSION, value], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def sync_event_id(calendar_id, program_key):
+    """Event id for a program; the same on every sync and every retry"""
+    return event_id('dscpl-sync', calendar_id, program_key)
+
+
+class CalendarSyncStore:
+    """Last synced state per user and calendar: program rows and the sync token"""
+
+    def __init__(self, db_path=CALENDAR_SYNC_DB):
+        self.db_path = db_path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # One connection per process; a forked worker opens its own
+        if self._db is None or self._db[0] != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA busy_timeout=5000')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS calendar_sync ('
+                'owner TEXT NOT NULL, calendar_id TEXT NOT NULL, program_key TEXT NOT NULL, '
+                'event_id TEXT NOT NULL, program_hash TEXT NOT NULL, event_hash TEXT, etag TEXT, '
+                'synced_at REAL NOT NULL, PRIMARY KEY (owner, calendar_id, program_key))'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS calendar_sync_tokens ('
+                'owner TEXT NOT NULL, calendar_id TEXT NOT NULL, sync_token TEXT, '
+                'updated_at REAL NOT NULL, PRIMARY KEY (owner, calendar_id))'
+            )
+            self._db = (os.getpid(), db)
+        return self._db[1]
+
+    def load(self, owner, calendar_id):
+        """``(rows by program key, sync token)``; a row's ``event_hash`` is None when stale"""
+        with self._lock:
+            db = self._connect()
+            rows = db.execute(
+                'SELECT program_key, event_id, program_hash, event_hash, etag FROM calendar_sync '
+                'WHERE owner = ? AND calendar_id = ?', (owner, calendar_id)
+            ).fetchall()
+            token = db.execute('SELECT sync_token FROM calendar_sync_tokens WHERE owner = ? AND calendar_id = ?',
+                               (owner, calendar_id)).fetchone()
+        synced = {key: {'event_id': item, 'program_hash': program_hash, 'event_hash': event_hash, 'etag': etag}
+                  for key, item, program_hash, event_hash, etag in rows}
+        return synced, token[0] if token else None
+
+    def save(self, owner, calendar_id, upserts, removed, sync_token):
+        """Write one sync's outcome in a single transaction"""
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.executemany(
+                    'INSERT OR REPLACE INTO calendar_sync (owner, calendar_id, program_key, event_id, '
+                    'program_hash, event_hash, etag, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(owner, calendar_id, key, row['event_id'], row['program_hash'], row['event_hash'],
+                      row['etag'], now) for key, row in upserts.items()]
+                )
+                db.executemany('DELETE FROM calendar_sync WHERE owner = ? AND calendar_id = ? AND program_key = ?',
+                               [(owner, calendar_id, key) for key in removed])
+                db.execute('INSERT OR REPLACE INTO calendar_sync_tokens (owner, calendar_id, sync_token, updated_at) '
+                           'VALUES (?, ?, ?, ?)', (owner, calendar_id, sync_token, now))
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+
+    def forget(self, owner):
+        """Drop a user's sync state, e.g. when they disconnect their calendar"""
+        with self._lock:
+            db = self._connect()
+            db.execute('DELETE FROM calendar_sync WHERE owner = ?', (owner,))
+            db.execute('DELETE FROM calendar_sync_tokens WHERE owner = ?', (owner,))
+
+
+class CalendarSync:
+    """Diffs posted programs against the stored state and pushes only the changes"""
+
+    def __init__(self, store=None):
+        self.store = store or CalendarSyncStore()
+
+    def read_remote(self, client, calendar_id, synced, sync_token):
+        """Mark our events changed in the calendar as stale; returns ``(changed keys, token, full)``"""
+        full = not sync_token
+        try:
+            changes, next_token = client.list_changes(calendar_id, sync_token)
+        except SyncTokenExpired:
+            full = True
+            changes, next_token = client.list_changes(calendar_id)
+        keys = {row['event_id']: key for key, row in synced.items()}
+        stale = set()
+        listed = set()
+        for event in changes:
+            key = keys.get(event.get('id'))
+            if key is None:
+                continue
+            listed.add(key)
+            if event.get('status') == 'cancelled' or event.get('etag') != synced[key]['etag']:
+                stale.add(key)
+        if full:
+            # A full listing leaves out deleted events, so anything not seen is gone
+            stale.update(key for key in synced if key not in listed)
+        for key in stale:
+            synced[key]['event_hash'] = None
+        return stale, next_token, full
+
+    def sync(self, owner, programs, client=None, calendar_id='primary', prune=True):
+        """Bring the calendar in line with ``programs``
+
+        ``programs`` maps a stable program key to ``(program_hash, build)``, where
+        ``build()`` returns the event body. Without a client, calls are simulated.
+        Returns ``{program_key: result}`` and a summary of what was done.
+        """
+        # Simulated rows never reached a calendar, so they must not look synced to a real client
+        state_id = calendar_id if client is not None else f'simulated:{calendar_id}'
+        synced, sync_token = self.store.load(owner, state_id)
+        stale, next_token, full = set(), sync_token, False
+        if client is not None:
+            stale, next_token, full = self.read_remote(client, calendar_id, synced, sync_token)
+
+        results, upserts, removed = {}, {}, []
+        creates, updates, deletes = [], [], []
+        for key, (program_hash, build) in programs.items():
+            row = synced.get(key)
+            if row is not None and row['program_hash'] == program_hash and row['event_hash'] is not None:
+                results[key] = {'action': 'unchanged', 'event_id': row['event_id'], 'ok': True}
+                continue
+            event = dict(build(), id=row['event_id'] if row else sync_event_id(calendar_id, key))
+            event_hash = content_hash(event)
+            if row is not None and row['event_hash'] == event_hash:
+                # The program changed in ways its event does not show
+                upserts[key] = dict(row, program_hash=program_hash)
+                results[key] = {'action': 'unchanged', 'event_id': event['id'], 'ok': True}
+                continue
+            pending = {'event_id': event['id'], 'program_hash': program_hash, 'event_hash': event_hash,
+                       'etag': None, 'event': event}
+            (creates if row is None else updates).append((key, pending))
+        if prune:
+            deletes = [(key, row) for key, row in synced.items() if key not in programs]
+
+        operations = (
+            [Operation('POST', client.events_path(calendar_id), row['event']) for _, row in creates] +
+            [Operation('PUT', client.events_path(calendar_id, row['event_id']), row['event']) for _, row in updates] +
+            [Operation('DELETE', client.events_path(calendar_id, row['event_id'])) for _, row in deletes]
+        ) if client is not None else []
+        outcomes = client.execute(operations) if operations else [{'ok': True, 'status': None, 'body': None}
+                                                                  for _ in creates + updates + deletes]
+
+        # An update whose event no longer exists is inserted again under the same id
+        missing = [i for i in range(len(updates)) if outcomes[len(creates) + i]['status'] in (404, 410)]
+        if missing:
+            reinserted = client.execute([Operation('POST', client.events_path(calendar_id),
+                                                   updates[i][1]['event']) for i in missing])
+            for i, outcome in zip(missing, reinserted):
+                outcomes[len(creates) + i] = outcome
+
+        # An insert that hit an existing id (an earlier attempt, or a deleted event
+        # of the same program) is overwritten so the calendar matches this sync
+        conflicts = [i for i, (_, row) in enumerate(creates) if outcomes[i]['status'] == 409]
+        if conflicts:
+            rewritten = client.execute([Operation('PUT', client.events_path(calendar_id, creates[i][1]['event_id']),
+                                                  creates[i][1]['event']) for i in conflicts])
+            for i, outcome in zip(conflicts, rewritten):
+                outcomes[i] = outcome
+
+        recreated = {updates[i][0] for i in missing}
+        writes = [('created', key, row) for key, row in creates] + \
+                 [('created' if key in recreated else 'updated', key, row) for key, row in updates]
+        for (action, key, row), outcome in zip(writes, outcomes):
+            results[key] = {'action': action, 'event_id': row['event_id'], 'ok': outcome['ok']}
+            if outcome['ok']:
+                etag = outcome['body'].get('etag') if isinstance(outcome.get('body'), dict) else None
+                upserts[key] = dict((name, row[name]) for name in ('event_id', 'program_hash', 'event_hash'))
+                upserts[key]['etag'] = etag
+            else:
+                results[key]['error'] = outcome['error']
+                if key in synced:
+                    # Keep the row but stale, so the next sync tries the update again
+                    upserts[key] = dict(synced[key], event_hash=None)
+        for (key, row), outcome in zip(deletes, outcomes[len(writes):]):
+            results[key] = {'action': 'deleted', 'event_id': row['event_id'], 'ok': outcome['ok']}
+            if outcome['ok']:
+                removed.append(key)
+            else:
+                results[key]['error'] = outcome['error']
+        # Stale rows for programs that were not re-posted stay stale
+        for key in stale:
+            if key not in upserts and key not in removed:
+                upserts[key] = synced[key]
+
+        self.store.save(owner, state_id, upserts, removed, next_token)
+        counts = {action: sum(1 for result in results.values() if result['action'] == action and result['ok'])
+                  for action in ('created', 'updated', 'deleted', 'unchanged')}
+        counts['failed'] = sum(1 for result in results.values() if not result['ok'])
+        return results, dict(counts, writes=len(operations) + len(missing) + len(conflicts),
+                             remote_changes=len(stale), full_sync=full)
+
+
+# Shared incremental sync, backed by the calendar sync database
+calendar_sync = CalendarSync()
@@ -0,0 +1,151 @@
+"""
+Prompt templates and runnable chains for the AI chat endpoints.
+
+Templates are parsed once at import time and the composed ``prompt | model``
+runnables are cached per provider, so the request path only binds variables.
+A cached chain is rebuilt when the registry hands out a different client
+(for example after an API key rotation).
+
+Per-request model kwargs such as the provider timeout travel in the run
+config (see ``call_config``), so the cached chains never need rebinding.
+"""
+import threading
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+
+from src.services.llm_registry import registry
+
+# Spiritual guidance system prompt
+SPIRITUAL_SYSTEM_PROMPT = """You are a compassionate AI spiritual companion designed to provide biblical guidance, encouragement, and support. Your role is to:
+
+1. Offer wisdom rooted in Christian faith and biblical principles
+2. Provide comfort and encouragement during difficult times
+3. Share relevant scripture verses when appropriate
+4. Guide users in prayer and spiritual reflection
+5. Help users grow in their relationship with God
+6. Be empathetic, non-judgmental, and loving
+
+Guidelines:
+- Always respond with love, grace, and biblical truth
+- Use scripture to support your guidance when relevant
+- Encourage prayer and seeking God's will
+- Be sensitive to different denominational backgrounds
+- Avoid giving medical, legal, or professional counseling advice
+- Direct users to professional help when needed
+- Keep responses encouraging and hope-filled
+
+Remember: You are here to point people toward God's love, grace, and truth."""
+
+SCRIPTURE_GUIDANCE_PROMPT = """As a spiritual companion, provide guidance on the topic of "{topic}" by:
+        1. Sharing 2-3 relevant Bible verses with references
+        2. Explaining how these verses apply to this topic
+        3. Offering practical spiritual advice
+        4. Suggesting a short prayer related to this topic
+        
+        Format your response as JSON with the following structure:
+        {{
+            "topic": "{topic}",
+            "verses": [
+                {{"reference": "Book Chapter:Verse", "text": "verse text"}},
+                ...
+            ],
+            "explanation": "explanation text",
+            "practical_advice": "practical advice text",
+            "prayer": "suggested prayer text"
+        }}
+        """
+
+# Templates are built once; they are immutable and safe to share across threads
+CHAT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SPIRITUAL_SYSTEM_PROMPT),
+    ("human", "{context}\n\nUser: {message}")
+])
+
+SCRIPTURE_PROMPT = ChatPromptTemplate.from_messages([
+    ("human", SCRIPTURE_GUIDANCE_PROMPT)
+])
+
+PROMPTS = {
+    'chat': CHAT_PROMPT,
+    'scripture': SCRIPTURE_PROMPT,
+}
+
+
+# Key in RunnableConfig['configurable'] holding per-request model call kwargs
+CALL_OPTIONS_KEY = 'llm_call_options'
+
+
+def call_config(provider, timeout=None):
+    """Run config that passes a request's remaining time down to the provider SDK"""
+    return {'configurable': {CALL_OPTIONS_KEY: registry.call_options(provider, timeout)}}
+
+
+class ModelWithCallOptions(Runnable):
+    """Wraps a chat model and forwards call options found in the run config"""
+
+    def __init__(self, model):
+        self.model = model
+
+    @staticmethod
+    def _options(config):
+        return ((config or {}).get('configurable') or {}).get(CALL_OPTIONS_KEY) or {}
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.model.invoke(input, config, **{**self._options(config), **kwargs})
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.model.ainvoke(input, config, **{**self._options(config), **kwargs})
+
+    def stream(self, input, config=None, **kwargs):
+        yield from self.model.stream(input, config, **{**self._options(config), **kwargs})
+
+    async def astream(self, input, config=None, **kwargs):
+        async for chunk in self.model.astream(input, config, **{**self._options(config), **kwargs}):
+            yield chunk
+
+
+class ChainFactory:
+    """Builds and caches ``prompt | model`` runnables per prompt and provider"""
+
+    def __init__(self, provider_registry=None):
+        self._registry = provider_registry or registry
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, provider):
+        """Return the cached chain for a prompt name and provider"""
+        client = self._registry.get(provider)
+        key = (name, provider)
+
+        entry = self._chains.get(key)
+        if entry is not None and entry[0] is client:
+            return entry[1]
+
+        with self._lock:
+            entry = self._chains.get(key)
+            if entry is not None and entry[0] is client:
+                return entry[1]
+            chain = PROMPTS[name] | ModelWithCallOptions(client)
+            self._chains[key] = (client, chain)
+            return chain
+
+    def warm_up(self, providers=None):
+        """Build chains for every prompt and provider ahead of the first request"""
+        for provider in providers or self._registry.providers():
+            for name in PROMPTS:
+                self.get(name, provider)
+
+
+# Shared chain factory used by the request handlers
+chains = ChainFactory()
+
+
+def get_chat_chain(provider):
+    """Chain for conversational guidance"""
+    return chains.get('chat', provider)
+
+
+def get_scripture_chain(provider='gemini'):
+    """Chain for structured scripture guidance"""
+    return chains.get('scripture', provider)
@@ -0,0 +1,266 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+When many users send the same prompt at the same moment (for example after a
+devotional push), only the first request reaches the provider. Concurrent
+requests with the same key wait for that call and receive its result.
+Streaming requests share one upstream stream: it is pumped by a background
+thread into a buffer, and each subscriber replays the buffer and then follows
+live chunks. The upstream generation is closed once every subscriber has gone.
+
+Stream subscribers may pass ``idle_timeout``; they then receive the ``IDLE``
+sentinel whenever no chunk arrived within that many seconds, which lets the
+caller flush buffers or send heartbeats without another thread.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+
+
+# Yielded to stream subscribers when no chunk arrived within their idle timeout
+IDLE = object()
+
+
+def make_key(*parts):
+    """Stable key for a request from its provider, prompt and context"""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    """A single upstream call shared by a leader and its followers"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _SharedStream:
+    """Buffered upstream stream that several subscribers can read from"""
+
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.cancelled = False
+        self.condition = threading.Condition()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one upstream call"""
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'coalesced': 0, 'streams': 0, 'stream_joins': 0, 'streams_cancelled': 0}
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['calls'] += 1
+            else:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stream(self, key, factory, idle_timeout=None):
+        """Iterate a shared stream, starting it with ``factory()`` if needed"""
+        with self._lock:
+            shared = self._streams.get(key)
+            # A stream whose subscribers all left is being torn down; start afresh
+            if shared is None or shared.cancelled:
+                shared = self._streams[key] = _SharedStream()
+                self._stats['streams'] += 1
+                start = True
+            else:
+                self._stats['stream_joins'] += 1
+                start = False
+            with shared.condition:
+                shared.subscribers += 1
+
+        if start:
+            threading.Thread(target=self._pump, args=(key, shared, factory), daemon=True).start()
+
+        return self._subscribe(shared, idle_timeout)
+
+    def stats(self):
+        """Counters of upstream calls and requests that piggybacked on them"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+            stats['streams_in_flight'] = len(self._streams)
+        return stats
+
+    def _pump(self, key, shared, factory):
+        upstream = None
+        try:
+            upstream = iter(factory())
+            for chunk in upstream:
+                with shared.condition:
+                    if shared.cancelled:
+                        break
+                    shared.chunks.append(chunk)
+                    shared.condition.notify_all()
+        except Exception as e:
+            with shared.condition:
+                shared.error = e
+        finally:
+            # Closing the generator stops generation upstream
+            if upstream is not None and hasattr(upstream, 'close'):
+                upstream.close()
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+            with shared.condition:
+                shared.finished = True
+                shared.condition.notify_all()
+
+    def _subscribe(self, shared, idle_timeout):
+        position = 0
+        try:
+            while True:
+                with shared.condition:
+                    ready = shared.condition.wait_for(
+                        lambda: position < len(shared.chunks) or shared.finished,
+                        timeout=idle_timeout
+                    )
+                    pending = shared.chunks[position:]
+                    finished = shared.finished
+                    error = shared.error
+                if not ready:
+                    yield IDLE
+                    continue
+                position += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished and position >= len(shared.chunks):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            # Same lock order as stream(): registry lock first, then the condition
+            with self._lock:
+                with shared.condition:
+                    shared.subscribers -= 1
+                    if shared.subscribers == 0 and not shared.finished:
+                        shared.cancelled = True
+                        self._stats['streams_cancelled'] += 1
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight for the ASGI serving path"""
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._stats = {'calls': 0, 'coalesced': 0, 'streams': 0, 'stream_joins': 0, 'streams_cancelled': 0}
+
+    async def do(self, key, coro_fn):
+        """Await ``coro_fn()`` once for all concurrent callers with the same key"""
+        future = self._calls.get(key)
+        if future is not None:
+            self._stats['coalesced'] += 1
+            # Shield so one cancelled follower does not cancel the shared call
+            return await asyncio.shield(future)
+
+        self._stats['calls'] += 1
+        future = asyncio.ensure_future(coro_fn())
+        self._calls[key] = future
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def stream(self, key, factory, idle_timeout=None):
+        """Async-iterate a shared stream, starting it with ``factory()`` if needed"""
+        shared = self._streams.get(key)
+        if shared is None or shared.cancelled:
+            shared = self._streams[key] = _SharedStream()
+            shared.condition = asyncio.Condition()
+            shared.task = asyncio.ensure_future(self._pump(key, shared, factory))
+            self._stats['streams'] += 1
+        else:
+            self._stats['stream_joins'] += 1
+        shared.subscribers += 1
+
+        position = 0
+        try:
+            while True:
+                try:
+                    async with shared.condition:
+                        await asyncio.wait_for(
+                            shared.condition.wait_for(
+                                lambda: position < len(shared.chunks) or shared.finished
+                            ),
+                            timeout=idle_timeout
+                        )
+                        pending = shared.chunks[position:]
+                        finished = shared.finished
+                except asyncio.TimeoutError:
+                    yield IDLE
+                    continue
+                position += len(pending)
+                for chunk in pending:
+                    yield chunk
+                if finished and position >= len(shared.chunks):
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.finished:
+                shared.cancelled = True
+                shared.task.cancel()
+                self._stats['streams_cancelled'] += 1
+
+    def stats(self):
+        """Counters of upstream calls and requests that piggybacked on them"""
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._calls)
+        stats['streams_in_flight'] = len(self._streams)
+        return stats
+
+    async def _pump(self, key, shared, factory):
+        try:
+            async for chunk in factory():
+                async with shared.condition:
+                    shared.chunks.append(chunk)
+                    shared.condition.notify_all()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            shared.error = e
+        finally:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+            shared.finished = True
+            async with shared.condition:
+                shared.condition.notify_all()
+
+
+# Shared coalescers for every LLM-backed request in this process
+inflight = SingleFlight()
+async_inflight = AsyncSingleFlight()
@@ -0,0 +1,300 @@
+"""
+Versioned content packs for devotions, prayers, meditations and accountability areas.
+
+Content ships as a read-only SQLite file built from ``src/data/content.json``
+(``python -m src.services.content_pack build SOURCE.json [DEST.db]``). The
+pack is not committed: the shared store builds it when it is missing or
+older than the JSON source.
+Opening a pack reads only the catalog: ids, titles and categories. An item's
+full body is loaded the first time it is needed and kept in a small LRU.
+
+The file is opened immutable and memory-mapped. Its pages therefore live in
+the OS page cache, shared by every worker process, instead of being copied
+into each worker's heap. A connection is never reused across a fork; a
+forked worker opens its own.
+
+To publish a new version, build it next to the live pack and rename it into
+place. Readers stat the file at most every CONTENT_RELOAD_INTERVAL seconds.
+When it has changed they open the new pack and swap it in with a single
+reference assignment; requests already running finish on the old snapshot.
+Reload listeners (pre-rendered responses, the retrieval index, the intent
+router) are then rebuilt. They also run when a forked worker opens a version
+other than the one they were last built from.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from urllib.parse import quote
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+CONTENT_PACK_PATH = os.getenv('CONTENT_PACK_PATH') or os.path.join(DATA_DIR, 'content.db')
+CONTENT_SOURCE = os.path.join(DATA_DIR, 'content.json')
+CONTENT_RELOAD_INTERVAL = float(os.getenv('CONTENT_RELOAD_INTERVAL', 5))
+CONTENT_CACHE_SIZE = int(os.getenv('CONTENT_CACHE_SIZE', 512))
+
+FORMAT = '1'
+MMAP_BYTES = 256 * 1024 * 1024
+
+
+def content_version(content):
+    """Stable version id: a hash of the canonical JSON of every item"""
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(canonical).hexdigest()[:16]
+
+
+def build_pack(content, path):
+    """Write ``{kind: {id: item}}`` to a pack file; returns the version id"""
+    version = content_version(content)
+    # Write to a temporary file and rename so readers never see a partial pack
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        db.execute(
+            'CREATE TABLE items (kind TEXT NOT NULL, id TEXT NOT NULL, position INTEGER NOT NULL, '
+            'title TEXT NOT NULL, category TEXT NOT NULL, body TEXT NOT NULL)'
+        )
+        count = 0
+        for kind, items in content.items():
+            for position, (item_id, item) in enumerate(items.items()):
+                db.execute(
+                    'INSERT INTO items (kind, id, position, title, category, body) VALUES (?, ?, ?, ?, ?, ?)',
+                    (kind, item_id, position, item.get('title', ''), item.get('category', ''),
+                     json.dumps(item, ensure_ascii=False))
+                )
+                count += 1
+        # Catalog reads never touch the (large) bodies, and lookups go straight to one row
+        db.execute('CREATE INDEX items_catalog ON items (kind, position, id, title, category)')
+        db.execute('CREATE UNIQUE INDEX items_key ON items (kind, id)')
+        db.executemany('INSERT INTO meta (key, value) VALUES (?, ?)',
+                       [('format', FORMAT), ('version', version), ('items', str(count))])
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_path, path)
+    return version
+
+
+def read_source(path):
+    """Content from a ``{kind: {id: item}}`` JSON file"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _identity(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def is_stale(path, source):
+    """True when the pack at ``path`` is missing or older than its JSON source"""
+    if not source or not os.path.exists(source):
+        return False
+    try:
+        return os.stat(path).st_mtime_ns < os.stat(source).st_mtime_ns
+    except FileNotFoundError:
+        return True
+
+
+class ContentPack:
+    """One immutable, opened version of the content"""
+
+    def __init__(self, path, cache_size=CONTENT_CACHE_SIZE):
+        self.path = path
+        self.identity = _identity(path)
+        self.pid = os.getpid()
+        self.cache_size = cache_size
+        uri = f"file:{quote(os.path.abspath(path))}?mode=ro&immutable=1"
+        self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._db.execute(f'PRAGMA mmap_size={MMAP_BYTES}')
+        meta = dict(self._db.execute('SELECT key, value FROM meta'))
+        if meta.get('format') != FORMAT:
+            self._db.close()
+            raise ValueError(f'{path} is not a content pack (format {meta.get("format")!r})')
+        self.version = meta['version']
+
+        self.catalog = {}
+        for kind, item_id, title, category in self._db.execute(
+                'SELECT kind, id, title, category FROM items ORDER BY kind, position'):
+            self.catalog.setdefault(kind, {})[item_id] = (title, category)
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, kind, item_id):
+        """An item's full body (shared; treat as read-only), or None"""
+        if item_id not in self.catalog.get(kind, ()):
+            return None
+        key = (kind, item_id)
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None:
+                self._cache.move_to_end(key)
+                return item
+            row = self._db.execute('SELECT body FROM items WHERE kind = ? AND id = ?', key).fetchone()
+            self.loads += 1
+        if row is None:
+            return None
+        item = json.loads(row[0])
+        with self._lock:
+            self._cache[key] = item
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return item
+
+
+class ContentStore:
+    """The live content pack, hot-reloaded when the file is replaced"""
+
+    def __init__(self, path=CONTENT_PACK_PATH, source=None, reload_interval=CONTENT_RELOAD_INTERVAL,
+                 cache_size=CONTENT_CACHE_SIZE):
+        self.path = path
+        self.source = source
+        self.reload_interval = reload_interval
+        self.cache_size = cache_size
+        self._pack = None
+        self._published = None  # Version the reload listeners were last run for
+        self._listeners = []
+        self._open_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self.reloads = 0
+
+    def pack(self):
+        """Current pack, opening it on first use and picking up new versions"""
+        pack = self._pack
+        if pack is None or pack.pid != os.getpid():
+            return self._open()
+        if self.reload_interval >= 0 and time.monotonic() - self._checked_at >= self.reload_interval:
+            self.check_for_update()
+        return self._pack
+
+    def _open(self):
+        changed = False
+        with self._open_lock:
+            pack = self._pack
+            if pack is None or pack.pid != os.getpid():
+                self._build_if_stale()
+                pack = ContentPack(self.path, self.cache_size)
+                self._pack = pack
+                self._checked_at = time.monotonic()
+                # A worker forked before a reload inherits listeners built from the old version
+                changed = self._published is not None and pack.version != self._published
+                if self._published is None:
+                    self._published = pack.version
+        if changed:
+            self.reloads += 1
+            print(f"Loaded content pack version {pack.version}")
+            self._notify(pack)
+        return pack
+
+    def _build_if_stale(self):
+        if is_stale(self.path, self.source):
+            version = build_pack(read_source(self.source), self.path)
+            print(f"Built content pack version {version} from {self.source}")
+
+    def check_for_update(self):
+        """Swap in a new pack if the file was replaced; returns True when it did"""
+        if not self._reload_lock.acquire(blocking=False):
+            return False  # Another thread is already reloading
+        try:
+            self._checked_at = time.monotonic()
+            current = self._pack
+            try:
+                self._build_if_stale()
+                if current is not None and _identity(self.path) == current.identity:
+                    return False
+                pack = ContentPack(self.path, self.cache_size)
+            except (OSError, sqlite3.Error, ValueError) as e:
+                print(f"Keeping content pack {current.version if current else None}: {e}")
+                return False
+            # The old pack closes once the requests still using it let go of it
+            self._pack = pack
+            self.reloads += 1
+            print(f"Loaded content pack version {pack.version}")
+        finally:
+            self._reload_lock.release()
+
+        self._notify(pack)
+        return True
+
+    def _notify(self, pack):
+        self._published = pack.version
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Error rebuilding after content reload: {str(e)}")
+
+    def on_reload(self, listener):
+        """Call ``listener()`` after every new version is swapped in"""
+        self._listeners.append(listener)
+        return listener
+
+    def stats(self):
+        pack = self.pack()
+        return {
+            'version': pack.version,
+            'path': self.path,
+            'items': {kind: len(items) for kind, items in pack.catalog.items()},
+            'cached_items': len(pack._cache),
+            'body_loads': pack.loads,
+            'reloads': self.reloads
+        }
+
+
+class ContentCollection(Mapping):
+    """Read-only ``{id: item}`` view of one kind of content in the live pack"""
+
+    def __init__(self, store, kind):
+        self.store = store
+        self.kind = kind
+
+    def __getitem__(self, item_id):
+        item = self.store.pack().get(self.kind, item_id)
+        if item is None:
+            raise KeyError(item_id)
+        return item
+
+    def __contains__(self, item_id):
+        return item_id in self.store.pack().catalog.get(self.kind, ())
+
+    def __iter__(self):
+        return iter(list(self.store.pack().catalog.get(self.kind, ())))
+
+    def __len__(self):
+        return len(self.store.pack().catalog.get(self.kind, ()))
+
+    def catalog(self):
+        """``(id, title, category)`` for every item, without loading bodies"""
+        entries = self.store.pack().catalog.get(self.kind, {})
+        return [(item_id, title, category) for item_id, (title, category) in entries.items()]
+
+
+# Shared store; the pack is opened on first use (and rebuilt from the JSON source when stale)
+content_store = ContentStore(CONTENT_PACK_PATH, source=CONTENT_SOURCE)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] != 'build':
+        print('Usage: python -m src.services.content_pack build SOURCE.json [DEST.db]')
+        return 2
+    destination = argv[2] if len(argv) > 2 else CONTENT_PACK_PATH
+    content = read_source(argv[1])
+    version = build_pack(content, destination)
+    count = sum(len(items) for items in content.values())
+    print(f'Wrote {count} items (version {version}) to {destination} ({os.path.getsize(destination)} bytes)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
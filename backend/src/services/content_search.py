@@ -0,0 +1,223 @@
+"""
+Search, category facets and cursor pagination over all spiritual content.
+
+The index is built once from the content collections (and rebuilt when a new
+content pack is loaded). It is a BM25 inverted index (see ``retrieval``) over
+titles, categories, scripture references and body text. Each document also
+gets small integer arrays for its content type and category, so filters and
+facet counts are vectorized numpy operations rather than Python loops.
+
+Ranking is BM25 score, with ties broken by catalog order. A query's last term
+also matches as a prefix, for search-as-you-type. Only the requested page is
+sorted (``argpartition``) and serialized. The cursor is an opaque token
+holding the index version, the offset and a fingerprint of the query, so a
+cursor can't be replayed against a different search or a reloaded index.
+"""
+import base64
+import bisect
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from src.services.retrieval import BM25Index, content_strings, tokenize
+
+SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', 20))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', 100))
+
+# Field boosts: repeating a field's text weights its terms
+TITLE_BOOST = 3
+CATEGORY_BOOST = 2
+REFERENCE_BOOST = 2
+
+# The last query term matches at most this many indexed terms as a prefix
+PREFIX_EXPANSIONS = 20
+MIN_PREFIX_LENGTH = 3
+
+
+class SearchError(ValueError):
+    """Raised for invalid search parameters or cursors"""
+
+
+def _csv(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+class ContentSearchIndex:
+    """Inverted index over every content item, with type/category filters and facets"""
+
+    def __init__(self):
+        self.version = 0
+        self._state = None
+        self._lock = threading.Lock()
+
+    def build(self, collections):
+        """Index ``{kind: {id: item}}``; ``kinds`` order is kept for tie-breaking"""
+        documents, tokens = [], []
+        kinds, categories = [], []
+        kind_ids, category_ids = [], []
+        category_index = {}
+        for kind_id, (kind, items) in enumerate(collections.items()):
+            kinds.append(kind)
+            for item_id, item in items.items():
+                title = item.get('title', '')
+                category = item.get('category', '')
+                reference = (item.get('scripture') or {}).get('reference', '')
+                text = ' '.join([title] * TITLE_BOOST + [category] * CATEGORY_BOOST
+                                + [reference] * REFERENCE_BOOST + [item_id.replace('_', ' ')]
+                                + list(content_strings(item)))
+                documents.append({
+                    'id': item_id,
+                    'type': kind,
+                    'title': title,
+                    'category': category,
+                    'reference': reference
+                })
+                tokens.append(tokenize(text))
+                if category.lower() not in category_index:
+                    category_index[category.lower()] = len(categories)
+                    categories.append(category)
+                kind_ids.append(kind_id)
+                category_ids.append(category_index[category.lower()])
+
+        index = BM25Index(tokens)
+        state = {
+            'index': index,
+            'terms': sorted(index.vocabulary),
+            'documents': documents,
+            'kinds': kinds,
+            'categories': categories,
+            'category_index': category_index,
+            'kind_ids': np.asarray(kind_ids, dtype=np.int32),
+            'category_ids': np.asarray(category_ids, dtype=np.int32)
+        }
+        with self._lock:
+            self._state = state
+            self.version += 1
+        return self
+
+    def _query_terms(self, state, query):
+        terms = tokenize(query)
+        if not terms:
+            return terms
+        last = terms[-1]
+        if last not in state['index'].vocabulary and len(last) >= MIN_PREFIX_LENGTH:
+            # Search-as-you-type: expand the unfinished last word to indexed terms
+            sorted_terms = state['terms']
+            start = bisect.bisect_left(sorted_terms, last)
+            expansions = []
+            for term in sorted_terms[start:start + PREFIX_EXPANSIONS]:
+                if not term.startswith(last):
+                    break
+                expansions.append(term)
+            terms = terms[:-1] + (expansions or [last])
+        return terms
+
+    def _fingerprint(self, query, kinds, categories):
+        raw = '\x1f'.join([query, ','.join(sorted(kinds)), ','.join(sorted(categories))])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:12]
+
+    def _encode_cursor(self, version, offset, fingerprint):
+        raw = f"{version}:{offset}:{fingerprint}".encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def _decode_cursor(self, cursor, version, fingerprint):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+            cursor_version, offset, cursor_fingerprint = raw.split(':')
+            cursor_version, offset = int(cursor_version), int(offset)
+        except (ValueError, UnicodeDecodeError):
+            raise SearchError('Invalid cursor')
+        if cursor_fingerprint != fingerprint or offset < 0:
+            raise SearchError('Cursor does not belong to this search')
+        if cursor_version != version:
+            raise SearchError('Content has changed since this cursor was issued; restart the search')
+        return offset
+
+    def search(self, query='', types=None, categories=None, limit=SEARCH_DEFAULT_LIMIT, cursor=None):
+        """One page of results plus total count, facets and the next cursor"""
+        with self._lock:
+            state, version = self._state, self.version
+        if state is None:
+            raise SearchError('Search index is not ready')
+        query = (query or '').strip()
+        types = [kind.lower() for kind in (types or [])]
+        categories = [category.lower() for category in (categories or [])]
+        unknown = [kind for kind in types if kind not in state['kinds']]
+        if unknown:
+            raise SearchError(f"Unknown content type: {', '.join(unknown)}")
+        limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+        fingerprint = self._fingerprint(query, types, categories)
+        offset = self._decode_cursor(cursor, version, fingerprint) if cursor else 0
+
+        size = len(state['documents'])
+        terms = self._query_terms(state, query)
+        if terms:
+            scores, _ = state['index'].score(terms)
+            matched = scores > 0
+        else:
+            scores, matched = None, np.ones(size, dtype=bool)
+
+        type_mask = np.ones(size, dtype=bool)
+        if types:
+            wanted = [state['kinds'].index(kind) for kind in types]
+            type_mask = np.isin(state['kind_ids'], wanted)
+        category_mask = np.ones(size, dtype=bool)
+        if categories:
+            wanted = [state['category_index'][c] for c in categories if c in state['category_index']]
+            category_mask = np.isin(state['category_ids'], wanted)
+
+        # Each facet counts matches under every filter except its own
+        category_counts = np.bincount(state['category_ids'][matched & type_mask],
+                                      minlength=len(state['categories']))
+        type_counts = np.bincount(state['kind_ids'][matched & category_mask], minlength=len(state['kinds']))
+
+        candidates = np.flatnonzero(matched & type_mask & category_mask)
+        total = len(candidates)
+        end = min(offset + limit, total)
+        if scores is not None and offset < total:
+            if end < total:
+                candidates = candidates[np.argpartition(-scores[candidates], end - 1)[:end]]
+            candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        page = candidates[offset:end]
+
+        results = []
+        for doc_id in page:
+            result = dict(state['documents'][doc_id])
+            if scores is not None:
+                result['score'] = round(float(scores[doc_id]), 4)
+            results.append(result)
+
+        return {
+            'results': results,
+            'total': total,
+            'facets': {
+                'category': self._facet(state['categories'], category_counts),
+                'type': self._facet(state['kinds'], type_counts)
+            },
+            'next_cursor': self._encode_cursor(version, end, fingerprint) if end < total else None
+        }
+
+    def _facet(self, values, counts):
+        facet = [{'value': value, 'count': int(count)} for value, count in zip(values, counts) if count]
+        facet.sort(key=lambda entry: (-entry['count'], entry['value']))
+        return facet
+
+    def parse_and_search(self, args):
+        """Search from request query parameters (q, type, category, limit, cursor)"""
+        try:
+            limit = int(args.get('limit', SEARCH_DEFAULT_LIMIT))
+        except (TypeError, ValueError):
+            raise SearchError('limit must be an integer')
+        return self.search(
+            query=args.get('q', ''),
+            types=_csv(args.get('type')),
+            categories=_csv(args.get('category')),
+            limit=limit,
+            cursor=args.get('cursor') or None
+        )
+
+
+# Shared index; built by the spiritual programs routes at startup
+content_search = ContentSearchIndex()
@@ -0,0 +1,227 @@
+"""
+Server-side conversation memory with a token-budgeted context window.
+
+Conversations are kept under a conversation ID. Each request sends the model
+the most recent turns verbatim, up to CONVERSATION_CONTEXT_TOKENS, plus a
+rolling summary of everything older. The summary is capped at
+CONVERSATION_SUMMARY_TOKENS. Turns that fall out of the recent window are
+folded into it once, when they leave, so the prompt size (and the work per
+turn) stays flat however long the conversation gets. Folded turns are then
+dropped, so memory per conversation is bounded too.
+
+Conversation ids are always generated here (random, unguessable), never
+chosen by the client, so knowing an id is what grants access to a
+conversation. A client that sends an unknown id gets a new conversation
+with a new id. The store is bounded as well. It holds at most
+CONVERSATION_MAX conversations, evicting the least recently used, and
+conversations idle for CONVERSATION_TTL are swept out whenever a new one is
+created.
+
+The default summarizer is extractive: it keeps the first sentence of each
+folded turn, so folding costs no extra LLM call.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from src.services.metrics import estimate_tokens
+
+CONTEXT_TOKENS = int(os.getenv('CONVERSATION_CONTEXT_TOKENS', 1500))
+SUMMARY_TOKENS = int(os.getenv('CONVERSATION_SUMMARY_TOKENS', 300))
+LEGACY_CONTEXT_TOKENS = int(os.getenv('LEGACY_CONTEXT_TOKENS', 1500))
+MAX_CONVERSATIONS = int(os.getenv('CONVERSATION_MAX', 10000))
+CONVERSATION_TTL_SECONDS = int(os.getenv('CONVERSATION_TTL', 7 * 24 * 60 * 60))
+
+# Longest conversation id accepted from a client (ours are 32 hex characters)
+MAX_ID_LENGTH = 64
+
+# Longest excerpt kept from one folded turn, in words
+SUMMARY_LINE_WORDS = 30
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def summarize_turn(role, text):
+    """One summary line for a turn: its first sentence, trimmed"""
+    first = _SENTENCE_END.split(text.strip(), maxsplit=1)[0]
+    words = first.split()
+    if len(words) > SUMMARY_LINE_WORDS:
+        first = ' '.join(words[:SUMMARY_LINE_WORDS]) + '...'
+    speaker = 'User' if role == 'user' else 'Assistant'
+    return f"{speaker}: {first}"
+
+
+def truncate_to_tokens(text, budget):
+    """Keep the tail of ``text`` that fits in ``budget`` estimated tokens"""
+    if estimate_tokens(text) <= budget:
+        return text
+    return '...' + text[-budget * 4:]
+
+
+def legacy_context(context):
+    """Bound a free-form client-supplied context string"""
+    if not context:
+        return ""
+    return f"Previous context: {truncate_to_tokens(context, LEGACY_CONTEXT_TOKENS)}"
+
+
+class Conversation:
+    """Turns, rolling summary and token accounting for one conversation"""
+
+    def __init__(self, conversation_id):
+        self.id = conversation_id
+        # Only the turns the summary does not cover yet
+        self.turns = deque()
+        self.summary_lines = []
+        self.summary_tokens = 0
+        self.folded = 0
+        self.window_tokens = 0
+        self.prompt_tokens_total = 0
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def context_window(self):
+        """Context string for the next prompt: summary plus recent turns"""
+        with self.lock:
+            recent = list(self.turns)
+            parts = []
+            if self.summary_lines:
+                parts.append("Summary of earlier conversation:\n" + "\n".join(self.summary_lines))
+            if recent:
+                parts.append("Recent conversation:\n" + "\n".join(
+                    f"{'User' if role == 'user' else 'Assistant'}: {text}" for role, text, _ in recent
+                ))
+        if not parts:
+            return ""
+        return "Previous context: " + "\n\n".join(parts)
+
+    def record(self, user_message, reply, prompt_tokens=None):
+        """Append a user/assistant exchange and fold turns that left the window"""
+        with self.lock:
+            for role, text in (('user', user_message), ('assistant', reply)):
+                # The last exchange is always kept verbatim, so bound what one turn can hold
+                text = truncate_to_tokens(text, CONTEXT_TOKENS)
+                tokens = estimate_tokens(text)
+                self.turns.append((role, text, tokens))
+                self.window_tokens += tokens
+            if prompt_tokens:
+                self.prompt_tokens_total += prompt_tokens
+            self.updated_at = time.time()
+            self._fold()
+
+    def _fold(self):
+        # Expects self.lock to be held; each turn is folded exactly once
+        while self.window_tokens > CONTEXT_TOKENS and len(self.turns) > 2:
+            role, text, tokens = self.turns.popleft()
+            line = summarize_turn(role, text)
+            self.summary_lines.append(line)
+            self.summary_tokens += estimate_tokens(line)
+            self.window_tokens -= tokens
+            self.folded += 1
+            # Oldest summary lines give way first when the summary is full
+            while self.summary_tokens > SUMMARY_TOKENS and len(self.summary_lines) > 1:
+                dropped = self.summary_lines.pop(0)
+                self.summary_tokens -= estimate_tokens(dropped)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'id': self.id,
+                'turns': [{'role': role, 'content': text} for role, text, _ in self.turns],
+                'summary': self.summary_lines,
+                'summarized_turns': self.folded,
+                'context_tokens': self.window_tokens + self.summary_tokens,
+                'prompt_tokens_total': self.prompt_tokens_total,
+                'updated_at': self.updated_at
+            }
+
+
+class InvalidConversationId(ValueError):
+    """A conversation_id that is not a non-empty string of at most MAX_ID_LENGTH characters"""
+
+
+def _check_id(conversation_id):
+    if not isinstance(conversation_id, str) or not conversation_id or len(conversation_id) > MAX_ID_LENGTH:
+        raise InvalidConversationId(f'conversation_id must be a string of at most {MAX_ID_LENGTH} characters')
+
+
+class ConversationStore:
+    """Thread-safe, bounded map of conversation ID to Conversation"""
+
+    def __init__(self, max_conversations=MAX_CONVERSATIONS, ttl_seconds=CONVERSATION_TTL_SECONDS):
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._conversations = OrderedDict()
+        self._evicted = 0
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id):
+        """Conversation by id, or None; raises InvalidConversationId for a malformed id"""
+        _check_id(conversation_id)
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return None
+            if time.time() - conversation.updated_at > self.ttl_seconds:
+                del self._conversations[conversation_id]
+                return None
+            self._conversations.move_to_end(conversation_id)
+            return conversation
+
+    def get_or_create(self, conversation_id=None):
+        """Existing conversation, or a new one; new conversations always get a fresh server ID"""
+        if conversation_id is not None:
+            conversation = self.get(conversation_id)
+            if conversation is not None:
+                return conversation
+        conversation = Conversation(uuid.uuid4().hex)
+        with self._lock:
+            self._conversations[conversation.id] = conversation
+            self._evict()
+        return conversation
+
+    def _evict(self):
+        # Expects self._lock to be held; the least recently used conversations come first
+        now = time.time()
+        while self._conversations:
+            oldest_id, oldest = next(iter(self._conversations.items()))
+            if len(self._conversations) <= self.max_conversations and now - oldest.updated_at <= self.ttl_seconds:
+                break
+            del self._conversations[oldest_id]
+            self._evicted += 1
+
+    def resolve(self, data):
+        """Conversation for a request in memory mode (``conversation_id`` present), else None"""
+        if not data or 'conversation_id' not in data:
+            return None
+        conversation_id = data.get('conversation_id')
+        return self.get_or_create(None if conversation_id in (None, '') else conversation_id)
+
+    def delete(self, conversation_id):
+        _check_id(conversation_id)
+        with self._lock:
+            return self._conversations.pop(conversation_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {'conversations': len(self._conversations), 'max_conversations': self.max_conversations,
+                    'evicted': self._evicted}
+
+
+def usage_for(system_prompt, context_str, message, response=None):
+    """Prompt token accounting, preferring the provider's own count when reported"""
+    estimated = estimate_tokens(system_prompt) + estimate_tokens(context_str) + estimate_tokens(message)
+    usage = {'prompt_tokens': estimated, 'context_tokens': estimate_tokens(context_str), 'estimated': True}
+    metadata = getattr(response, 'usage_metadata', None) if response is not None else None
+    if metadata and metadata.get('input_tokens'):
+        usage['prompt_tokens'] = metadata['input_tokens']
+        usage['completion_tokens'] = metadata.get('output_tokens')
+        usage['estimated'] = False
+    return usage
+
+
+# Shared conversation memory for this process
+conversations = ConversationStore()
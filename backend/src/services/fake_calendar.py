@@ -0,0 +1,264 @@
+"""
+Local stand-in for the Google Calendar API, for offline tests and benchmarks.
+
+It serves the event endpoints the app uses (insert, get, list, update,
+patch, delete) plus the multipart batch endpoint, from an in-memory store.
+Like the real API it answers 409 for an insert whose client-chosen id already
+exists, 404 for unknown events, 410 when deleting an event twice, and 400 for
+batches over the size limit. Listing is paged and returns a
+``nextSyncToken``. A list with ``syncToken`` returns only the events changed
+since then, deleted ones included, and answers 410 once the token has been
+expired with ``expire_sync_tokens``. Latency is shaped per HTTP request and per
+call. A configurable share of calls fail with a retryable 503.
+
+Point the client at it with GOOGLE_CALENDAR_API_BASE and
+GOOGLE_CALENDAR_BATCH_URL, or run it standalone:
+``python -m src.services.fake_calendar [port]``
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FAKE_CALENDAR_LATENCY = float(os.getenv('FAKE_CALENDAR_LATENCY', 0.02))
+FAKE_CALENDAR_CALL_LATENCY = float(os.getenv('FAKE_CALENDAR_CALL_LATENCY', 0.001))
+FAKE_CALENDAR_ERROR_RATE = float(os.getenv('FAKE_CALENDAR_ERROR_RATE', 0.0))
+FAKE_CALENDAR_MAX_BATCH = int(os.getenv('FAKE_CALENDAR_MAX_BATCH', 50))
+FAKE_CALENDAR_SEED = int(os.getenv('FAKE_CALENDAR_SEED', 0))
+
+_EVENTS_PATH = re.compile(r'^/calendar/v3/calendars/([^/]+)/events(?:/([^/]+))?$')
+
+
+def _error(status, message, reason):
+    return status, {'error': {'code': status, 'message': message, 'errors': [{'reason': reason}]}}
+
+
+class FakeCalendar:
+    """In-memory calendars keyed by calendar id, then event id"""
+
+    def __init__(self, error_rate=FAKE_CALENDAR_ERROR_RATE, call_latency=FAKE_CALENDAR_CALL_LATENCY,
+                 seed=FAKE_CALENDAR_SEED):
+        self.error_rate = error_rate
+        self.call_latency = call_latency
+        self.calendars = {}
+        self.stats = {'http_requests': 0, 'batches': 0, 'calls': 0, 'injected_errors': 0, 'listed': 0}
+        # Every write takes the next sequence number; sync tokens are "epoch.sequence"
+        self._sequence = 0
+        self._changed = {}
+        self._epoch = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, method, path, body):
+        """``(status, body)`` for one API call"""
+        url = urlsplit(path)
+        match = _EVENTS_PATH.match(url.path)
+        if not match:
+            return _error(404, 'Not Found', 'notFound')
+        calendar_id, item_id = unquote(match.group(1)), match.group(2) and unquote(match.group(2))
+        if self.call_latency:
+            time.sleep(self.call_latency)
+        with self._lock:
+            self.stats['calls'] += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats['injected_errors'] += 1
+                return _error(503, 'Backend Error', 'backendError')
+            events = self.calendars.setdefault(calendar_id, {})
+            event = events.get(item_id) if item_id else None
+
+            if method == 'GET' and item_id is None:
+                return self._list(calendar_id, events, parse_qs(url.query))
+            if method == 'POST' and item_id is None:
+                new_id = (body or {}).get('id') or uuid.uuid4().hex
+                if new_id in events:
+                    return _error(409, 'The requested identifier already exists.', 'duplicate')
+                return 200, self._store(calendar_id, events, dict(body or {}, id=new_id))
+            if event is None:
+                return _error(404, 'Not Found', 'notFound')
+            if method == 'GET':
+                return 200, event
+            if method == 'DELETE':
+                if event['status'] == 'cancelled':
+                    return _error(410, 'Resource has been deleted', 'deleted')
+                self._store(calendar_id, events, dict(event, status='cancelled'))
+                return 204, None
+            if method == 'PUT':
+                return 200, self._store(calendar_id, events, dict(body or {}, id=item_id))
+            if method == 'PATCH':
+                return 200, self._store(calendar_id, events, dict(event, **(body or {}), id=item_id))
+        return _error(405, 'Method Not Allowed', 'methodNotAllowed')
+
+    def _store(self, calendar_id, events, event):
+        event.setdefault('status', 'confirmed')
+        event['updated'] = datetime.now(timezone.utc).isoformat()
+        event['etag'] = f'"{uuid.uuid4().hex}"'
+        events[event['id']] = event
+        self._sequence += 1
+        self._changed.setdefault(calendar_id, {})[event['id']] = self._sequence
+        return event
+
+    def _list(self, calendar_id, events, query):
+        """One page of events, changed since ``syncToken`` if given"""
+        page_size = min(2500, int(query.get('maxResults', ['250'])[0]))
+        if 'pageToken' in query:
+            since, upto, offset = (int(part) for part in query['pageToken'][0].split('.'))
+        else:
+            since, upto, offset = -1, self._sequence, 0
+            if 'syncToken' in query:
+                epoch, _, since = query['syncToken'][0].partition('.')
+                if epoch != str(self._epoch) or not since.isdigit():
+                    return _error(410, 'Sync token is no longer valid, a full sync is required.',
+                                  'fullSyncRequired')
+                since = int(since)
+        # Incremental lists (since >= 0) include deleted events, so clients see removals
+        show_deleted = since >= 0 or query.get('showDeleted', ['false'])[0] == 'true'
+        sequences = self._changed.get(calendar_id, {})
+        changed = sorted(
+            ((sequences[event['id']], event) for event in events.values()
+             if since < sequences[event['id']] <= upto and (show_deleted or event['status'] != 'cancelled')),
+            key=lambda pair: pair[0]
+        )
+        page = [event for _, event in changed[offset:offset + page_size]]
+        self.stats['listed'] += len(page)
+        result = {'kind': 'calendar#events', 'summary': calendar_id, 'items': page}
+        if offset + page_size < len(changed):
+            result['nextPageToken'] = f'{since}.{upto}.{offset + page_size}'
+        else:
+            result['nextSyncToken'] = f'{self._epoch}.{upto}'
+        return 200, result
+
+    def expire_sync_tokens(self):
+        """Invalidate every sync token handed out so far, as Google does from time to time"""
+        with self._lock:
+            self._epoch += 1
+
+    def live_events(self, calendar_id='primary'):
+        with self._lock:
+            return [e for e in self.calendars.get(calendar_id, {}).values() if e['status'] != 'cancelled']
+
+
+def _http_part(index, status, body):
+    payload = '' if body is None else json.dumps(body)
+    return ('Content-Type: application/http\r\n'
+            f'Content-ID: <response-item{index}>\r\n\r\n'
+            f'HTTP/1.1 {status} {"OK" if status < 400 else "Error"}\r\n'
+            'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+            f'{payload}\r\n')
+
+
+def _parse_batch(content_type, payload):
+    """Calls in a batch request, as ``[(method, path, body)]``"""
+    calls = []
+    text = payload.decode('utf-8')
+    boundary = content_type.split('boundary=', 1)[1].strip('"')
+    for part in text.replace('\r\n', '\n').split(f'--{boundary}')[1:]:
+        if part.startswith('--'):
+            break
+        _, _, http = part.strip('\n').partition('\n\n')
+        request_line, _, rest = http.partition('\n')
+        _, _, body = rest.partition('\n\n')
+        method, path = request_line.split()[:2]
+        calls.append((method, path, json.loads(body) if body.strip() else None))
+    return calls
+
+
+class FakeCalendarServer:
+    """Threaded HTTP server for a FakeCalendar, started on a free local port"""
+
+    def __init__(self, calendar=None, port=0, latency=FAKE_CALENDAR_LATENCY, max_batch=FAKE_CALENDAR_MAX_BATCH):
+        self.calendar = calendar or FakeCalendar()
+        self.latency = latency
+        self.max_batch = max_batch
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without this, keep-alive stalls on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body, content_type='application/json; charset=UTF-8'):
+                payload = b'' if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = self.rfile.read(length) if length else b''
+                with server.calendar._lock:
+                    server.calendar.stats['http_requests'] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                authorization = self.headers.get('Authorization', '')
+                if not authorization.startswith('Bearer ') or not authorization[7:].strip():
+                    return self._reply(*_error(401, 'Login Required', 'required'))
+                if urlsplit(self.path).path == '/batch/calendar/v3':
+                    return self._batch(payload)
+                status, body = server.calendar.call(self.command, self.path, json.loads(payload) if payload else None)
+                self._reply(status, body)
+
+            def _batch(self, payload):
+                calls = _parse_batch(self.headers.get('Content-Type', ''), payload)
+                if len(calls) > server.max_batch:
+                    return self._reply(*_error(400, f'Batch of {len(calls)} calls exceeds {server.max_batch}',
+                                               'tooManyCalls'))
+                with server.calendar._lock:
+                    server.calendar.stats['batches'] += 1
+                boundary = f'batch_{uuid.uuid4().hex}'
+                parts = [f'--{boundary}\r\n' + _http_part(index, *server.calendar.call(method, path, body))
+                         for index, (method, path, body) in enumerate(calls)]
+                body = (''.join(parts) + f'--{boundary}--\r\n').encode('utf-8')
+                self._reply(200, body, f'multipart/mixed; boundary={boundary}')
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def api_base(self):
+        return f'http://127.0.0.1:{self.port}/calendar/v3'
+
+    @property
+    def batch_url(self):
+        return f'http://127.0.0.1:{self.port}/batch/calendar/v3'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv):
+    server = FakeCalendarServer(port=int(argv[0]) if argv else 8089)
+    print(f'Fake Google Calendar on {server.api_base} (batch: {server.batch_url})')
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
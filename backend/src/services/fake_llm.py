@@ -0,0 +1,181 @@
+"""
+Offline, deterministic chat model registered as the ``fake`` provider.
+
+It lets the chat endpoints be exercised and benchmarked without network
+access. Replies depend only on the prompt and the configured seed. Latency is
+shaped by a first-token delay plus a per-token delay, and a configurable share
+of calls fail with a retryable 503-style error. Scripture prompts get a
+well-formed JSON guidance document, so the structured-output path is covered
+too.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_LLM_ENABLED = os.getenv('FAKE_LLM_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+FAKE_LLM_FIRST_TOKEN_DELAY = float(os.getenv('FAKE_LLM_FIRST_TOKEN_DELAY', 0.2))
+FAKE_LLM_TOKEN_DELAY = float(os.getenv('FAKE_LLM_TOKEN_DELAY', 0.01))
+FAKE_LLM_ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', 0.0))
+FAKE_LLM_REPLY_TOKENS = int(os.getenv('FAKE_LLM_REPLY_TOKENS', 60))
+FAKE_LLM_SEED = int(os.getenv('FAKE_LLM_SEED', 0))
+
+_WORDS = (
+    'God', 'grace', 'peace', 'hope', 'faith', 'love', 'prayer', 'trust', 'rest',
+    'strength', 'mercy', 'light', 'comfort', 'joy', 'patience', 'walk', 'heart',
+    'scripture', 'reminds', 'us', 'that', 'you', 'are', 'never', 'alone', 'and',
+    'his', 'is', 'with', 'in', 'every', 'season', 'of', 'life', 'today',
+)
+
+_VERSES = (
+    {'reference': 'Philippians 4:6-7', 'text': 'Do not be anxious about anything, but in every situation, by prayer and petition, with thanksgiving, present your requests to God.'},
+    {'reference': '1 Peter 5:7', 'text': 'Cast all your anxiety on him because he cares for you.'},
+    {'reference': 'Isaiah 41:10', 'text': 'So do not fear, for I am with you; do not be dismayed, for I am your God.'},
+    {'reference': 'Matthew 11:28', 'text': 'Come to me, all you who are weary and burdened, and I will give you rest.'},
+    {'reference': 'Psalm 34:18', 'text': 'The Lord is close to the brokenhearted and saves those who are crushed in spirit.'},
+    {'reference': 'Jeremiah 29:11', 'text': 'For I know the plans I have for you, declares the Lord, plans to prosper you and not to harm you.'},
+)
+
+_TOPIC_PATTERN = re.compile(r'on the topic of "([^"]*)"')
+
+
+class FakeProviderError(Exception):
+    """Injected provider failure; looks like a 503 so retries and breakers engage"""
+
+    status_code = 503
+
+
+def _digest(seed, text):
+    return hashlib.sha256(f'{seed}:{text}'.encode('utf-8')).digest()
+
+
+def render_reply(prompt_text, seed=FAKE_LLM_SEED, reply_tokens=FAKE_LLM_REPLY_TOKENS):
+    """Deterministic completion for a prompt"""
+    rng = random.Random(_digest(seed, prompt_text))
+    match = _TOPIC_PATTERN.search(prompt_text)
+    if match is not None:
+        verses = rng.sample(_VERSES, 2)
+        topic = match.group(1)
+        return json.dumps({
+            'topic': topic,
+            'verses': [dict(verse) for verse in verses],
+            'explanation': f'These verses speak to {topic} by reminding us of God\'s presence.',
+            'practical_advice': 'Set aside a few quiet minutes each day to pray and reflect on these verses.',
+            'prayer': f'Lord, guide me through {topic} and fill me with your peace. Amen.'
+        })
+    return ' '.join(rng.choice(_WORDS) for _ in range(reply_tokens)) + '.'
+
+
+def _tokens(text):
+    """Split a reply into word-sized chunks that re-join to the original text"""
+    return re.findall(r'\S+\s*', text)
+
+
+class FakeSpiritualChatModel(BaseChatModel):
+    """Chat model with configurable latency, error injection and deterministic replies"""
+
+    model_name: str = 'fake-spiritual'
+    first_token_delay: float = FAKE_LLM_FIRST_TOKEN_DELAY
+    token_delay: float = FAKE_LLM_TOKEN_DELAY
+    error_rate: float = FAKE_LLM_ERROR_RATE
+    reply_tokens: int = FAKE_LLM_REPLY_TOKENS
+    seed: int = FAKE_LLM_SEED
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Error injection draws from its own seeded sequence so runs are repeatable
+        self._error_rng = random.Random(self.seed)
+        self._error_lock = threading.Lock()
+
+    @property
+    def _llm_type(self):
+        return 'fake-spiritual'
+
+    def _reply(self, messages):
+        prompt_text = '\n'.join(str(message.content) for message in messages)
+        return render_reply(prompt_text, self.seed, self.reply_tokens)
+
+    def _maybe_fail(self):
+        if self.error_rate <= 0:
+            return
+        with self._error_lock:
+            failed = self._error_rng.random() < self.error_rate
+        if failed:
+            raise FakeProviderError('Injected fake provider failure')
+
+    def _schedule(self, reply, timeout):
+        """(delay, token) pairs for a reply, cut short where the call's timeout runs out
+
+        Returns the pairs and whether the timeout was hit; a cut-off schedule
+        ends with a ``(remaining_budget, None)`` entry.
+        """
+        schedule = []
+        budget = timeout
+        for position, token in enumerate(_tokens(reply)):
+            delay = self.first_token_delay if position == 0 else self.token_delay
+            if budget is not None:
+                if delay > budget:
+                    schedule.append((budget, None))
+                    return schedule, True
+                budget -= delay
+            schedule.append((delay, token))
+        return schedule, False
+
+    def _generate(self, messages, stop=None, run_manager=None, timeout=None, **kwargs):
+        self._maybe_fail()
+        reply = self._reply(messages)
+        schedule, timed_out = self._schedule(reply, timeout)
+        time.sleep(sum(delay for delay, _ in schedule))
+        if timed_out:
+            raise TimeoutError(f'Fake provider exceeded its {timeout}s timeout')
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, timeout=None, **kwargs):
+        self._maybe_fail()
+        reply = self._reply(messages)
+        schedule, timed_out = self._schedule(reply, timeout)
+        await asyncio.sleep(sum(delay for delay, _ in schedule))
+        if timed_out:
+            raise TimeoutError(f'Fake provider exceeded its {timeout}s timeout')
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _stream(self, messages, stop=None, run_manager=None, timeout=None, **kwargs):
+        self._maybe_fail()
+        schedule, timed_out = self._schedule(self._reply(messages), timeout)
+        for delay, token in schedule:
+            time.sleep(delay)
+            if token is None:
+                break
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        if timed_out:
+            raise TimeoutError(f'Fake provider exceeded its {timeout}s timeout')
+
+    async def _astream(self, messages, stop=None, run_manager=None, timeout=None, **kwargs):
+        self._maybe_fail()
+        schedule, timed_out = self._schedule(self._reply(messages), timeout)
+        for delay, token in schedule:
+            await asyncio.sleep(delay)
+            if token is None:
+                break
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        if timed_out:
+            raise TimeoutError(f'Fake provider exceeded its {timeout}s timeout')
+
+
+def build_fake_client(model, api_key, temperature):
+    """Construct the offline fake chat model"""
+    return FakeSpiritualChatModel(model_name=model or 'fake-spiritual')
@@ -0,0 +1,357 @@
+"""
+Google Calendar API client with batched requests and pooled connections.
+
+Every call goes through one ``requests.Session`` per process, so TLS
+connections to Google are reused instead of re-established per event.
+Inserts, updates and deletes are grouped into Google batch requests
+(multipart/mixed) of up to GOOGLE_CALENDAR_BATCH_SIZE calls each.
+
+Each call in a batch succeeds or fails on its own. Calls that fail with a
+retryable status (429, 5xx, or a 403 rate-limit reason) are collected and
+sent again in a later batch, after exponential backoff with jitter. The
+other calls are not repeated. A batch that fails as a whole (a connection
+error, or a 5xx on the batch itself) retries all of its calls.
+
+Retries never duplicate events. Inserts carry a client-chosen event id
+(``event_id``), so a repeated insert gets 409 and counts as done. Deleting
+an event that is already gone (404/410) also counts as done.
+
+``list_changes`` reads a calendar incrementally. It pages through the
+events changed since a stored sync token and returns the next token. When
+Google has expired the token, it raises SyncTokenExpired.
+
+``fake_calendar`` provides a local stand-in server for tests and benchmarks.
+"""
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from urllib.parse import quote, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.services.metrics import LatencyWindow, _ms
+
+GOOGLE_CALENDAR_ENABLED = os.getenv('GOOGLE_CALENDAR_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+GOOGLE_CALENDAR_API_BASE = os.getenv('GOOGLE_CALENDAR_API_BASE', 'https://www.googleapis.com/calendar/v3')
+GOOGLE_CALENDAR_BATCH_URL = os.getenv('GOOGLE_CALENDAR_BATCH_URL', 'https://www.googleapis.com/batch/calendar/v3')
+# The Calendar API accepts at most 50 calls per batch request
+GOOGLE_CALENDAR_BATCH_SIZE = int(os.getenv('GOOGLE_CALENDAR_BATCH_SIZE', 50))
+GOOGLE_CALENDAR_POOL_SIZE = int(os.getenv('GOOGLE_CALENDAR_POOL_SIZE', 16))
+GOOGLE_CALENDAR_TIMEOUT = float(os.getenv('GOOGLE_CALENDAR_TIMEOUT', 30))
+GOOGLE_CALENDAR_MAX_RETRIES = int(os.getenv('GOOGLE_CALENDAR_MAX_RETRIES', 4))
+GOOGLE_CALENDAR_BACKOFF = float(os.getenv('GOOGLE_CALENDAR_BACKOFF', 0.5))
+
+RETRYABLE_STATUSES = frozenset((429, 500, 502, 503, 504))
+RATE_LIMIT_REASONS = frozenset(('rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'))
+MAX_BACKOFF_SECONDS = 32.0
+# Largest page the events list endpoint returns
+LIST_PAGE_SIZE = 2500
+
+# base32hex, the alphabet Google accepts in client-chosen event ids
+_BASE32HEX = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', '0123456789abcdefghijklmnopqrstuv')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class CalendarError(Exception):
+    """Raised when Google rejects a request as a whole"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SyncTokenExpired(CalendarError):
+    """Raised when a sync token is no longer valid and a full listing is needed"""
+
+    def __init__(self, message='Sync token expired; a full sync is required'):
+        super().__init__(message, 410)
+
+
+def event_id(*parts):
+    """Deterministic Google event id for the given parts (base32hex of a hash)"""
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).digest()
+    return base64.b32encode(digest).decode('ascii').rstrip('=').translate(_BASE32HEX)
+
+
+def pooled_session():
+    """The process-wide Session; a forked worker gets its own connection pool"""
+    global _session
+    current = _session
+    if current is not None and current[0] == os.getpid():
+        return current[1]
+    with _session_lock:
+        if _session is None or _session[0] != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=GOOGLE_CALENDAR_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = (os.getpid(), session)
+        return _session[1]
+
+
+class Operation:
+    """One Calendar API call: method, path below the API base, optional JSON body"""
+
+    __slots__ = ('method', 'path', 'body')
+
+    def __init__(self, method, path, body=None):
+        self.method = method
+        self.path = path
+        self.body = body
+
+
+def _error_reason(body):
+    try:
+        return body['error']['errors'][0]['reason']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _error_message(status, body):
+    if isinstance(body, dict) and isinstance(body.get('error'), dict):
+        return body['error'].get('message') or f'HTTP {status}'
+    return f'HTTP {status}'
+
+
+def is_retryable(status, body):
+    return status in RETRYABLE_STATUSES or (status == 403 and _error_reason(body) in RATE_LIMIT_REASONS)
+
+
+def encode_batch(operations, boundary, api_path):
+    """multipart/mixed body for a batch request"""
+    parts = []
+    for index, operation in enumerate(operations):
+        lines = [
+            f'--{boundary}',
+            'Content-Type: application/http',
+            f'Content-ID: <item{index}>',
+            '',
+            f'{operation.method} {api_path}{operation.path} HTTP/1.1'
+        ]
+        if operation.body is not None:
+            lines += ['Content-Type: application/json; charset=UTF-8', '', json.dumps(operation.body)]
+        else:
+            lines.append('')
+        parts.append('\r\n'.join(lines) + '\r\n')
+    return (''.join(parts) + f'--{boundary}--\r\n').encode('utf-8')
+
+
+def _parse_headers(block):
+    headers = {}
+    for line in block.split('\n'):
+        name, _, value = line.partition(':')
+        if value:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def decode_batch(content_type, payload):
+    """``{index: (status, body)}`` from a multipart/mixed batch response"""
+    boundary = None
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'boundary':
+            boundary = value.strip('"')
+    if not boundary:
+        raise CalendarError('Batch response has no multipart boundary')
+
+    results = {}
+    text = payload.decode('utf-8').replace('\r\n', '\n')
+    for part in text.split(f'--{boundary}')[1:]:
+        if part.startswith('--'):
+            break
+        outer, _, http = part.strip('\n').partition('\n\n')
+        content_id = _parse_headers(outer).get('content-id', '')
+        status_line, _, rest = http.partition('\n')
+        _, _, body = rest.partition('\n\n')
+        try:
+            index = int(content_id.strip('<>').rsplit('item', 1)[1])
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise CalendarError(f'Malformed batch response part: {status_line!r}')
+        body = body.strip()
+        try:
+            results[index] = (status, json.loads(body) if body else None)
+        except ValueError:
+            results[index] = (status, {'error': {'message': body[:200]}})
+    return results
+
+
+class CalendarMetrics:
+    """Counters and latency shared by every client in the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = LatencyWindow()
+        self._counts = {'http_requests': 0, 'batches': 0, 'calls': 0, 'retried_calls': 0,
+                        'failed_calls': 0, 'batch_failures': 0}
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self._counts[name] += value
+
+    def timed(self, seconds):
+        self._latency.add(seconds)
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self._counts)
+        stats['request_p50_ms'] = _ms(self._latency.percentile(50))
+        stats['request_p95_ms'] = _ms(self._latency.percentile(95))
+        return stats
+
+
+class CalendarClient:
+    """Calendar API calls for one user's access token"""
+
+    def __init__(self, access_token, api_base=GOOGLE_CALENDAR_API_BASE, batch_url=GOOGLE_CALENDAR_BATCH_URL,
+                 batch_size=GOOGLE_CALENDAR_BATCH_SIZE, max_retries=GOOGLE_CALENDAR_MAX_RETRIES,
+                 backoff=GOOGLE_CALENDAR_BACKOFF, timeout=GOOGLE_CALENDAR_TIMEOUT, session=None):
+        self.access_token = access_token
+        self.api_base = api_base.rstrip('/')
+        self.api_path = urlsplit(self.api_base).path
+        self.batch_url = batch_url
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session or pooled_session()
+
+    @staticmethod
+    def events_path(calendar_id, event=None):
+        path = f"/calendars/{quote(calendar_id, safe='')}/events"
+        return path if event is None else f"{path}/{quote(event, safe='')}"
+
+    def insert_events(self, calendar_id, events):
+        """Insert events (each should carry an ``id`` from ``event_id``); one result per event"""
+        return self.execute([Operation('POST', self.events_path(calendar_id), event) for event in events])
+
+    def update_events(self, calendar_id, events):
+        """Replace events by their ``id``; one result per event"""
+        return self.execute([Operation('PUT', self.events_path(calendar_id, event['id']), event)
+                             for event in events])
+
+    def delete_events(self, calendar_id, event_ids):
+        """Delete events by id; events that are already gone count as deleted"""
+        return self.execute([Operation('DELETE', self.events_path(calendar_id, item)) for item in event_ids])
+
+    def list_changes(self, calendar_id, sync_token=None, page_size=LIST_PAGE_SIZE):
+        """``(events, next_sync_token)``: every event, or only those changed since ``sync_token``
+
+        Changed events include deleted ones (``status`` ``'cancelled'``).
+        """
+        events = []
+        params = {'maxResults': page_size}
+        if sync_token:
+            params['syncToken'] = sync_token
+        while True:
+            result = self.execute([Operation('GET', f'{self.events_path(calendar_id)}?{urlencode(params)}')])[0]
+            if result['status'] == 410:
+                raise SyncTokenExpired()
+            if not result['ok']:
+                raise CalendarError(f"Could not list events: {result['error']}", result['status'])
+            page = result['body'] or {}
+            events.extend(page.get('items', []))
+            if not page.get('nextPageToken'):
+                return events, page.get('nextSyncToken')
+            params['pageToken'] = page['nextPageToken']
+
+    def execute(self, operations):
+        """Run calls in batches, retrying retryable failures; one result dict per call, in order
+
+        A result is ``{'ok', 'status', 'body', 'attempts'}`` plus ``'error'`` when not ok.
+        """
+        results = [None] * len(operations)
+        pending = list(range(len(operations)))
+        attempt = 0
+        while pending:
+            attempt += 1
+            retry = []
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                try:
+                    responses = self._send([operations[i] for i in chunk])
+                except (requests.RequestException, CalendarError) as e:
+                    if isinstance(e, CalendarError) and e.status_code is not None \
+                            and e.status_code not in RETRYABLE_STATUSES:
+                        raise
+                    # The batch as a whole did not go through; all of its calls are retried
+                    metrics.add(batch_failures=1)
+                    for i in chunk:
+                        results[i] = self._result(operations[i], None, {'error': {'message': str(e)}}, attempt)
+                        retry.append(i)
+                    continue
+                for position, i in enumerate(chunk):
+                    status, body = responses.get(position, (None, {'error': {'message': 'Missing from batch response'}}))
+                    results[i] = self._result(operations[i], status, body, attempt)
+                    if status is None or is_retryable(status, body):
+                        retry.append(i)
+            if not retry or attempt > self.max_retries:
+                break
+            metrics.add(retried_calls=len(retry))
+            time.sleep(min(MAX_BACKOFF_SECONDS, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+            pending = retry
+        metrics.add(calls=len(operations), failed_calls=sum(1 for result in results if not result['ok']))
+        return results
+
+    def _result(self, operation, status, body, attempt):
+        ok = status is not None and 200 <= status < 300
+        if not ok and operation.method == 'DELETE' and status in (404, 410):
+            ok = True  # Already deleted
+        elif not ok and operation.method == 'POST' and status == 409:
+            ok = True  # Inserted by an earlier attempt (client-chosen id)
+        result = {'ok': ok, 'status': status, 'body': body, 'attempts': attempt}
+        if not ok:
+            result['error'] = _error_message(status, body)
+        return result
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.access_token}'}
+
+    def _send(self, operations):
+        """``{position: (status, body)}`` for one group of calls"""
+        started = time.perf_counter()
+        try:
+            if len(operations) == 1:
+                return {0: self._send_one(operations[0])}
+            return self._send_batch(operations)
+        finally:
+            metrics.timed(time.perf_counter() - started)
+
+    def _send_one(self, operation):
+        metrics.add(http_requests=1)
+        response = self.session.request(operation.method, f'{self.api_base}{operation.path}',
+                                        json=operation.body, headers=self._headers(), timeout=self.timeout)
+        if response.status_code == 401:
+            raise CalendarError('Google Calendar authorization expired', 401)
+        try:
+            body = response.json() if response.content else None
+        except ValueError:
+            body = {'error': {'message': response.text[:200]}}
+        return response.status_code, body
+
+    def _send_batch(self, operations):
+        metrics.add(http_requests=1, batches=1)
+        boundary = f'batch_{uuid.uuid4().hex}'
+        headers = self._headers()
+        headers['Content-Type'] = f'multipart/mixed; boundary={boundary}'
+        response = self.session.post(self.batch_url, data=encode_batch(operations, boundary, self.api_path),
+                                     headers=headers, timeout=self.timeout)
+        if response.status_code == 401:
+            raise CalendarError('Google Calendar authorization expired', 401)
+        if response.status_code != 200:
+            raise CalendarError(f'Batch request failed with HTTP {response.status_code}', response.status_code)
+        return decode_batch(response.headers.get('Content-Type', ''), response.content)
+
+
+# Shared counters for every calendar client in this process
+metrics = CalendarMetrics()
@@ -0,0 +1,121 @@
+"""
+Deterministic daily inspiration drawn from the content pack.
+
+Each day shows INSPIRATION_PER_DAY items. They are chosen from the date alone,
+or from the date and a seed for a personal rotation. The pool is shuffled
+once per cycle with a permutation seeded from (seed, cycle), and consecutive
+days take consecutive slices of it. Each cycle therefore shows every item
+once before any repeats, whatever the pool size, and every server picks the
+same items for the same day.
+
+Because a day's payload never changes, the unseeded payloads for the next
+INSPIRATION_PRECOMPUTE_DAYS days are serialized ahead of time. This starts
+from yesterday, for clients in timezones still behind. Seeded payloads are
+rendered on first request into a bounded LRU. Responses may be cached by
+browsers and CDNs until the next midnight in the client's timezone.
+"""
+import hashlib
+import math
+import os
+import random
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+
+from src.services.prerendered import PrerenderedResponses
+from src.services.progress import user_timezone
+
+INSPIRATION_PER_DAY = int(os.getenv('INSPIRATION_PER_DAY', 3))
+INSPIRATION_PRECOMPUTE_DAYS = int(os.getenv('INSPIRATION_PRECOMPUTE_DAYS', 7))
+
+# Shuffled pools kept for recent (seed, cycle) pairs
+MAX_PERMUTATIONS = 256
+MAX_SEED_LENGTH = 64
+
+
+def seconds_until_midnight(now):
+    """Whole seconds from ``now`` (timezone-aware) to the next local midnight"""
+    midnight = datetime.combine(now.date() + timedelta(days=1), time(), tzinfo=now.tzinfo)
+    return max(1, math.ceil((midnight - now).total_seconds()))
+
+
+class InspirationSchedule:
+    """Which inspiration items to show on which day, with pre-serialized responses"""
+
+    def __init__(self, collection, per_day=INSPIRATION_PER_DAY, precompute_days=INSPIRATION_PRECOMPUTE_DAYS):
+        self.collection = collection
+        self.per_day = per_day
+        self.precompute_days = precompute_days
+        self.responses = PrerenderedResponses()
+        self._ids = ()
+        self._permutations = OrderedDict()
+        self._published_from = None
+        self._lock = threading.Lock()
+
+    def rebuild(self):
+        """Reload the pool and re-serialize the precomputed days (after a content reload)"""
+        with self._lock:
+            self._ids = tuple(sorted(self.collection, key=lambda item_id: (len(item_id), item_id)))
+            self._permutations.clear()
+        self._publish(date.today() - timedelta(days=1))
+
+    def _permutation(self, seed, cycle):
+        key = (seed, cycle)
+        with self._lock:
+            order = self._permutations.get(key)
+            if order is not None:
+                self._permutations.move_to_end(key)
+                return order
+            ids = self._ids
+        digest = hashlib.sha256(f"{seed}:{cycle}".encode('utf-8')).digest()
+        order = list(ids)
+        random.Random(int.from_bytes(digest[:8], 'big')).shuffle(order)
+        with self._lock:
+            if ids is self._ids:
+                self._permutations[key] = order
+                while len(self._permutations) > MAX_PERMUTATIONS:
+                    self._permutations.popitem(last=False)
+        return order
+
+    def selection(self, day, seed=''):
+        """Item ids for ``day``: the next slice of the seeded rotation"""
+        size = len(self._ids)
+        if not size:
+            return []
+        count = min(self.per_day, size)
+        picks = []
+        position = day.toordinal() * count
+        while len(picks) < count:
+            cycle, offset = divmod(position, size)
+            item_id = self._permutation(seed, cycle)[offset]
+            # A day that straddles two cycles could otherwise repeat an item
+            if item_id not in picks:
+                picks.append(item_id)
+            position += 1
+        return picks
+
+    def payload(self, day, seed=''):
+        return {
+            'inspiration': [self.collection[item_id] for item_id in self.selection(day, seed)],
+            'date': day.isoformat()
+        }
+
+    def _publish(self, first_day):
+        days = [first_day + timedelta(days=i) for i in range(self.precompute_days + 1)]
+        self.responses.publish({(day.isoformat(), ''): self.payload(day) for day in days})
+        self._published_from = first_day
+
+    def respond(self, request):
+        """Today's inspiration for the client's timezone, cacheable until its midnight"""
+        now = datetime.now(user_timezone(request.args.get('timezone')))
+        today = now.date()
+        seed = request.args.get('seed', '')[:MAX_SEED_LENGTH]
+        # Slide the precomputed window forward once a day
+        if self._published_from is None or today > self._published_from + timedelta(days=self.precompute_days - 1):
+            self._publish(date.today() - timedelta(days=1))
+        visibility = 'private' if seed else 'public'
+        return self.responses.respond(
+            (today.isoformat(), seed), request,
+            load=lambda: self.payload(today, seed),
+            cache_control=f"{visibility}, max-age={seconds_until_midnight(now)}"
+        )
@@ -0,0 +1,442 @@
+"""
+Fast-path intent router for /chat.
+
+Messages are normalized (see ``normalize_topic``) and scanned once by a
+token-level Aho-Corasick automaton compiled from every intent's keywords and
+n-grams. Each matched phrase carries a weight. An intent's confidence
+combines its matches noisy-OR style. It is then scaled by how much of the
+message the matched phrases cover, so a single keyword inside a real
+question ("what does Proverbs mean by the fear of the Lord") goes to the
+model, and discounted for long messages and for ambiguity with the
+runner-up intent. Quick-response prompts sent
+verbatim by the app (button taps) match exactly with full confidence.
+
+Replies for every intent are rendered once at build time from the curated
+content and the verse corpus, so a confident match is answered without
+touching the model. Matches preceded by a negation ("not anxious") are
+ignored, and messages with crisis language always go to the model.
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.retrieval import compose_guidance
+from src.services.scripture_cache import normalize_topic
+from src.services.verses import InvalidReference, parse_reference, verse_corpus
+
+INTENT_THRESHOLD = float(os.getenv('INTENT_THRESHOLD', 0.75))
+INTENT_MAX_TOKENS = int(os.getenv('INTENT_MAX_TOKENS', 24))
+# Share of a message's content words the matched phrases must cover for full confidence
+INTENT_MIN_COVERAGE = float(os.getenv('INTENT_MIN_COVERAGE', 0.5))
+ENRICHMENT_WORKERS = int(os.getenv('INTENT_ENRICHMENT_WORKERS', 4))
+ENRICHMENT_TTL = int(os.getenv('INTENT_ENRICHMENT_TTL', 600))
+ENRICHMENT_MAX = int(os.getenv('INTENT_ENRICHMENT_MAX', 1000))
+
+# Words that flip the meaning of the phrase right after them ("t" is from "don't")
+NEGATIONS = frozenset(('not', 'no', 'never', 't', 'without', 'nor'))
+
+# Words that say little about what a message asks (normalized); left out of phrase coverage
+FILLER_WORDS = frozenset((
+    'i', 'm', 'me', 'my', 'myself', 'am', 'is', 'are', 'was', 'be', 'been', 'it', 'a', 'an', 'the', 'and',
+    'so', 'very', 'really', 'just', 'too', 'feel', 'felt', 'today', 'right', 'now', 'lately', 'please',
+    'about', 'of', 'to', 'for', 'with', 'in', 'at', 'on', 's', 've', 'll', 'd',
+))
+
+# Any of these sends the message to the model, whatever else matches
+CRISIS_PHRASES = (
+    'suicide', 'suicidal', 'kill myself', 'end my life', 'want to die', 'self harm',
+    'hurt myself', 'abuse', 'abused', 'overdose',
+)
+
+# Intent definitions: weighted phrases, optional curated content, verses and copy
+INTENTS = {
+    'peace': {
+        'phrases': {'i need peace': 1.0, 'need peace': 0.95, 'find peace': 0.9, "god's peace": 0.85,
+                    'peace of mind': 0.85, 'feel overwhelmed': 0.8, 'feeling overwhelmed': 0.8,
+                    'overwhelmed': 0.6, 'peace': 0.55, 'restless': 0.5},
+        'content': ('meditation', 'peace'),
+        'verses': ('John 14:27', 'Philippians 4:6-7'),
+        'opening': "I'm so glad you reached out. God's peace is available to you right now, even in the middle of what feels overwhelming.",
+    },
+    'anxiety': {
+        'phrases': {'i feel anxious': 1.0, 'feeling anxious': 0.95, 'i am anxious': 0.95, 'anxiety': 0.8,
+                    'anxious': 0.75, 'worried': 0.7, 'worry': 0.65, 'panic': 0.6, 'nervous': 0.55},
+        'content': ('devotion', 'anxiety'),
+        'verses': ('1 Peter 5:7', 'Philippians 4:6-7'),
+        'opening': "Anxiety can feel heavy, but you don't have to carry it alone. God invites you to hand every worry to Him.",
+    },
+    'stress': {
+        'phrases': {'stressed out': 0.95, 'so stressed': 0.95, 'too much pressure': 0.85, 'burned out': 0.8,
+                    'burnout': 0.8, 'stressed': 0.8, 'stress': 0.75, 'exhausted': 0.6},
+        'content': ('devotion', 'stress'),
+        'verses': ('Matthew 11:28', 'Philippians 4:6-7'),
+        'opening': "It sounds like you're carrying a lot right now. Jesus offers real rest to everyone who is weary.",
+    },
+    'fear': {
+        'phrases': {'i am afraid': 0.95, "i'm afraid": 0.95, 'terrified': 0.85, 'scared': 0.8, 'afraid': 0.8,
+                    'frightened': 0.8, 'fear': 0.75},
+        'content': ('devotion', 'fear'),
+        'verses': ('Isaiah 41:10', 'Psalm 56:3'),
+        'opening': "Fear is a very human feeling, and God meets you in it. He promises to be with you and to strengthen you.",
+    },
+    'depression': {
+        'phrases': {'feel hopeless': 0.9, 'feel empty': 0.8, 'depressed': 0.85, 'depression': 0.85,
+                    'hopeless': 0.75, 'so sad': 0.7, 'sad': 0.5},
+        'content': ('devotion', 'depression'),
+        'verses': ('Psalm 34:18', 'Psalm 147:3'),
+        'opening': "I'm sorry you're feeling this way. God is close to the brokenhearted, and your feelings matter to Him. If this heaviness persists, please also reach out to a counselor or doctor you trust.",
+    },
+    'relationships': {
+        'phrases': {'my marriage': 0.8, 'relationship': 0.7, 'relationships': 0.7, 'marriage': 0.7,
+                    'my husband': 0.6, 'my wife': 0.6, 'friendship': 0.6, 'conflict with': 0.6},
+        'content': ('devotion', 'relationships'),
+        'verses': ('1 Corinthians 13:4-5', 'Colossians 3:13'),
+        'opening': "Relationships are one of God's greatest gifts, and they can also be one of our hardest challenges.",
+    },
+    'healing': {
+        'phrases': {'pray for healing': 0.95, 'need healing': 0.95, 'healing': 0.8, 'i am sick': 0.8,
+                    'illness': 0.7, 'sick': 0.6},
+        'content': ('devotion', 'healing'),
+        'verses': ('Jeremiah 17:14', 'Psalm 147:3'),
+        'opening': "I'm holding you up in prayer. God cares deeply about your body, mind and spirit.",
+    },
+    'purpose': {
+        'phrases': {"god's plan for my life": 1.0, 'finding purpose': 0.95, 'my purpose': 0.9,
+                    'what should i do with my life': 0.9, 'feel lost': 0.85, "god's plan": 0.85,
+                    'purpose': 0.75, 'calling': 0.5},
+        'content': ('devotion', 'purpose'),
+        'verses': ('Jeremiah 29:11', 'Ephesians 2:10'),
+        'opening': "Feeling unsure about your direction is part of many faith journeys. God has good plans for you.",
+    },
+    'gratitude': {
+        'phrases': {'give thanks': 0.8, 'gratitude': 0.8, 'grateful': 0.75, 'thankful': 0.7},
+        'content': ('meditation', 'gratitude'),
+        'verses': ('1 Thessalonians 5:18', 'Psalm 139:14'),
+        'opening': "What a beautiful thing to focus on! Gratitude opens our eyes to God's goodness all around us.",
+    },
+    'prayer': {
+        'phrases': {'help with prayer': 1.0, 'teach me to pray': 0.95, 'how to pray': 0.95, 'how do i pray': 0.95,
+                    'prayer life': 0.9, 'pray more': 0.8, 'pray': 0.45},
+        'content': ('prayer', 'morning'),
+        'verses': ('Luke 18:1', 'Philippians 4:6'),
+        'opening': "Prayer is simply talking with God, and He delights to hear from you. A simple pattern can help you get started.",
+    },
+    'strength': {
+        'phrases': {'need strength': 1.0, 'give me strength': 0.95, 'feel weak': 0.85, 'difficult time': 0.8,
+                    'hard time': 0.75, 'give up': 0.7, 'strength': 0.65, 'going through': 0.4, 'tired': 0.4},
+        'verses': ('Isaiah 40:31', 'Philippians 4:13', '2 Corinthians 12:9'),
+        'opening': "I'm sorry you're going through such a difficult season. You don't have to find the strength on your own.",
+        'explanation': "God's strength is made perfect in our weakness. When we feel we have nothing left, He renews us and carries us forward one step at a time.",
+        'practical_advice': "Take today one moment at a time. Read one of these verses each morning, tell a trusted friend what you're facing, and give yourself permission to rest.",
+        'prayer': "Lord, I feel weak and weary. Please renew my strength, hold me up when I can't stand on my own, and remind me that You are with me. Amen.",
+    },
+    'forgiveness': {
+        'phrases': {'about forgiveness': 1.0, "can't forgive": 0.95, 'forgive myself': 0.95, 'hold a grudge': 0.85,
+                    'forgiveness': 0.85, 'forgive': 0.8, 'resentment': 0.7},
+        'verses': ('Colossians 3:13', 'Ephesians 4:32', '1 John 1:9'),
+        'opening': "Forgiveness is one of the hardest and most freeing things God asks of us, and He never asks us to do it alone.",
+        'explanation': "God forgives us completely through Christ, and He invites us to extend that same grace to others. Forgiving doesn't excuse what happened; it releases the hold that bitterness has on your heart.",
+        'practical_advice': "Name the hurt honestly before God, choose to release the debt in prayer (even if your feelings take longer), and set healthy boundaries where you need them.",
+        'prayer': "Father, thank You for forgiving me. Help me to forgive as You have forgiven me, heal the hurt in my heart, and fill me with Your peace. Amen.",
+    },
+    'growth': {
+        'phrases': {'grow closer to god': 1.0, 'spiritual growth': 1.0, 'grow in faith': 0.95, 'grow spiritually': 0.95,
+                    'closer to god': 0.9, 'draw near to god': 0.9, 'spiritual journey': 0.8},
+        'verses': ('Romans 12:2', 'James 1:5'),
+        'opening': "What a wonderful desire! God promises that those who seek Him with all their heart will find Him.",
+        'explanation': "Spiritual growth happens as we spend time with God, let His Word renew our minds, and walk it out with other believers.",
+        'practical_advice': "Set a daily time for Scripture and prayer, even 10 minutes. Join a small group or find a mentor, and try the daily devotions and accountability check-ins in the app.",
+        'prayer': "Lord, draw me closer to You. Renew my mind through Your Word, give me wisdom, and help me grow in faith and love every day. Amen.",
+    },
+    'greeting': {
+        'phrases': {'hi': 0.9, 'hello': 0.9, 'hey': 0.85, 'good morning': 0.9, 'good evening': 0.9, 'good afternoon': 0.9},
+        'max_tokens': 4,
+        'opening': "Hello, and welcome! I'm here to walk with you in faith. Share what's on your heart, ask about a Bible passage, or tap one of the quick topics to begin.",
+    },
+    'thanks': {
+        'phrases': {'thank you': 0.9, 'thanks': 0.9, 'thank you so much': 0.95},
+        'max_tokens': 6,
+        'opening': "You're very welcome! I'm grateful we could talk. May God bless you and give you His peace today.",
+    },
+}
+
+
+def _tokens(text):
+    return normalize_topic(text).split()
+
+
+class PhraseAutomaton:
+    """Aho-Corasick automaton over token sequences
+
+    Matching works on whole normalized tokens, so "hi" never matches inside
+    "his". ``search`` returns ``(start, end, payload)`` for every match in one
+    pass over the message.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+    def add(self, tokens, payload):
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(tokens), payload))
+
+    def build(self):
+        """Compute failure links breadth-first and merge outputs along them"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        return self
+
+    def search(self, tokens):
+        matches = []
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, payload in self._output[state]:
+                matches.append((position - length + 1, position + 1, payload))
+        return matches
+
+
+def _verse_lines(references, corpus):
+    lines = []
+    for reference in references:
+        try:
+            parsed = parse_reference(reference)
+        except InvalidReference:
+            continue
+        found = corpus.passage(parsed)
+        if found:
+            lines.append(f'"{" ".join(text for _, text in found)}" ({parsed.label})')
+    return lines
+
+
+def render_reply(definition, collections, corpus):
+    """Pre-render an intent's full reply from its copy, curated content and verses"""
+    guidance = {}
+    content = definition.get('content')
+    if content:
+        kind, item_id = content
+        item = collections.get(kind, {}).get(item_id)
+        if item is not None:
+            guidance = compose_guidance(kind, item)
+    parts = [definition['opening']]
+    parts.extend(_verse_lines(definition.get('verses', ()), corpus))
+    for field in ('explanation', 'practical_advice'):
+        text = definition.get(field) or guidance.get(field)
+        if text:
+            parts.append(text)
+    prayer = definition.get('prayer') or guidance.get('prayer')
+    if prayer:
+        parts.append(f"Let's pray together: {prayer}")
+    return '\n\n'.join(parts)
+
+
+class IntentRouter:
+    """Classifies chat messages and serves pre-rendered replies for confident intents"""
+
+    def __init__(self, threshold=INTENT_THRESHOLD, max_tokens=INTENT_MAX_TOKENS, intents=INTENTS,
+                 min_coverage=INTENT_MIN_COVERAGE):
+        self.threshold = threshold
+        self.max_tokens = max_tokens
+        self.min_coverage = min_coverage
+        self.intents = intents
+        self._automaton = None
+        self._exact = {}
+        self._replies = {}
+        self._lock = threading.Lock()
+        self._counts = {'classified': 0, 'served': 0, 'fell_through': 0, 'crisis': 0, 'enriched': 0}
+        self._served_by_intent = {}
+
+    def build(self, quick_responses=(), collections=None, corpus=None):
+        """Compile the automaton and pre-render every reply"""
+        collections = collections or {}
+        corpus = corpus or verse_corpus
+        # Phrases that stem to the same tokens ("stress"/"stressed") count once
+        weights = {}
+        for intent_id, definition in self.intents.items():
+            for phrase, weight in definition['phrases'].items():
+                key = (tuple(_tokens(phrase)), intent_id)
+                weights[key] = max(weight, weights.get(key, 0.0))
+        for phrase in CRISIS_PHRASES:
+            weights[(tuple(_tokens(phrase)), 'crisis')] = 1.0
+        automaton = PhraseAutomaton()
+        for (tokens, intent_id), weight in weights.items():
+            automaton.add(tokens, (intent_id, weight))
+        automaton.build()
+
+        # Quick-response buttons send these exact texts
+        exact = {}
+        for quick in quick_responses:
+            if quick.get('id') in self.intents:
+                for text in (quick.get('prompt'), quick.get('text')):
+                    if text:
+                        exact[' '.join(_tokens(text))] = quick['id']
+
+        replies = {intent_id: render_reply(definition, collections, corpus)
+                   for intent_id, definition in self.intents.items()}
+        with self._lock:
+            self._automaton, self._exact, self._replies = automaton, exact, replies
+        return self
+
+    def classify(self, message):
+        """``(intent_id, confidence, matched_phrases)``; intent_id is None when nothing matches"""
+        tokens = _tokens(message)
+        if not tokens or self._automaton is None:
+            return None, 0.0, []
+
+        exact = self._exact.get(' '.join(tokens))
+        if exact is not None:
+            return exact, 1.0, ['<quick response>']
+
+        scores = {}
+        matched = {}
+        covered = {}
+        for start, end, (intent_id, weight) in self._automaton.search(tokens):
+            if any(tokens[i] in NEGATIONS for i in range(max(0, start - 2), start)):
+                continue
+            if intent_id == 'crisis':
+                return 'crisis', 0.0, [' '.join(tokens[start:end])]
+            scores[intent_id] = 1 - (1 - scores.get(intent_id, 0.0)) * (1 - weight)
+            matched.setdefault(intent_id, []).append(' '.join(tokens[start:end]))
+            covered.setdefault(intent_id, set()).update(range(start, end))
+        if not scores:
+            return None, 0.0, []
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best, confidence = ranked[0]
+        limit = self.intents[best].get('max_tokens')
+        if limit is not None and len(tokens) > limit:
+            return best, 0.0, matched[best]
+        content = [i for i, token in enumerate(tokens) if token not in FILLER_WORDS]
+        if content:
+            coverage = sum(1 for i in content if i in covered[best]) / len(content)
+            confidence *= min(1.0, coverage / self.min_coverage)
+        if len(tokens) > self.max_tokens:
+            # Long messages usually carry details a canned reply can't address
+            confidence *= self.max_tokens / len(tokens)
+        if len(ranked) > 1 and ranked[1][1] >= 0.7 * ranked[0][1]:
+            confidence *= 0.85
+        return best, round(confidence, 4), matched[best]
+
+    def route(self, message):
+        """A fast-path result dict for confident messages, otherwise None"""
+        intent_id, confidence, matched = self.classify(message)
+        with self._lock:
+            self._counts['classified'] += 1
+            if intent_id == 'crisis':
+                self._counts['crisis'] += 1
+            if intent_id is None or intent_id == 'crisis' or confidence < self.threshold:
+                self._counts['fell_through'] += 1
+                return None
+            self._counts['served'] += 1
+            self._served_by_intent[intent_id] = self._served_by_intent.get(intent_id, 0) + 1
+        return {
+            'intent': intent_id,
+            'confidence': confidence,
+            'matched': matched,
+            'response': self._replies[intent_id]
+        }
+
+    def record_enrichment(self):
+        with self._lock:
+            self._counts['enriched'] += 1
+
+    def stats(self):
+        """Fast-path counters, including how many LLM calls were avoided"""
+        with self._lock:
+            counts = dict(self._counts)
+            by_intent = dict(self._served_by_intent)
+        classified = counts['classified']
+        return dict(
+            counts,
+            threshold=self.threshold,
+            served_by_intent=by_intent,
+            llm_calls_avoided=counts['served'] - counts['enriched'],
+            fast_path_rate=round(counts['served'] / classified, 4) if classified else 0.0
+        )
+
+
+class EnrichmentQueue:
+    """Runs optional LLM follow-ups for fast-path replies in the background"""
+
+    def __init__(self, workers=ENRICHMENT_WORKERS, ttl_seconds=ENRICHMENT_TTL, max_entries=ENRICHMENT_MAX):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrich')
+        self._entries = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, fn, done=None):
+        """Schedule ``fn()`` (returning reply text); returns an id to poll
+
+        ``done()`` runs once the call is over, e.g. to give back an in-flight slot.
+        """
+        enrichment_id = f"enr_{next(self._ids)}_{int(time.time() * 1000)}"
+        with self._lock:
+            self._evict()
+            self._entries[enrichment_id] = {'status': 'pending', 'created_at': time.time()}
+        try:
+            self._executor.submit(self._run, enrichment_id, fn, done)
+        except Exception:
+            if done is not None:
+                done()
+            raise
+        return enrichment_id
+
+    def _run(self, enrichment_id, fn, done=None):
+        try:
+            update = {'status': 'ready', 'response': fn()}
+        except Exception as e:
+            update = {'status': 'error', 'error': str(e)}
+        finally:
+            if done is not None:
+                done()
+        with self._lock:
+            entry = self._entries.get(enrichment_id)
+            if entry is not None:
+                entry.update(update)
+
+    def get(self, enrichment_id):
+        with self._lock:
+            entry = self._entries.get(enrichment_id)
+            if entry is None or time.time() - entry['created_at'] > self.ttl_seconds:
+                return None
+            return {key: value for key, value in entry.items() if key != 'created_at'}
+
+    def _evict(self):
+        now = time.time()
+        while self._entries:
+            oldest_id, oldest = next(iter(self._entries.items()))
+            if len(self._entries) < self.max_entries and now - oldest['created_at'] <= self.ttl_seconds:
+                break
+            self._entries.pop(oldest_id)
+
+
+# Shared router (built by the AI chat routes at startup) and enrichment queue
+intent_router = IntentRouter()
+enrichments = EnrichmentQueue()
@@ -0,0 +1,158 @@
+"""
+Process-wide registry of warm LLM clients.
+
+Chat model objects own their HTTP/gRPC transport, so building one per request
+means a fresh connection (and TLS handshake) for every message. The registry
+keeps one client per (provider, model, temperature) and hands the same object
+to every request. Clients are rebuilt when the API key they were created with
+no longer matches the environment, which lets keys rotate without a restart.
+"""
+import os
+import threading
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_groq import ChatGroq
+
+from src.services.fake_llm import FAKE_LLM_ENABLED, build_fake_client
+
+# Default model used for each provider when the caller does not ask for one
+DEFAULT_MODELS = {
+    'gemini': 'gemini-pro',
+    'groq': 'mixtral-8x7b-32768',
+}
+
+# Environment variable holding each provider's API key, with the placeholder
+# used when it is not set
+API_KEY_ENV = {
+    'gemini': ('GOOGLE_API_KEY', 'your-google-api-key-here'),
+    'groq': ('GROQ_API_KEY', 'your-groq-api-key-here'),
+}
+
+DEFAULT_TEMPERATURE = 0.7
+
+
+def gemini_call_options(timeout):
+    """Per-call kwargs for Gemini: a gRPC timeout and no library-level retries"""
+    options = {'max_retries': 1}
+    if timeout is not None:
+        options['timeout'] = timeout
+    return options
+
+
+def default_call_options(timeout):
+    """Per-call kwargs understood by most provider SDKs"""
+    return {} if timeout is None else {'timeout': timeout}
+
+
+def build_gemini_client(model, api_key, temperature):
+    """Construct a Gemini chat model"""
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=api_key,
+        temperature=temperature
+    )
+
+
+def build_groq_client(model, api_key, temperature):
+    """Construct a Groq chat model"""
+    return ChatGroq(
+        groq_api_key=api_key,
+        model_name=model,
+        temperature=temperature,
+        # Retries are handled by src.services.resilience within the request deadline
+        max_retries=0
+    )
+
+
+class ProviderRegistry:
+    """Thread-safe cache of chat model clients keyed by provider, model and temperature"""
+
+    def __init__(self):
+        self._builders = {}
+        self._call_options = {}
+        self._clients = {}
+        self._constructions = {}
+        self._lock = threading.Lock()
+
+    def register(self, provider, builder, default_model=None, api_key_env=None,
+                 call_options=default_call_options):
+        """Register a builder ``builder(model, api_key, temperature)`` for a provider
+
+        ``call_options(timeout)`` returns the kwargs passed to each model call so
+        a request deadline reaches the provider SDK.
+        """
+        with self._lock:
+            self._builders[provider] = builder
+            self._call_options[provider] = call_options
+            self._constructions.setdefault(provider, 0)
+            if default_model is not None:
+                DEFAULT_MODELS[provider] = default_model
+            if api_key_env is not None:
+                API_KEY_ENV[provider] = api_key_env
+
+    def providers(self):
+        """Names of all registered providers"""
+        return list(self._builders)
+
+    def call_options(self, provider, timeout=None):
+        """Model call kwargs for a provider given the time left in the request"""
+        return self._call_options.get(provider, default_call_options)(timeout)
+
+    def get(self, provider, model=None, temperature=DEFAULT_TEMPERATURE):
+        """Return a warm client, building it on first use or after a key rotation"""
+        if provider not in self._builders:
+            raise ValueError(f"Unknown AI provider: {provider}")
+
+        model = model or DEFAULT_MODELS.get(provider)
+        api_key = _read_api_key(provider)
+        key = (provider, model, temperature)
+
+        # Fast path: dict reads are atomic, so no lock is needed for a hit
+        entry = self._clients.get(key)
+        if entry is not None and entry[0] == api_key:
+            return entry[1]
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry[0] == api_key:
+                return entry[1]
+
+            client = self._builders[provider](model, api_key, temperature)
+            self._clients[key] = (api_key, client)
+            self._constructions[provider] = self._constructions.get(provider, 0) + 1
+            return client
+
+    def clear(self):
+        """Drop every cached client; the next request rebuilds them"""
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self):
+        """Client construction counters, for confirming reuse in production"""
+        with self._lock:
+            constructions = dict(self._constructions)
+            cached = [
+                {'provider': provider, 'model': model, 'temperature': temperature}
+                for provider, model, temperature in self._clients
+            ]
+        return {
+            'constructions': constructions,
+            'total_constructions': sum(constructions.values()),
+            'cached_clients': cached
+        }
+
+
+def _read_api_key(provider):
+    env_var, placeholder = API_KEY_ENV.get(provider, (None, None))
+    if env_var is None:
+        return None
+    return os.getenv(env_var, placeholder)
+
+
+# Shared registry used by all request handlers in this process
+registry = ProviderRegistry()
+registry.register('gemini', build_gemini_client, call_options=gemini_call_options)
+registry.register('groq', build_groq_client)
+# Offline deterministic provider for benchmarks and CI; keep disabled in production
+if FAKE_LLM_ENABLED:
+    registry.register('fake', build_fake_client, default_model='fake-spiritual')
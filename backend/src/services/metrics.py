@@ -0,0 +1,120 @@
+"""
+In-process latency and streaming metrics for the AI chat endpoints.
+
+Samples are kept in fixed-size rolling windows so percentiles reflect recent
+traffic and memory stays bounded.
+"""
+import threading
+import time
+from collections import deque
+
+DEFAULT_WINDOW = 1000
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers, or None when empty"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class LatencyWindow:
+    """Thread-safe rolling window of latency samples in seconds"""
+
+    def __init__(self, size=DEFAULT_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = list(self._samples)
+        return percentile(samples, pct)
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class StreamMetrics:
+    """Time-to-first-token and tokens-per-second for streamed responses"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self._window = window
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider, ttft, tokens, duration, outcome):
+        """Record one finished stream; ``ttft`` is None if no token was sent"""
+        with self._lock:
+            entry = self._providers.get(provider)
+            if entry is None:
+                entry = self._providers[provider] = {
+                    'ttft': LatencyWindow(self._window),
+                    'tps': deque(maxlen=self._window),
+                    'outcomes': {}
+                }
+            entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+            if ttft is not None:
+                entry['ttft'].add(ttft)
+                generation = duration - ttft
+                if tokens and generation > 0:
+                    entry['tps'].append(tokens / generation)
+
+    def summary(self):
+        """Per-provider TTFT percentiles, average throughput and outcome counts"""
+        with self._lock:
+            providers = {name: (entry['ttft'], list(entry['tps']), dict(entry['outcomes']))
+                         for name, entry in self._providers.items()}
+        result = {}
+        for name, (ttft, tps, outcomes) in providers.items():
+            result[name] = {
+                'streams': sum(outcomes.values()),
+                'outcomes': outcomes,
+                'ttft_p50_ms': _ms(ttft.percentile(50)),
+                'ttft_p95_ms': _ms(ttft.percentile(95)),
+                'tokens_per_second_avg': round(sum(tps) / len(tps), 1) if tps else None
+            }
+        return result
+
+
+class StreamTimer:
+    """Tracks one stream from request start to its last token"""
+
+    def __init__(self, provider, metrics):
+        self.provider = provider
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.tokens = 0
+
+    def on_text(self, text):
+        if not text:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += estimate_tokens(text)
+
+    def finish(self, outcome):
+        now = time.perf_counter()
+        ttft = None if self.first_token_at is None else self.first_token_at - self.started
+        self.metrics.record(self.provider, ttft, self.tokens, now - self.started, outcome)
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+# Shared metrics for streamed chat responses
+stream_metrics = StreamMetrics()
@@ -0,0 +1,115 @@
+"""
+Pre-serialized JSON responses for static content.
+
+Payloads are serialized once (at startup, and again whenever the content
+changes) into bytes with a strong ETag, plus a gzip copy for larger bodies.
+Responses for large sets such as topic details are rendered on their first
+request instead and kept in a bounded LRU until the next publish.
+Serving a request is a dict lookup and a bytes write. A client that sends a
+matching If-None-Match gets a 304 with no body. Cache-Control lets browsers
+and CDNs reuse a response for CONTENT_MAX_AGE seconds and keep serving it
+while they revalidate.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+CONTENT_MAX_AGE = int(os.getenv('CONTENT_MAX_AGE', 300))
+CONTENT_STALE_WHILE_REVALIDATE = int(os.getenv('CONTENT_STALE_WHILE_REVALIDATE', 86400))
+# Responses rendered on first request (e.g. topic details) are kept up to this many
+CONTENT_RESPONSE_CACHE_SIZE = int(os.getenv('CONTENT_RESPONSE_CACHE_SIZE', 2048))
+
+# Smaller bodies are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+
+def serialize(payload):
+    """JSON bytes in the same form as Flask's jsonify (sorted keys, compact)"""
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class Prerendered:
+    """One serialized response body and its validators"""
+
+    __slots__ = ('body', 'etag', 'gzip_body', 'gzip_etag')
+
+    def __init__(self, payload):
+        self.body = serialize(payload)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = digest
+        self.gzip_body = gzip.compress(self.body, mtime=0) if len(self.body) >= GZIP_MIN_BYTES else None
+        # Each representation needs its own strong validator
+        self.gzip_etag = f"{digest}-gzip" if self.gzip_body is not None else None
+
+
+class PrerenderedResponses:
+    """Keyed set of pre-serialized responses, swapped atomically on publish"""
+
+    def __init__(self, max_age=CONTENT_MAX_AGE, stale_while_revalidate=CONTENT_STALE_WHILE_REVALIDATE,
+                 max_rendered=CONTENT_RESPONSE_CACHE_SIZE):
+        self.cache_control = f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+        self.max_rendered = max_rendered
+        self._entries = {}
+        self._rendered = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def publish(self, payloads):
+        """Serialize ``{key: payload}`` and replace every entry at once"""
+        entries = {key: Prerendered(payload) for key, payload in payloads.items()}
+        with self._lock:
+            self._entries = entries
+            self._rendered.clear()
+            self._generation += 1
+        return len(entries)
+
+    def _render(self, key, load):
+        """Entry rendered on demand from ``load()``; None when it returns None"""
+        with self._lock:
+            entry = self._rendered.get(key)
+            if entry is not None:
+                self._rendered.move_to_end(key)
+                return entry
+            generation = self._generation
+        payload = load()
+        if payload is None:
+            return None
+        entry = Prerendered(payload)
+        with self._lock:
+            # Content published meanwhile may have made this payload stale
+            if generation == self._generation:
+                self._rendered[key] = entry
+                while len(self._rendered) > self.max_rendered:
+                    self._rendered.popitem(last=False)
+        return entry
+
+    def respond(self, key, request, load=None, cache_control=None):
+        """200 with the stored body, 304 when the client's copy is current, or None for unknown keys
+
+        Keys that were not published are rendered from ``load()`` when it is given.
+        ``cache_control`` overrides the default header for this response.
+        """
+        entry = self._entries.get(key)
+        if entry is None and load is not None:
+            entry = self._render(key, load)
+        if entry is None:
+            return None
+
+        use_gzip = entry.gzip_body is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+        etag = entry.gzip_etag if use_gzip else entry.etag
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': cache_control or self.cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers)
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+            return Response(entry.gzip_body, mimetype='application/json', headers=headers)
+        return Response(entry.body, mimetype='application/json', headers=headers)
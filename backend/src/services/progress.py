@@ -0,0 +1,248 @@
+"""
+Per-user progress counters maintained incrementally from completed activities.
+
+The activity writer calls ``stage`` inside the transaction that saves each
+batch, passing only the activities that were actually inserted. Each user's
+counters are read, updated and written back in that same transaction. They
+therefore never drift from the activities table, even across retries and
+worker processes. The counters are:
+
+- completions and minutes per activity type
+- rating sums and counts, for averages
+- minutes per week (Monday start), for the last PROGRESS_WEEKS weeks
+- active days stored as runs of consecutive days, plus the longest run
+
+Days and weeks use the user's own timezone (sent with each completion), so
+a prayer at 11pm in New York counts for that evening rather than for the
+next UTC day. Completions that arrive out of order extend or merge runs
+correctly.
+
+``summary`` reads one cached row and derives the current streak by
+comparing the latest run with today in the user's timezone. It never scans
+the history.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+from src.services.activities import activity_store
+
+PROGRESS_DEFAULT_TIMEZONE = os.getenv('PROGRESS_DEFAULT_TIMEZONE', 'UTC')
+PROGRESS_WEEKS = int(os.getenv('PROGRESS_WEEKS', 12))
+# Summaries are cached per user; other worker processes' updates show up after this long
+PROGRESS_CACHE_TTL = float(os.getenv('PROGRESS_CACHE_TTL', 5))
+PROGRESS_CACHE_SIZE = int(os.getenv('PROGRESS_CACHE_SIZE', 10000))
+
+# Oldest runs of active days are dropped beyond this many (the longest streak is kept)
+MAX_RUNS = 64
+ACTIVITY_TYPES = ('devotion', 'prayer', 'meditation', 'accountability')
+
+
+def user_timezone(name):
+    """ZoneInfo for an IANA name, falling back to the default for unknown names"""
+    try:
+        return ZoneInfo(name or PROGRESS_DEFAULT_TIMEZONE)
+    except (ValueError, KeyError, OSError):
+        return ZoneInfo(PROGRESS_DEFAULT_TIMEZONE)
+
+
+def local_day(timestamp, tz):
+    """Ordinal of the calendar day an ISO timestamp falls on in ``tz``"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(tz).date().toordinal()
+
+
+def empty_state():
+    return {'timezone': PROGRESS_DEFAULT_TIMEZONE, 'totals': {}, 'minutes': {}, 'ratings': {},
+            'weeks': {}, 'runs': [], 'longest_streak': 0, 'last_activity': None}
+
+
+def add_day(state, day):
+    """Mark ``day`` active, extending or merging the runs of consecutive days"""
+    runs = state['runs']
+    # Runs are sorted, non-overlapping [first, last] day ordinals
+    index = len(runs)
+    while index > 0 and runs[index - 1][0] > day:
+        index -= 1
+    if index > 0 and runs[index - 1][1] >= day:
+        return  # Already active that day
+    joins_previous = index > 0 and runs[index - 1][1] == day - 1
+    joins_next = index < len(runs) and runs[index][0] == day + 1
+    if joins_previous and joins_next:
+        runs[index - 1][1] = runs.pop(index)[1]
+        run = runs[index - 1]
+    elif joins_previous:
+        runs[index - 1][1] = day
+        run = runs[index - 1]
+    elif joins_next:
+        runs[index][0] = day
+        run = runs[index]
+    else:
+        run = [day, day]
+        runs.insert(index, run)
+    state['longest_streak'] = max(state['longest_streak'], run[1] - run[0] + 1)
+    del runs[:-MAX_RUNS]
+
+
+def apply_activity(state, activity):
+    """Fold one completed activity into a user's counters"""
+    tz = user_timezone(activity.get('timezone') or state['timezone'])
+    if activity.get('timezone'):
+        state['timezone'] = tz.key
+    kind = activity['type']
+    try:
+        minutes = max(0.0, float(activity.get('duration') or 0))
+    except (TypeError, ValueError):
+        minutes = 0.0
+    state['totals'][kind] = state['totals'].get(kind, 0) + 1
+    state['minutes'][kind] = state['minutes'].get(kind, 0) + minutes
+
+    rating = activity.get('rating')
+    if isinstance(rating, (int, float)) and not isinstance(rating, bool):
+        total, count = state['ratings'].get(kind, (0, 0))
+        state['ratings'][kind] = (total + rating, count + 1)
+
+    day = local_day(activity['timestamp'], tz)
+    week = str(day - date.fromordinal(day).weekday())
+    state['weeks'][week] = state['weeks'].get(week, 0) + minutes
+    if len(state['weeks']) > PROGRESS_WEEKS:
+        for old in sorted(state['weeks'], key=int)[:-PROGRESS_WEEKS]:
+            del state['weeks'][old]
+
+    add_day(state, day)
+    if state['last_activity'] is None or activity['timestamp'] > state['last_activity']:
+        state['last_activity'] = activity['timestamp']
+
+
+def summarize(state, today):
+    """Dashboard payload from a user's counters; ``today`` is a day ordinal"""
+    runs = state['runs']
+    last_run = runs[-1] if runs else None
+    # Like the app, a streak is still alive if the last active day was yesterday
+    current = last_run[1] - last_run[0] + 1 if last_run and last_run[1] >= today - 1 else 0
+    this_week = today - date.fromordinal(today).weekday()
+    weeks = [{'week_start': date.fromordinal(this_week - 7 * i).isoformat(),
+              'minutes': round(state['weeks'].get(str(this_week - 7 * i), 0), 1)}
+             for i in range(PROGRESS_WEEKS)]
+    totals = {kind: state['totals'].get(kind, 0) for kind in ACTIVITY_TYPES}
+    totals.update(state['totals'])
+    return {
+        'devotions': totals['devotion'],
+        'prayers': totals['prayer'],
+        'meditations': totals['meditation'],
+        'accountability': totals['accountability'],
+        'totals_by_type': totals,
+        'total_sessions': sum(totals.values()),
+        'total_minutes': round(sum(state['minutes'].values()), 1),
+        'minutes_by_type': {kind: round(m, 1) for kind, m in state['minutes'].items()},
+        'current_streak': current,
+        'longest_streak': state['longest_streak'],
+        'weekly_minutes': weeks,
+        'this_week_minutes': weeks[0]['minutes'],
+        'rating_averages': {kind: round(total / count, 2) for kind, (total, count) in state['ratings'].items()},
+        'last_activity': state['last_activity'],
+        'timezone': state['timezone'],
+        'today': date.fromordinal(today).isoformat()
+    }
+
+
+def _create_table(db):
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS progress ('
+        'user_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)'
+    )
+
+
+class ProgressStore:
+    """Materialized per-user progress, updated in the activity writer's transactions"""
+
+    def __init__(self, activities=activity_store, cache_ttl=PROGRESS_CACHE_TTL, cache_size=PROGRESS_CACHE_SIZE):
+        self.activities = activities
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._staged = {}
+        self._reader = None
+        self._lock = threading.Lock()
+        self._stats = {'updates': 0, 'reads': 0, 'cache_hits': 0}
+        activities.on_write(self.stage, self.committed)
+
+    def stage(self, db, inserted):
+        """Apply newly inserted activities to their users' rows (inside the write transaction)"""
+        _create_table(db)
+        states = {}
+        for activity in inserted:
+            user_id = activity.get('user_id', '')
+            if user_id not in states:
+                row = db.execute('SELECT state FROM progress WHERE user_id = ?', (user_id,)).fetchone()
+                states[user_id] = json.loads(row[0]) if row else empty_state()
+            apply_activity(states[user_id], activity)
+        now = time.time()
+        db.executemany('INSERT OR REPLACE INTO progress (user_id, state, updated_at) VALUES (?, ?, ?)',
+                       [(user_id, json.dumps(state), now) for user_id, state in states.items()])
+        # Replaces anything staged by an attempt that was rolled back
+        self._staged = states
+
+    def committed(self):
+        staged, self._staged = self._staged, {}
+        now = time.monotonic()
+        with self._lock:
+            self._stats['updates'] += len(staged)
+            for user_id, state in staged.items():
+                self._cache[user_id] = (now, state)
+                self._cache.move_to_end(user_id)
+            self._evict()
+
+    def state(self, user_id):
+        """A user's counters (cached), or an empty state for new users"""
+        now = time.monotonic()
+        with self._lock:
+            self._stats['reads'] += 1
+            entry = self._cache.get(user_id)
+            if entry is not None and now - entry[0] < self.cache_ttl:
+                self._cache.move_to_end(user_id)
+                self._stats['cache_hits'] += 1
+                return entry[1]
+        state = self._load(user_id)
+        with self._lock:
+            self._cache[user_id] = (now, state)
+            self._evict()
+        return state
+
+    def summary(self, user_id, tz_name=None, wait=0.5):
+        """Progress for the dashboard; waits briefly for this user's queued completions"""
+        if wait and self.activities.pending_for(user_id):
+            self.activities.flush(wait)
+        state = self.state(user_id)
+        tz = user_timezone(tz_name or state['timezone'])
+        return summarize(state, datetime.now(tz).date().toordinal())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_users'] = len(self._cache)
+        return stats
+
+    def _load(self, user_id):
+        with self._lock:
+            # One read connection per process; a forked worker opens its own
+            if self._reader is None or self._reader[0] != os.getpid():
+                db = self.activities._connect()
+                _create_table(db)
+                self._reader = (os.getpid(), db)
+            row = self._reader[1].execute('SELECT state FROM progress WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else empty_state()
+
+    def _evict(self):
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+# Shared progress counters, fed by the shared activity store's writer
+progress_store = ProgressStore()
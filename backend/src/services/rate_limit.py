@@ -0,0 +1,352 @@
+"""
+Per-client rate limiting and admission control for the AI endpoints.
+
+Every client has a token bucket holding RATE_LIMIT_BURST tokens. It refills
+at RATE_LIMIT_PER_MINUTE. An AI request spends one token; a batch spends one
+per item, up to the whole bucket. When the bucket is empty the request gets
+an immediate 429, with Retry-After set to when enough tokens will be back.
+
+A request that passes then needs an in-flight slot. There are
+ADMISSION_MAX_INFLIGHT slots; a batch takes one per concurrent item. When
+every slot is busy the request waits up to ADMISSION_QUEUE_TIMEOUT seconds
+in a queue of at most ADMISSION_QUEUE_SIZE. A full queue or a wait that
+runs out is also a 429, so overload is shed quickly instead of piling up on
+the providers.
+
+State lives in memory by default. Set RATE_LIMIT_DB to a SQLite file and
+every worker process on the host shares the same buckets and slots. Slots
+are leases that expire after ADMISSION_SLOT_LEASE seconds, so a worker that
+crashes cannot hold them forever. The async entry points (``acheck``,
+``aadmit``, ``arelease``) run SQLite calls in a worker thread, so a locked
+database never blocks the event loop.
+
+Behind a reverse proxy, set RATE_LIMIT_TRUST_PROXY. The client address is
+then the X-Forwarded-For entry appended by the outermost trusted proxy,
+RATE_LIMIT_PROXY_HOPS entries from the right. Entries further left come
+from the client and are ignored.
+"""
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from src.services.batch import BATCH_DEFAULT_CONCURRENCY
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', 30))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 10))
+# 'ip', or 'user' to key buckets by X-User-Id (only behind a gateway that sets it)
+RATE_LIMIT_KEY = os.getenv('RATE_LIMIT_KEY', 'ip')
+# Off by default: without a proxy in front, X-Forwarded-For is whatever the client sends.
+# Behind a proxy, leave it off and every client shares the proxy's address (and bucket).
+RATE_LIMIT_TRUST_PROXY = os.getenv('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true'
+# How many trusted proxies append to X-Forwarded-For (Railway's edge is one)
+RATE_LIMIT_PROXY_HOPS = max(1, int(os.getenv('RATE_LIMIT_PROXY_HOPS', 1)))
+ADMISSION_MAX_INFLIGHT = int(os.getenv('ADMISSION_MAX_INFLIGHT', 32))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2.0))
+ADMISSION_SLOT_LEASE = float(os.getenv('ADMISSION_SLOT_LEASE', 300))
+
+# Queued requests re-check for free slots this often (slots may be freed by other workers)
+POLL_SECONDS = 0.05
+# Idle buckets are dropped once this many are tracked
+MAX_BUCKETS = 10000
+
+# POST endpoints that reach an LLM provider
+LIMITED_PATHS = frozenset((
+    '/api/chat', '/api/chat/stream', '/api/chat/batch', '/api/chat/scripture', '/api/chat/scripture/stream'
+))
+
+
+class RateLimited(Exception):
+    """Raised when a request is over its client's rate or cannot get an in-flight slot"""
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        messages = {
+            'rate_limit': 'Rate limit exceeded',
+            'queue_full': 'Server is busy',
+            'queue_timeout': 'Server is busy'
+        }
+        super().__init__(f"{messages.get(reason, 'Too many requests')}; retry in {self.retry_after} seconds")
+
+
+def client_id(headers, remote_addr):
+    """Bucket key for a request: the user when configured, otherwise the client IP"""
+    if RATE_LIMIT_KEY == 'user' and headers.get('X-User-Id'):
+        return f"user:{headers.get('X-User-Id')}"
+    if RATE_LIMIT_TRUST_PROXY and headers.get('X-Forwarded-For'):
+        # Only the entries our own proxies appended (the right-most ones) can be trusted
+        forwarded = [entry.strip() for entry in headers.get('X-Forwarded-For').split(',')]
+        if len(forwarded) >= RATE_LIMIT_PROXY_HOPS and forwarded[-RATE_LIMIT_PROXY_HOPS]:
+            return f"ip:{forwarded[-RATE_LIMIT_PROXY_HOPS]}"
+    return f"ip:{remote_addr or 'unknown'}"
+
+
+def request_cost(method, path, data):
+    """``(tokens, slots)`` a request needs, or None for requests that are not limited"""
+    if method != 'POST' or path.rstrip('/') not in LIMITED_PATHS:
+        return None
+    if path.rstrip('/') == '/api/chat/batch':
+        items = (data or {}).get('items') if isinstance(data, dict) else None
+        count = len(items) if isinstance(items, list) and items else 1
+        try:
+            concurrency = int(data.get('max_concurrency', BATCH_DEFAULT_CONCURRENCY))
+        except (AttributeError, TypeError, ValueError):
+            concurrency = BATCH_DEFAULT_CONCURRENCY
+        return count, max(1, min(count, concurrency))
+    return 1, 1
+
+
+def _refill(tokens, updated, now, rate, burst, cost):
+    """Token bucket step; returns (tokens_left, seconds_until_allowed)"""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBackend:
+    """Limiter state for a single process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, wait = _refill(tokens, updated, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > MAX_BUCKETS:
+                idle = now - burst / rate
+                self._buckets = {k: v for k, v in self._buckets.items() if v[1] > idle}
+            return wait
+
+    def acquire(self, token, weight, limit, lease, now):
+        with self._lock:
+            self._slots = {t: s for t, s in self._slots.items() if s[1] > now}
+            if sum(w for w, _ in self._slots.values()) + weight > limit:
+                return False
+            self._slots[token] = (weight, now + lease)
+            return True
+
+    def release(self, token):
+        with self._lock:
+            self._slots.pop(token, None)
+
+    def inflight(self, now):
+        with self._lock:
+            return sum(w for w, expires in self._slots.values() if expires > now)
+
+
+class SQLiteBackend:
+    """Limiter state in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._takes = 0
+        self._db = None
+
+    def _connect(self):
+        # One connection per process; a forked worker opens its own (expects self._lock to be held)
+        if self._db is None or self._db[0] != os.getpid():
+            db = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS rate_buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS inflight_slots ('
+                'token TEXT PRIMARY KEY, weight INTEGER NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._db = (os.getpid(), db)
+        return self._db[1]
+
+    def _transaction(self, fn):
+        """Run ``fn(db)`` inside a write transaction"""
+        with self._lock:
+            db = self._connect()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(db)
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+            return result
+
+    def take(self, key, rate, burst, cost, now):
+        def step(db):
+            row = db.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, wait = _refill(row[0] if row else burst, row[1] if row else now, now, rate, burst, cost)
+            db.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                       (key, tokens, now))
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                db.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - burst / rate,))
+            return wait
+        return self._transaction(step)
+
+    def acquire(self, token, weight, limit, lease, now):
+        def step(db):
+            db.execute('DELETE FROM inflight_slots WHERE expires_at <= ?', (now,))
+            used = db.execute('SELECT COALESCE(SUM(weight), 0) FROM inflight_slots').fetchone()[0]
+            if used + weight > limit:
+                return False
+            db.execute('INSERT INTO inflight_slots (token, weight, expires_at) VALUES (?, ?, ?)',
+                       (token, weight, now + lease))
+            return True
+        return self._transaction(step)
+
+    def release(self, token):
+        self._transaction(lambda db: db.execute('DELETE FROM inflight_slots WHERE token = ?', (token,)))
+
+    def inflight(self, now):
+        with self._lock:
+            return self._connect().execute(
+                'SELECT COALESCE(SUM(weight), 0) FROM inflight_slots WHERE expires_at > ?', (now,)
+            ).fetchone()[0]
+
+
+class RateLimiter:
+    """Token buckets per client plus a global in-flight cap with a bounded wait queue"""
+
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST,
+                 max_inflight=ADMISSION_MAX_INFLIGHT, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, lease_seconds=ADMISSION_SLOT_LEASE,
+                 db_path=None, enabled=True):
+        self.enabled = enabled
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.lease_seconds = lease_seconds
+        self.backend = SQLiteBackend(db_path) if db_path else MemoryBackend()
+        self._freed = threading.Condition()
+        self._waiting = 0
+        self._stats = {'allowed': 0, 'rate_limited': 0, 'admitted': 0, 'queued': 0,
+                       'queue_full': 0, 'queue_timeout': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def check(self, client, cost=1):
+        """Spend ``cost`` tokens from the client's bucket or raise RateLimited"""
+        wait = self.backend.take(client, self.rate, self.burst, min(cost, self.burst), time.time())
+        if wait > 0:
+            self._count('rate_limited')
+            raise RateLimited('rate_limit', wait)
+        self._count('allowed')
+
+    async def acheck(self, client, cost=1):
+        """Async ``check``; a shared SQLite backend is called from a worker thread"""
+        await self._offload(self.check, client, cost)
+
+    def _try_acquire(self, token, weight):
+        return self.backend.acquire(token, weight, self.max_inflight, self.lease_seconds, time.time())
+
+    async def _offload(self, fn, *args):
+        # SQLite may wait on another process's lock; keep that off the event loop
+        if isinstance(self.backend, SQLiteBackend):
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _enqueue(self):
+        """Join the wait queue, or raise RateLimited when it is full"""
+        with self._freed:
+            if self._waiting >= self.queue_size:
+                self._count('queue_full')
+                raise RateLimited('queue_full', self.queue_timeout)
+            self._waiting += 1
+        self._count('queued')
+
+    def _dequeue(self):
+        with self._freed:
+            self._waiting -= 1
+
+    def admit(self, weight=1):
+        """Take an in-flight slot, waiting briefly in the queue; returns the slot token"""
+        token = uuid.uuid4().hex
+        weight = max(1, min(weight, self.max_inflight))
+        if not self._try_acquire(token, weight):
+            self._enqueue()
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while not self._try_acquire(token, weight):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._count('queue_timeout')
+                        raise RateLimited('queue_timeout', self.queue_timeout)
+                    with self._freed:
+                        self._freed.wait(min(remaining, POLL_SECONDS))
+            finally:
+                self._dequeue()
+        self._count('admitted')
+        return token
+
+    def try_admit(self, weight=1):
+        """Take an in-flight slot only if one is free right now; returns its token or None"""
+        token = uuid.uuid4().hex
+        if self._try_acquire(token, max(1, min(weight, self.max_inflight))):
+            self._count('admitted')
+            return token
+        return None
+
+    async def aadmit(self, weight=1):
+        """Async twin of ``admit`` that waits without holding a thread"""
+        token = uuid.uuid4().hex
+        weight = max(1, min(weight, self.max_inflight))
+        if not await self._offload(self._try_acquire, token, weight):
+            self._enqueue()
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while not await self._offload(self._try_acquire, token, weight):
+                    if deadline - time.monotonic() <= 0:
+                        self._count('queue_timeout')
+                        raise RateLimited('queue_timeout', self.queue_timeout)
+                    await asyncio.sleep(POLL_SECONDS)
+            finally:
+                self._dequeue()
+        self._count('admitted')
+        return token
+
+    def release(self, token):
+        """Return a slot (safe to call more than once)"""
+        self.backend.release(token)
+        with self._freed:
+            self._freed.notify()
+
+    async def arelease(self, token):
+        """Async ``release``"""
+        await self._offload(self.release, token)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._freed:
+            stats['waiting'] = self._waiting
+        stats.update(
+            enabled=self.enabled,
+            inflight=self.backend.inflight(time.time()),
+            max_inflight=self.max_inflight,
+            queue_size=self.queue_size,
+            per_minute=round(self.rate * 60, 2),
+            burst=self.burst,
+            shared=isinstance(self.backend, SQLiteBackend)
+        )
+        return stats
+
+
+# Shared limiter for the AI endpoints, configured from the environment
+rate_limiter = RateLimiter(db_path=os.getenv('RATE_LIMIT_DB') or None, enabled=RATE_LIMIT_ENABLED)
@@ -0,0 +1,175 @@
+"""
+Compact recurrence rules for scheduled spiritual programs.
+
+A program is stored and sent as one RFC 5545 style rule, such as
+``FREQ=DAILY;COUNT=30`` with a start time and a session length. It is not
+stored as one event per day. Occurrences are computed only for the window
+a caller asks for. The first and last occurrence in the window come from
+arithmetic on the day offset, so a 365-day program costs the same as a
+7-day one.
+
+Only the forms the app schedules are supported: FREQ=DAILY with an
+optional INTERVAL, ending after COUNT occurrences or on an UNTIL date.
+"""
+import os
+from datetime import date, datetime, timedelta
+
+# Occurrences expanded by default when no window is given
+RECURRENCE_EXPAND_DAYS = int(os.getenv('RECURRENCE_EXPAND_DAYS', 31))
+# Largest window a single request may expand
+RECURRENCE_MAX_WINDOW_DAYS = int(os.getenv('RECURRENCE_MAX_WINDOW_DAYS', 366))
+
+
+class RecurrenceError(ValueError):
+    """Raised for rules or windows that cannot be expanded"""
+
+
+def _parse_date(value, field):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        raise RecurrenceError(f"{field} must be a date (YYYY-MM-DD)")
+
+
+class Recurrence:
+    """A daily rule: first occurrence, step in days, and how many occurrences"""
+
+    __slots__ = ('start', 'interval', 'count', 'duration', 'timezone')
+
+    def __init__(self, start, count, interval=1, duration=30, timezone=None):
+        if interval < 1:
+            raise RecurrenceError('INTERVAL must be at least 1')
+        if count < 0:
+            raise RecurrenceError('COUNT must not be negative')
+        self.start = start
+        self.interval = interval
+        self.count = count
+        self.duration = duration
+        self.timezone = timezone
+
+    @classmethod
+    def daily(cls, start_date, time_str, days, duration=30, timezone=None):
+        """One occurrence a day at ``time_str`` (HH:MM) for ``days`` days"""
+        # Parsed first: a bad date raises its own RecurrenceError, not the time message below
+        day = _parse_date(start_date, 'start_date')
+        try:
+            hour, minute = map(int, str(time_str).split(':'))
+            start = datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute)
+        except ValueError:
+            raise RecurrenceError('time must be HH:MM')
+        return cls(start, int(days), 1, duration, timezone)
+
+    @classmethod
+    def parse(cls, rrule, dtstart, duration=30, timezone=None):
+        """Rule from an ``RRULE`` string (with or without the prefix) and a start datetime"""
+        try:
+            start = datetime.fromisoformat(str(dtstart))
+        except ValueError:
+            raise RecurrenceError('dtstart must be an ISO datetime')
+        parts = {}
+        for part in str(rrule).upper().removeprefix('RRULE:').split(';'):
+            if part:
+                key, _, value = part.partition('=')
+                parts[key] = value
+        if parts.get('FREQ') != 'DAILY':
+            raise RecurrenceError('Only FREQ=DAILY rules are supported')
+        unknown = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL'}
+        if unknown:
+            raise RecurrenceError(f"Unsupported rule parts: {', '.join(sorted(unknown))}")
+        try:
+            interval = int(parts.get('INTERVAL', 1))
+        except ValueError:
+            raise RecurrenceError('INTERVAL must be an integer')
+        if 'COUNT' in parts:
+            try:
+                count = int(parts['COUNT'])
+            except ValueError:
+                raise RecurrenceError('COUNT must be an integer')
+        elif 'UNTIL' in parts:
+            until = parts['UNTIL']
+            until = _parse_date(f"{until[:4]}-{until[4:6]}-{until[6:8]}" if '-' not in until else until, 'UNTIL')
+            count = max(0, (until - start.date()).days // max(1, interval) + 1)
+        else:
+            raise RecurrenceError('Rules must end with COUNT or UNTIL')
+        return cls(start, count, interval, duration, timezone)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rule from the compact form returned by ``to_dict``"""
+        if not isinstance(data, dict) or 'rrule' not in data or 'dtstart' not in data:
+            raise RecurrenceError('recurrence needs rrule and dtstart')
+        return cls.parse(data['rrule'], data['dtstart'], data.get('duration', 30), data.get('timezone'))
+
+    def rrule(self):
+        parts = ['FREQ=DAILY']
+        if self.interval != 1:
+            parts.append(f'INTERVAL={self.interval}')
+        parts.append(f'COUNT={self.count}')
+        return ';'.join(parts)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def last(self):
+        """Datetime of the final occurrence, or None for an empty rule"""
+        if not self.count:
+            return None
+        return self.start + timedelta(days=(self.count - 1) * self.interval)
+
+    def to_dict(self):
+        last = self.last
+        return {
+            'rrule': self.rrule(),
+            'dtstart': self.start.isoformat(timespec='minutes'),
+            'until': last.date().isoformat() if last else None,
+            'count': self.count,
+            'duration': self.duration,
+            'timezone': self.timezone
+        }
+
+    def _index_range(self, window_start, window_end):
+        """First and one-past-last occurrence index falling on days in [window_start, window_end]"""
+        first_day = self.start.date()
+        first = max(0, -(-(window_start - first_day).days // self.interval))
+        stop = min(self.count, (window_end - first_day).days // self.interval + 1)
+        return first, max(first, stop)
+
+    def occurrences(self, window_start=None, window_end=None):
+        """Occurrence datetimes on days from ``window_start`` to ``window_end`` (inclusive), lazily"""
+        window_start = window_start or self.start.date()
+        window_end = window_end or window_start + timedelta(days=RECURRENCE_EXPAND_DAYS - 1)
+        first, stop = self._index_range(window_start, window_end)
+        step = timedelta(days=self.interval)
+        current = self.start + step * first
+        for _ in range(first, stop):
+            yield current
+            current += step
+
+    def count_between(self, window_start, window_end):
+        first, stop = self._index_range(window_start, window_end)
+        return stop - first
+
+    def next_after(self, day):
+        """Date of the first occurrence after ``day``, or None"""
+        first, _ = self._index_range(day + timedelta(days=1), day + timedelta(days=1))
+        if first >= self.count:
+            return None
+        return (self.start + timedelta(days=first * self.interval)).date()
+
+
+def expansion_window(recurrence, start=None, end=None):
+    """Validated ``(start, end)`` dates for expanding ``recurrence``"""
+    window_start = _parse_date(start, 'start') if start else recurrence.start.date()
+    window_end = _parse_date(end, 'end') if end else window_start + timedelta(days=RECURRENCE_EXPAND_DAYS - 1)
+    if window_end < window_start:
+        raise RecurrenceError('end must not be before start')
+    if (window_end - window_start).days >= RECURRENCE_MAX_WINDOW_DAYS:
+        raise RecurrenceError(f'Windows are limited to {RECURRENCE_MAX_WINDOW_DAYS} days')
+    return window_start, window_end
+
+
+def expand_requested(args, data):
+    """False when the client asked for the compact rule only (``?expand=false`` or ``"expand": false``)"""
+    expand = args.get('expand', data.get('expand', True))
+    return str(expand).lower() not in ('false', '0', 'no')
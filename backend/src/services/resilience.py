@@ -0,0 +1,382 @@
+"""
+Circuit breakers, deadlines and bounded retries around provider calls.
+
+Each provider has a circuit breaker (closed -> open -> half-open). After
+CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit opens and calls
+fail immediately with CircuitOpenError for CIRCUIT_RESET_SECONDS. After that a
+limited number of probe calls are let through; one success closes the circuit
+again and a failure re-opens it. A probe that ends any other way (a
+non-retryable error, or cancellation) gives its slot back, so the circuit
+cannot get stuck half-open.
+
+Every request carries a Deadline. The remaining time is passed to the
+provider SDK as its timeout, and retries (with jittered exponential backoff)
+stop as soon as the next attempt would not fit inside the deadline.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from tenacity import (AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt,
+                      stop_before_delay, wait_random_exponential)
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', 30))
+CIRCUIT_HALF_OPEN_CALLS = int(os.getenv('CIRCUIT_HALF_OPEN_CALLS', 1))
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', 30))
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', 3))
+RETRY_BASE_SECONDS = float(os.getenv('LLM_RETRY_BASE_SECONDS', 0.25))
+RETRY_MAX_SECONDS = float(os.getenv('LLM_RETRY_MAX_SECONDS', 2.0))
+
+# Attempts are not started with less time than this left on the deadline
+MIN_ATTEMPT_SECONDS = 0.5
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit is open"""
+
+    def __init__(self, provider, retry_after):
+        self.provider = provider
+        self.retry_after = max(1, int(round(retry_after)))
+        super().__init__(
+            f"{provider} is temporarily unavailable; retry in {self.retry_after} seconds"
+        )
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time before the provider answers"""
+
+    def __init__(self, provider, seconds):
+        self.provider = provider
+        super().__init__(f"{provider} did not respond within {seconds:.1f} seconds")
+
+
+class Deadline:
+    """Absolute point in time by which a request must finish"""
+
+    def __init__(self, seconds=None):
+        self.seconds = LLM_DEADLINE_SECONDS if seconds is None else seconds
+        self.expires_at = time.monotonic() + self.seconds
+
+    @classmethod
+    def from_request(cls, data):
+        """Deadline from an optional ``deadline_ms`` field, capped at the server default"""
+        try:
+            requested = float((data or {}).get('deadline_ms')) / 1000.0
+        except (TypeError, ValueError):
+            return cls()
+        return cls(min(max(requested, MIN_ATTEMPT_SECONDS), LLM_DEADLINE_SECONDS))
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker for one provider"""
+
+    def __init__(self, provider, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds=CIRCUIT_RESET_SECONDS, half_open_calls=CIRCUIT_HALF_OPEN_CALLS):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_calls = half_open_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        # Bumped whenever the probe slots are reset, so late releases are ignored
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'rejected': 0, 'opened': 0, 'successes': 0, 'failures': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def allows(self):
+        """True if a call would currently be let through (does not reserve a probe)"""
+        with self._lock:
+            self._refresh()
+            return self._state == CLOSED or (
+                self._state == HALF_OPEN and self._probes < self.half_open_calls)
+
+    def check(self):
+        """Raise CircuitOpenError if a call would be rejected (does not reserve a probe)"""
+        if not self.allows():
+            with self._lock:
+                self._stats['rejected'] += 1
+                retry_after = self._opened_at + self.reset_seconds - time.monotonic()
+            raise CircuitOpenError(self.provider, retry_after)
+
+    def before_call(self):
+        """Reserve permission for a call or raise CircuitOpenError
+
+        Returns a probe ticket while half-open (None while closed). Hand it to
+        ``release`` once the call is over.
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return None
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return self._generation
+            self._stats['rejected'] += 1
+            retry_after = self._opened_at + self.reset_seconds - time.monotonic()
+        raise CircuitOpenError(self.provider, retry_after)
+
+    def release(self, probe):
+        """Give back a probe slot whose call neither succeeded nor failed (no-op otherwise)"""
+        if probe is None:
+            return
+        with self._lock:
+            if probe == self._generation and self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            self._failures = 0
+            self._reset_probes()
+            self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats['opened'] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._reset_probes()
+
+    def snapshot(self):
+        with self._lock:
+            self._refresh()
+            snapshot = dict(self._stats)
+            snapshot['state'] = self._state
+            snapshot['consecutive_failures'] = self._failures
+        return snapshot
+
+    def _refresh(self):
+        # Expects self._lock to be held
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._reset_probes()
+
+    def _reset_probes(self):
+        # Expects self._lock to be held
+        self._probes = 0
+        self._generation += 1
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """The shared circuit breaker for a provider"""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(provider, CircuitBreaker(provider))
+    return breaker
+
+
+def breaker_summary():
+    """State and counters of every provider's circuit breaker"""
+    return {provider: breaker.snapshot() for provider, breaker in list(_breakers.items())}
+
+
+def is_retryable(exc):
+    """Transient provider failures: timeouts, connection errors, 429 and 5xx"""
+    if isinstance(exc, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        code = getattr(exc, 'code', None)
+        status = code if isinstance(code, int) else None
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(exc).__name__
+    return any(marker in name for marker in (
+        'Timeout', 'Connection', 'Unavailable', 'ResourceExhausted',
+        'InternalServerError', 'DeadlineExceeded', 'ServerError'))
+
+
+def _raise_if_out_of_time(provider, deadline, exc):
+    """Report a transient failure that used up the deadline as DeadlineExceeded"""
+    if is_retryable(exc) and deadline.remaining() < MIN_ATTEMPT_SECONDS:
+        raise DeadlineExceeded(provider, deadline.seconds) from exc
+
+
+def _retrying_kwargs(deadline):
+    return dict(
+        stop=stop_after_attempt(LLM_MAX_ATTEMPTS)
+        | stop_before_delay(max(0.0, deadline.remaining() - MIN_ATTEMPT_SECONDS)),
+        wait=wait_random_exponential(multiplier=RETRY_BASE_SECONDS, max=RETRY_MAX_SECONDS),
+        retry=retry_if_exception(is_retryable),
+        reraise=True
+    )
+
+
+async def _within(awaitable, seconds):
+    """``(True, result)``, or ``(False, None)`` if ``seconds`` ran out first
+
+    Unlike ``wait_for``, a TimeoutError raised by the provider itself comes
+    through unchanged (and is retried), rather than reading as our deadline.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait((task,), timeout=seconds)
+    finally:
+        if not task.done():
+            task.cancel()
+    if not done:
+        return False, None
+    return True, task.result()
+
+
+def call_with_resilience(provider, fn, deadline=None):
+    """Call ``fn(timeout)`` through the provider's breaker with bounded retries
+
+    ``timeout`` is the time left on the deadline and should be handed to the
+    provider SDK so the call itself cannot outlive the request.
+    """
+    deadline = deadline or Deadline()
+    breaker = get_breaker(provider)
+    try:
+        for attempt in Retrying(**_retrying_kwargs(deadline)):
+            with attempt:
+                if deadline.expired():
+                    raise DeadlineExceeded(provider, deadline.seconds)
+                probe = breaker.before_call()
+                try:
+                    result = fn(deadline.remaining())
+                except Exception as e:
+                    if is_retryable(e):
+                        breaker.record_failure()
+                    raise
+                else:
+                    breaker.record_success()
+                    return result
+                finally:
+                    # Frees the probe after a non-retryable error; a no-op once recorded
+                    breaker.release(probe)
+    except Exception as e:
+        _raise_if_out_of_time(provider, deadline, e)
+        raise
+
+
+async def acall_with_resilience(provider, coro_fn, deadline=None):
+    """Async counterpart of call_with_resilience(); the deadline is enforced by cancelling the call
+
+    Acquire any local concurrency slot before calling this, so time spent
+    queueing is never recorded against the provider.
+    """
+    deadline = deadline or Deadline()
+    breaker = get_breaker(provider)
+    async for attempt in AsyncRetrying(**_retrying_kwargs(deadline)):
+        with attempt:
+            if deadline.expired():
+                raise DeadlineExceeded(provider, deadline.seconds)
+            probe = breaker.before_call()
+            try:
+                finished, result = await _within(coro_fn(deadline.remaining()), deadline.remaining())
+                if not finished:
+                    # The provider itself used up the deadline
+                    breaker.record_failure()
+                    raise DeadlineExceeded(provider, deadline.seconds)
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+                return result
+            finally:
+                # Frees the probe after a non-retryable error or cancellation (e.g. a losing hedge)
+                breaker.release(probe)
+
+
+def resilient_stream(provider, open_stream, deadline=None):
+    """Stream from ``open_stream(timeout)`` with breaker and retries before the first chunk
+
+    Once a chunk has been yielded the stream is committed and errors propagate.
+    """
+    deadline = deadline or Deadline()
+    breaker = get_breaker(provider)
+    try:
+        for attempt in Retrying(**_retrying_kwargs(deadline)):
+            with attempt:
+                if deadline.expired():
+                    raise DeadlineExceeded(provider, deadline.seconds)
+                probe = breaker.before_call()
+                try:
+                    upstream = iter(open_stream(deadline.remaining()))
+                    first = next(upstream)
+                except StopIteration:
+                    breaker.record_success()
+                    return
+                except Exception as e:
+                    if is_retryable(e):
+                        breaker.record_failure()
+                    raise
+                else:
+                    breaker.record_success()
+                finally:
+                    breaker.release(probe)
+    except Exception as e:
+        _raise_if_out_of_time(provider, deadline, e)
+        raise
+    try:
+        yield first
+        yield from upstream
+    finally:
+        if hasattr(upstream, 'close'):
+            upstream.close()
+
+
+async def aresilient_stream(provider, open_stream, deadline=None):
+    """Async counterpart of resilient_stream()"""
+    deadline = deadline or Deadline()
+    breaker = get_breaker(provider)
+    async for attempt in AsyncRetrying(**_retrying_kwargs(deadline)):
+        with attempt:
+            if deadline.expired():
+                raise DeadlineExceeded(provider, deadline.seconds)
+            probe = breaker.before_call()
+            try:
+                upstream = open_stream(deadline.remaining())
+                finished, first = await _within(upstream.__anext__(), deadline.remaining())
+                if not finished:
+                    breaker.record_failure()
+                    raise DeadlineExceeded(provider, deadline.seconds)
+            except StopAsyncIteration:
+                breaker.record_success()
+                return
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+            finally:
+                breaker.release(probe)
+    try:
+        yield first
+        async for chunk in upstream:
+            yield chunk
+    finally:
+        await upstream.aclose()
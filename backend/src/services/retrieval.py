@@ -0,0 +1,272 @@
+"""
+BM25 retrieval over curated spiritual content and the verse corpus.
+
+The index is built once at startup. It covers every curated topic
+(devotions, prayers, meditations and accountability areas) and every verse
+in the bundled corpus. Postings are stored as a term-major sparse matrix: an
+``indptr`` array into parallel ``doc_ids``/``weights`` arrays holding
+precomputed BM25 term weights. Scoring a query is a few array slices and one
+``np.bincount``.
+
+Scores are normalized by the best score the query could reach (every term
+saturated), giving a 0-1 confidence. When the best curated topic clears
+``RETRIEVAL_THRESHOLD``, ``/chat/scripture`` answers from that topic, with
+the closest corpus verses added, and skips the LLM.
+"""
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+from src.services.scripture_cache import normalize_topic
+from src.services.verses import InvalidReference, parse_reference, verse_corpus
+
+RETRIEVAL_THRESHOLD = float(os.getenv('RETRIEVAL_THRESHOLD', 0.5))
+RETRIEVAL_VERSE_THRESHOLD = float(os.getenv('RETRIEVAL_VERSE_THRESHOLD', 0.35))
+RETRIEVAL_EXTRA_VERSES = int(os.getenv('RETRIEVAL_EXTRA_VERSES', 2))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Boosts for the fields that name a topic
+KEY_BOOST = 3
+TITLE_BOOST = 2
+
+_STOP_WORDS = frozenset(normalize_topic(
+    'a an and are as at be but by do does for from god have he help his how i i\'m in is it its '
+    'lord me my of on or our so that the their them they this to us want was we what when '
+    'which who will with you your'
+).split())
+
+
+def tokenize(text):
+    """Normalized, stemmed terms with stop words removed"""
+    return [term for term in normalize_topic(text).split() if term not in _STOP_WORDS]
+
+
+def content_strings(value):
+    """Every human-readable string inside a nested content item"""
+    if isinstance(value, str):
+        if not value.startswith('http'):
+            yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from content_strings(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from content_strings(item)
+
+
+class BM25Index:
+    """Okapi BM25 over pre-tokenized documents, stored as a term-major sparse matrix"""
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.size = len(documents)
+        self.vocabulary = {}
+        term_ids, doc_ids, counts = [], [], []
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, tokens in enumerate(documents):
+            lengths[doc_id] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                doc_ids.append(doc_id)
+                counts.append(count)
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind='stable')
+        term_ids = term_ids[order]
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        tf = np.asarray(counts, dtype=np.float32)[order]
+
+        document_frequency = np.bincount(term_ids, minlength=len(self.vocabulary)).astype(np.float32)
+        self.idf = np.log1p((self.size - document_frequency + 0.5) / (document_frequency + 0.5))
+        self.max_idf = float(np.log1p((self.size + 0.5) / 0.5))
+        self.indptr = np.concatenate(([0], np.cumsum(document_frequency.astype(np.int64))))
+
+        average_length = float(lengths.mean()) if self.size else 0.0
+        norm = k1 * (1 - b + b * lengths[self.doc_ids] / (average_length or 1.0))
+        self.weights = (self.idf[term_ids] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def score(self, tokens):
+        """``(scores, bound)``: BM25 score per document and the best score the query could reach"""
+        scores = np.zeros(self.size, dtype=np.float32)
+        bound = 0.0
+        slices = []
+        for term in set(tokens):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                # Unknown terms lower confidence as much as the rarest known term would
+                bound += self.max_idf * (self.k1 + 1)
+                continue
+            bound += float(self.idf[term_id]) * (self.k1 + 1)
+            slices.append(slice(self.indptr[term_id], self.indptr[term_id + 1]))
+        if slices:
+            doc_ids = np.concatenate([self.doc_ids[s] for s in slices])
+            weights = np.concatenate([self.weights[s] for s in slices])
+            scores = np.bincount(doc_ids, weights=weights, minlength=self.size).astype(np.float32)
+        return scores, bound
+
+
+def _verse_keys(reference):
+    """(book, chapter, verse) triples covered by a reference, for de-duplication"""
+    try:
+        parsed = parse_reference(reference)
+    except InvalidReference:
+        return set()
+    if parsed.start is None:
+        return {(parsed.book, parsed.chapter, None)}
+    return {(parsed.book, parsed.chapter, verse) for verse in range(parsed.start, parsed.end + 1)}
+
+
+def _closing_prayer(title, reference):
+    return f"Lord, help me grow in {title.lower()}. Speak to me through Your word in {reference} and lead me closer to You. Amen."
+
+
+def compose_guidance(kind, item):
+    """Turn a curated content item into the structured guidance shape"""
+    scripture = item.get('scripture') or {}
+    reference = scripture.get('reference', '')
+    guidance = {
+        'verses': [{'reference': reference, 'text': scripture.get('text', '')}] if scripture else []
+    }
+    title = item.get('title', '')
+    if kind == 'devotion':
+        guidance['explanation'] = item.get('reflection', '')
+        guidance['practical_advice'] = f"Speak this declaration over your day: {item.get('declaration', '')}"
+        guidance['prayer'] = item.get('prayer', '')
+    elif kind == 'prayer':
+        steps = item.get('structure') or {}
+        guidance['explanation'] = f"{title} follows a simple pattern that keeps your heart focused on God."
+        guidance['practical_advice'] = ' '.join(f"{step.title()}: {text}." for step, text in steps.items())
+        guidance['prayer'] = item.get('sample_prayer', '')
+    elif kind == 'meditation':
+        guidance['explanation'] = ' '.join(item.get('reflection_questions') or [])
+        guidance['practical_advice'] = ' '.join(f"{step}." for step in item.get('meditation_guide') or [])
+        guidance['prayer'] = _closing_prayer(title, reference)
+    else:
+        guidance['explanation'] = f"Take an honest look at your {title.lower()} with these questions: " + \
+            ' '.join(item.get('questions') or [])
+        guidance['practical_advice'] = 'Answer each question in writing this week and share one with a trusted friend.'
+        guidance['prayer'] = _closing_prayer(title, reference)
+    return guidance
+
+
+class TopicRetriever:
+    """Answers scripture topics from curated content when retrieval is confident enough"""
+
+    def __init__(self, threshold=RETRIEVAL_THRESHOLD, verse_threshold=RETRIEVAL_VERSE_THRESHOLD,
+                 extra_verses=RETRIEVAL_EXTRA_VERSES, corpus=None):
+        self.threshold = threshold
+        self.verse_threshold = verse_threshold
+        self.extra_verses = extra_verses
+        self.corpus = corpus or verse_corpus
+        # (index, documents, topic mask, collections), replaced as a whole by build()
+        self._snapshot = (None, [], None, {})
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def build(self, collections):
+        """Index ``{kind: {id: item}}`` curated collections plus every corpus verse
+
+        Only ids are kept; matched items are looked up in ``collections`` when answering.
+        """
+        documents, tokens = [], []
+        for kind, items in collections.items():
+            for item_id, item in items.items():
+                text = ' '.join([item_id.replace('_', ' ')] * KEY_BOOST
+                                + [item.get('title', '')] * TITLE_BOOST
+                                + list(content_strings(item)))
+                documents.append(('topic', kind, item_id))
+                tokens.append(tokenize(text))
+        for reference, text in self.corpus.all_verses():
+            documents.append(('verse', reference.label, text))
+            tokens.append(tokenize(text))
+
+        index = BM25Index(tokens)
+        mask = np.array([document[0] == 'topic' for document in documents], dtype=bool)
+        # Published as one tuple so a reader never pairs a new index with old documents
+        self._snapshot = (index, documents, mask, collections)
+        return self
+
+    def search(self, query):
+        """``(best_topic, topic_confidence, verses)`` where verses are ``(confidence, label, text)``"""
+        return self._search(self._snapshot, query)
+
+    def _search(self, snapshot, query):
+        index, documents, topic_mask, _ = snapshot
+        if index is None:
+            return None, 0.0, []
+        scores, bound = index.score(tokenize(query))
+        if bound <= 0:
+            return None, 0.0, []
+        confidence = scores / bound
+
+        topic_scores = np.where(topic_mask, confidence, -1.0)
+        best = int(np.argmax(topic_scores))
+        best_topic = documents[best] if topic_scores[best] > 0 else None
+
+        verse_scores = np.where(topic_mask, -1.0, confidence)
+        verses = []
+        if self.extra_verses:
+            count = min(self.extra_verses * 2, len(verse_scores))
+            for doc_id in np.argsort(verse_scores)[::-1][:count]:
+                if verse_scores[doc_id] < self.verse_threshold:
+                    break
+                _, label, text = documents[doc_id]
+                verses.append((float(verse_scores[doc_id]), label, text))
+        return best_topic, float(max(topic_scores[best], 0.0)), verses
+
+    def answer(self, topic):
+        """``(guidance, retrieval_info)``; guidance is None when the LLM should answer"""
+        snapshot = self._snapshot
+        best, confidence, verses = self._search(snapshot, topic)
+        info = {
+            'score': round(confidence, 4),
+            'threshold': self.threshold,
+            'source': f"{best[1]}:{best[2]}" if best else None
+        }
+        confident = best is not None and confidence >= self.threshold
+        item = snapshot[3][best[1]].get(best[2]) if confident else None
+        if item is None:
+            with self._lock:
+                self._misses += 1
+            return None, dict(info, used=False)
+
+        guidance = compose_guidance(best[1], item)
+        guidance['topic'] = topic
+        cited = set()
+        for verse in guidance['verses']:
+            cited |= _verse_keys(verse['reference'])
+        added = []
+        for score, label, text in verses:
+            if len(added) >= self.extra_verses:
+                break
+            keys = _verse_keys(label)
+            if keys & cited:
+                continue
+            guidance['verses'].append({'reference': label, 'text': text})
+            added.append({'reference': label, 'score': round(score, 4)})
+            cited |= keys
+        with self._lock:
+            self._hits += 1
+        guidance['retrieval'] = dict(info, used=True, verse_sources=added)
+        return guidance, guidance['retrieval']
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        index, documents = self._snapshot[:2]
+        return {
+            'documents': len(documents),
+            'vocabulary': len(index.vocabulary) if index else 0,
+            'threshold': self.threshold,
+            'hits': hits,
+            'misses': misses
+        }
+
+
+# Shared retriever; built by the AI chat routes at startup
+topic_retriever = TopicRetriever()
@@ -0,0 +1,436 @@
+"""
+Latency-aware provider routing and hedged requests.
+
+The router keeps an EWMA of latency and error rate per provider and kind of
+call ('invoke' measures the full response, 'first_token' measures streams).
+In ``auto`` mode each request goes to the fastest healthy provider. With
+hedging enabled, a second request is sent to the other provider when the
+first has not answered (or produced a token) within a deadline derived from
+the primary's recent p95; whichever finishes first wins and the loser is
+cancelled or closed.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.services.coalescing import IDLE
+from src.services.metrics import LatencyWindow
+from src.services.resilience import get_breaker
+
+EWMA_ALPHA = float(os.getenv('ROUTER_EWMA_ALPHA', 0.2))
+ERROR_THRESHOLD = float(os.getenv('ROUTER_ERROR_THRESHOLD', 0.5))
+RETRY_UNHEALTHY_SECONDS = float(os.getenv('ROUTER_RETRY_SECONDS', 30))
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', 2.0))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.25))
+HEDGE_MIN_SAMPLES = 20
+
+# Threads used to run the primary and hedge side by side on the sync path
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv('HEDGE_POOL_SIZE', 32)),
+                                 thread_name_prefix='hedge')
+
+
+class _Health:
+    """EWMA latency/error rate and a latency window for one provider and kind"""
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = LatencyWindow()
+        self.last_failure = 0.0
+        self.requests = 0
+        self.failures = 0
+
+
+class ProviderRouter:
+    """Chooses providers by observed latency and health"""
+
+    def __init__(self, providers=('gemini', 'groq'), alpha=EWMA_ALPHA):
+        self.providers = list(providers)
+        self.alpha = alpha
+        self._health = {}
+        self._lock = threading.Lock()
+        self._stats = {'routed': {}, 'hedges_started': 0, 'hedges_won': 0, 'losers_cancelled': 0,
+                       'losers_abandoned': 0}
+
+    def _entry(self, provider, kind):
+        key = (provider, kind)
+        entry = self._health.get(key)
+        if entry is None:
+            entry = self._health[key] = _Health()
+        return entry
+
+    def record_success(self, provider, seconds, kind='invoke'):
+        with self._lock:
+            entry = self._entry(provider, kind)
+            entry.requests += 1
+            entry.latency = seconds if entry.latency is None else (
+                self.alpha * seconds + (1 - self.alpha) * entry.latency)
+            entry.error_rate = (1 - self.alpha) * entry.error_rate
+        entry.samples.add(seconds)
+
+    def record_failure(self, provider, kind='invoke'):
+        with self._lock:
+            entry = self._entry(provider, kind)
+            entry.requests += 1
+            entry.failures += 1
+            entry.error_rate = self.alpha + (1 - self.alpha) * entry.error_rate
+            entry.last_failure = time.monotonic()
+
+    def healthy(self, provider, kind='invoke'):
+        with self._lock:
+            entry = self._health.get((provider, kind))
+            if entry is None or entry.error_rate < ERROR_THRESHOLD:
+                return True
+            # Let an unhealthy provider take traffic again after a cool-down
+            return time.monotonic() - entry.last_failure >= RETRY_UNHEALTHY_SECONDS
+
+    def rank(self, kind='invoke'):
+        """Providers ordered best first: healthy before unhealthy, then by EWMA latency"""
+        def score(provider):
+            with self._lock:
+                entry = self._health.get((provider, kind))
+                latency = entry.latency if entry and entry.latency is not None else 0.0
+                error_rate = entry.error_rate if entry else 0.0
+            # Providers without samples sort first so they get explored; an open
+            # circuit ranks a provider behind every healthy one
+            unavailable = not self.healthy(provider, kind) or not get_breaker(provider).allows()
+            return (unavailable, latency, error_rate)
+        return sorted(self.providers, key=score)
+
+    def choose(self, kind='invoke'):
+        """Best provider for the next request"""
+        provider = self.rank(kind)[0]
+        self._count_routed(provider)
+        return provider
+
+    def hedge_delay(self, provider, kind='invoke'):
+        """Deadline before hedging: the provider's recent p95, once known"""
+        with self._lock:
+            entry = self._health.get((provider, kind))
+        if entry is None or len(entry.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, entry.samples.percentile(95))
+
+    def observe(self, provider, fn, kind='invoke'):
+        """Run ``fn()`` and record its latency or failure against a provider"""
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception:
+            self.record_failure(provider, kind)
+            raise
+        self.record_success(provider, time.perf_counter() - start, kind)
+        return result
+
+    async def aobserve(self, provider, coro_fn, kind='invoke'):
+        """Async counterpart of observe()"""
+        start = time.perf_counter()
+        try:
+            result = await coro_fn()
+        except Exception:
+            self.record_failure(provider, kind)
+            raise
+        self.record_success(provider, time.perf_counter() - start, kind)
+        return result
+
+    def observe_stream(self, provider, chunks):
+        """Wrap an upstream chunk iterator, recording time to its first chunk"""
+        start = time.perf_counter()
+        first = True
+        try:
+            for chunk in chunks:
+                if first:
+                    self.record_success(provider, time.perf_counter() - start, 'first_token')
+                    first = False
+                yield chunk
+        except Exception:
+            if first:
+                self.record_failure(provider, 'first_token')
+            raise
+
+    async def aobserve_stream(self, provider, chunks):
+        """Async counterpart of observe_stream()"""
+        start = time.perf_counter()
+        first = True
+        try:
+            async for chunk in chunks:
+                if first:
+                    self.record_success(provider, time.perf_counter() - start, 'first_token')
+                    first = False
+                yield chunk
+        except Exception:
+            if first:
+                self.record_failure(provider, 'first_token')
+            raise
+
+    def hedged(self, run, hedge=HEDGE_REQUESTS):
+        """Run ``run(provider)`` on the best provider, hedging to the runner-up
+
+        Returns ``(result, provider)``. If the primary fails, the next provider
+        is tried before giving up.
+        """
+        ranked = self.rank('invoke')
+        primary = ranked[0]
+        self._count_routed(primary)
+        if not hedge or len(ranked) < 2:
+            try:
+                return run(primary), primary
+            except Exception:
+                if len(ranked) < 2:
+                    raise
+                return run(ranked[1]), ranked[1]
+
+        secondary = ranked[1]
+        futures = {_hedge_pool.submit(run, primary): primary}
+        done, _ = wait(futures, timeout=self.hedge_delay(primary))
+        if not done:
+            self._count('hedges_started')
+            futures[_hedge_pool.submit(run, secondary)] = secondary
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        # A call that already started cannot be interrupted; it runs on and its result is dropped
+                        self._count('losers_cancelled' if loser.cancel() else 'losers_abandoned')
+                    if futures[future] != primary:
+                        self._count('hedges_won')
+                    return future.result(), futures[future]
+                error = future.exception()
+            if not pending and len(futures) == 1:
+                # The primary failed before the hedge deadline: fall back now
+                fallback = _hedge_pool.submit(run, secondary)
+                futures[fallback] = secondary
+                pending = {fallback}
+        raise error
+
+    async def ahedged(self, run, hedge=HEDGE_REQUESTS):
+        """Async counterpart of hedged(); the losing task is really cancelled"""
+        ranked = self.rank('invoke')
+        primary = ranked[0]
+        self._count_routed(primary)
+        if not hedge or len(ranked) < 2:
+            try:
+                return await run(primary), primary
+            except Exception:
+                if len(ranked) < 2:
+                    raise
+                return await run(ranked[1]), ranked[1]
+
+        secondary = ranked[1]
+        tasks = {asyncio.ensure_future(run(primary)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+        if not done:
+            self._count('hedges_started')
+            tasks[asyncio.ensure_future(run(secondary))] = secondary
+
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                        self._count('losers_cancelled')
+                    if tasks[task] != primary:
+                        self._count('hedges_won')
+                    return task.result(), tasks[task]
+                error = task.exception()
+            if not pending and len(tasks) == 1:
+                # The primary failed before the hedge deadline: fall back now
+                fallback = asyncio.ensure_future(run(secondary))
+                tasks[fallback] = secondary
+                pending = {fallback}
+        raise error
+
+    def hedged_stream(self, open_stream, hedge=HEDGE_REQUESTS):
+        """Chunk source racing two providers to the first token
+
+        ``open_stream(provider)`` must return a subscription that yields
+        ``IDLE`` while waiting. The returned iterator exposes the winning
+        provider as ``.provider`` once the first chunk has arrived.
+        """
+        return HedgedStream(self, open_stream, hedge)
+
+    def ahedged_stream(self, open_stream, hedge=HEDGE_REQUESTS):
+        """Async counterpart of hedged_stream()"""
+        return AsyncHedgedStream(self, open_stream, hedge)
+
+    def _count_routed(self, provider):
+        with self._lock:
+            self._stats['routed'][provider] = self._stats['routed'].get(provider, 0) + 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def summary(self):
+        """Per-provider EWMA latency, error rate and hedging counters"""
+        with self._lock:
+            health = {}
+            for (provider, kind), entry in self._health.items():
+                health.setdefault(provider, {})[kind] = {
+                    'ewma_latency_ms': None if entry.latency is None else round(entry.latency * 1000, 1),
+                    'error_rate': round(entry.error_rate, 4),
+                    'requests': entry.requests,
+                    'failures': entry.failures
+                }
+            stats = {key: (dict(value) if isinstance(value, dict) else value)
+                     for key, value in self._stats.items()}
+        stats['health'] = health
+        stats['hedging_enabled'] = HEDGE_REQUESTS
+        return stats
+
+
+class HedgedStream:
+    """Iterator that races a primary stream against a delayed hedge"""
+
+    def __init__(self, router, open_stream, hedge):
+        self.router = router
+        self.open_stream = open_stream
+        self.hedge = hedge
+        self.provider = None
+        self._sources = []
+        self._iterator = self._run()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        self._iterator.close()
+
+    def _run(self):
+        ranked = self.router.rank('first_token')
+        primary = ranked[0]
+        self.router._count_routed(primary)
+        self._sources = [(primary, self.open_stream(primary))]
+        deadline = time.monotonic() + self.router.hedge_delay(primary, 'first_token')
+        try:
+            winner = None
+            while winner is None:
+                if (self.hedge and len(self._sources) == 1 and len(ranked) > 1
+                        and time.monotonic() >= deadline):
+                    self.router._count('hedges_started')
+                    self._sources.append((ranked[1], self.open_stream(ranked[1])))
+
+                for provider, source in list(self._sources):
+                    try:
+                        chunk = next(source)
+                    except StopIteration:
+                        winner = (provider, source, None)
+                        break
+                    except Exception:
+                        # A failed source drops out if another one is still running
+                        self._sources.remove((provider, source))
+                        if not self._sources:
+                            raise
+                        continue
+                    if chunk is IDLE:
+                        continue
+                    winner = (provider, source, chunk)
+                    break
+                else:
+                    # Every source idled; yield so callers can heartbeat
+                    yield IDLE
+
+            provider, source, first = winner
+            self.provider = provider
+            for other, other_source in self._sources:
+                if other_source is not source:
+                    other_source.close()
+                    self.router._count('losers_cancelled')
+            if provider != primary:
+                self.router._count('hedges_won')
+            self._sources = [(provider, source)]
+            if first is None:
+                return
+            yield first
+            yield from source
+        finally:
+            for _, source in self._sources:
+                source.close()
+
+
+class AsyncHedgedStream:
+    """Async iterator that races a primary stream against a delayed hedge"""
+
+    def __init__(self, router, open_stream, hedge):
+        self.router = router
+        self.open_stream = open_stream
+        self.hedge = hedge
+        self.provider = None
+        self._sources = []
+        self._iterator = self._run()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._iterator.__anext__()
+
+    async def aclose(self):
+        await self._iterator.aclose()
+
+    async def _run(self):
+        ranked = self.router.rank('first_token')
+        primary = ranked[0]
+        self.router._count_routed(primary)
+        self._sources = [(primary, self.open_stream(primary))]
+        deadline = time.monotonic() + self.router.hedge_delay(primary, 'first_token')
+        try:
+            winner = None
+            while winner is None:
+                if (self.hedge and len(self._sources) == 1 and len(ranked) > 1
+                        and time.monotonic() >= deadline):
+                    self.router._count('hedges_started')
+                    self._sources.append((ranked[1], self.open_stream(ranked[1])))
+
+                for provider, source in list(self._sources):
+                    try:
+                        chunk = await source.__anext__()
+                    except StopAsyncIteration:
+                        winner = (provider, source, None)
+                        break
+                    except Exception:
+                        self._sources.remove((provider, source))
+                        if not self._sources:
+                            raise
+                        continue
+                    if chunk is IDLE:
+                        continue
+                    winner = (provider, source, chunk)
+                    break
+                else:
+                    yield IDLE
+
+            provider, source, first = winner
+            self.provider = provider
+            for other, other_source in self._sources:
+                if other_source is not source:
+                    await other_source.aclose()
+                    self.router._count('losers_cancelled')
+            if provider != primary:
+                self.router._count('hedges_won')
+            self._sources = [(provider, source)]
+            if first is None:
+                return
+            yield first
+            async for chunk in source:
+                yield chunk
+        finally:
+            for _, source in self._sources:
+                await source.aclose()
+
+
+# Shared router for `provider: "auto"` requests
+router = ProviderRouter()
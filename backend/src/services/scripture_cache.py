@@ -0,0 +1,202 @@
+"""
+Response cache for scripture guidance keyed by normalized topic.
+
+Topics such as "anxiety", "Anxiety " and "anxiety." all map to the same key.
+Entries expire after a TTL and the least recently used entry is evicted when
+the cache is full. An optional SQLite file keeps entries across restarts.
+Reads never write to it. Expired rows are purged, and the file is trimmed
+to ``max_entries`` rows (oldest stored first), at startup and then at most
+every PURGE_INTERVAL_SECONDS when entries are stored. All operations are guarded by a single lock so one cache can be shared by
+every request thread.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1024
+PURGE_INTERVAL_SECONDS = 300
+
+# Keys every structured guidance response must carry to be cacheable
+STRUCTURED_KEYS = ('verses', 'explanation', 'practical_advice', 'prayer')
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=65536)
+def _stem(word):
+    """Very small suffix stripper so plurals and -ing forms share a key (memoized per word)"""
+    if len(word) <= 3:
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('ing') and len(word) > 5:
+        return word[:-3]
+    if word.endswith('ed') and len(word) > 4:
+        return word[:-2]
+    if word.endswith('es') and word[-3] in 'sxz':
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def normalize_topic(topic):
+    """Normalize case, whitespace, punctuation and simple inflections"""
+    text = _PUNCTUATION.sub(' ', (topic or '').lower())
+    words = _WHITESPACE.split(text.strip())
+    return ' '.join(_stem(word) for word in words if word)
+
+
+def is_structured_guidance(guidance):
+    """True when a guidance payload parsed into the expected JSON shape"""
+    return (
+        isinstance(guidance, dict)
+        and 'error' not in guidance
+        and all(key in guidance for key in STRUCTURED_KEYS)
+        and isinstance(guidance['verses'], list)
+    )
+
+
+class ScriptureCache:
+    """Thread-safe TTL + LRU cache with optional SQLite persistence"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, db_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'stores': 0, 'rejected': 0}
+        self._db = None
+        self._purged_at = 0.0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS scripture_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            self._purge(time.time())
+            self._db.commit()
+
+    def get(self, topic):
+        """Return cached guidance for a topic, or None"""
+        key = normalize_topic(topic)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._entries[key] = entry
+                    self._evict_overflow()
+
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= now:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return dict(value)
+
+    def put(self, topic, guidance):
+        """Store guidance if it is structured; returns whether it was cached"""
+        if not is_structured_guidance(guidance):
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+
+        key = normalize_topic(topic)
+        if not key:
+            return False
+        now = time.time()
+        entry = (now + self.ttl_seconds, dict(guidance))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO scripture_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(entry[1]), entry[0], now)
+                )
+                if now - self._purged_at >= PURGE_INTERVAL_SECONDS:
+                    self._purge(now)
+                self._db.commit()
+            self._evict_overflow()
+            self._stats['stores'] += 1
+        return True
+
+    def clear(self):
+        """Remove every entry from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM scripture_cache')
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        stats['persistent'] = self._db is not None
+        return stats
+
+    # The helpers below expect self._lock to be held
+
+    def _load(self, key):
+        row = self._db.execute(
+            'SELECT expires_at, value FROM scripture_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _purge(self, now):
+        # accessed_at is when the row was stored; the oldest rows go first
+        self._purged_at = now
+        self._db.execute('DELETE FROM scripture_cache WHERE expires_at <= ?', (now,))
+        self._db.execute(
+            'DELETE FROM scripture_cache WHERE key NOT IN '
+            '(SELECT key FROM scripture_cache ORDER BY accessed_at DESC LIMIT ?)', (self.max_entries,)
+        )
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute('DELETE FROM scripture_cache WHERE key = ?', (key,))
+            self._db.commit()
+
+    def _evict_overflow(self):
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+            if self._db is not None:
+                self._db.execute('DELETE FROM scripture_cache WHERE key = ?', (key,))
+                self._db.commit()
+
+
+# Shared cache for /chat/scripture, configured from the environment
+scripture_cache = ScriptureCache(
+    max_entries=int(os.getenv('SCRIPTURE_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+    ttl_seconds=int(os.getenv('SCRIPTURE_CACHE_TTL', DEFAULT_TTL_SECONDS)),
+    db_path=os.getenv('SCRIPTURE_CACHE_DB') or None
+)
@@ -0,0 +1,206 @@
+"""
+Server-Sent Events framing for streamed chat responses.
+
+Tiny model chunks are coalesced into small frames (FRAME_MIN_CHARS, or
+whatever arrived within FRAME_MAX_DELAY seconds) to cut write syscalls. While
+the model is silent a heartbeat comment is sent every HEARTBEAT_SECONDS so
+proxies keep the connection open. When the client goes away the chunk source
+is closed, which stops generation upstream, and time-to-first-token and
+tokens-per-second are recorded for every stream.
+
+Chunk sources are coalescer subscriptions created with
+``idle_timeout=FRAME_MAX_DELAY``, so they yield ``IDLE`` while waiting. A
+source that picks its provider lazily (a hedged stream) exposes it as
+``.provider``; frames and metrics are then labelled with the winner.
+``on_complete(text)`` is called with the full reply once a stream completes.
+
+Structured scripture guidance is sent as one frame per parser event (see
+``src.services.structured``) by ``sse_events``/``asse_events``.
+"""
+import json
+import os
+import time
+
+from src.services.coalescing import IDLE
+from src.services.metrics import StreamTimer, stream_metrics
+from src.services.structured import event_payload
+
+HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+FRAME_MIN_CHARS = int(os.getenv('SSE_FRAME_MIN_CHARS', 48))
+FRAME_MAX_DELAY = float(os.getenv('SSE_FRAME_MAX_DELAY', 0.05))
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'Access-Control-Allow-Origin': '*',
+    # Stop nginx-style proxies from buffering the whole response
+    'X-Accel-Buffering': 'no'
+}
+
+HEARTBEAT_FRAME = ": heartbeat\n\n"
+
+
+def format_event(payload):
+    """Encode a payload as a single SSE data frame"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class _FrameBuffer:
+    """Accumulates chunk text and decides when to emit a frame or heartbeat"""
+
+    def __init__(self, provider, timer):
+        self.provider = provider
+        self.timer = timer
+        self.parts = []
+        self.size = 0
+        self.buffered_at = None
+        self.sent_first = False
+        self.last_write = time.monotonic()
+
+    def add(self, text):
+        if not text:
+            return None
+        self.timer.on_text(text)
+        if self.buffered_at is None:
+            self.buffered_at = time.monotonic()
+        self.parts.append(text)
+        self.size += len(text)
+        # The first token goes out immediately so time-to-first-token stays low
+        if not self.sent_first or self.size >= FRAME_MIN_CHARS:
+            return self.flush()
+        if time.monotonic() - self.buffered_at >= FRAME_MAX_DELAY:
+            return self.flush()
+        return None
+
+    def tick(self):
+        if self.parts:
+            return self.flush()
+        now = time.monotonic()
+        if now - self.last_write >= HEARTBEAT_SECONDS:
+            self.last_write = now
+            return HEARTBEAT_FRAME
+        return None
+
+    def flush(self):
+        if not self.parts:
+            return None
+        frame = format_event({'content': ''.join(self.parts), 'provider': self.provider})
+        self.parts = []
+        self.size = 0
+        self.buffered_at = None
+        self.sent_first = True
+        self.last_write = time.monotonic()
+        return frame
+
+
+def _label_resolved_provider(chunks, frames, timer):
+    resolved = getattr(chunks, 'provider', None)
+    if resolved and frames.provider != resolved:
+        frames.provider = timer.provider = resolved
+
+
+def sse_stream(chunks, provider, metrics_provider=None, on_complete=None):
+    """Turn a chunk subscription into SSE frames (sync, for Flask)"""
+    timer = StreamTimer(metrics_provider or provider, stream_metrics)
+    frames = _FrameBuffer(provider, timer)
+    outcome = 'disconnected'
+    received = []
+    try:
+        try:
+            for chunk in chunks:
+                if chunk is IDLE:
+                    frame = frames.tick()
+                else:
+                    _label_resolved_provider(chunks, frames, timer)
+                    text = getattr(chunk, 'content', None)
+                    if on_complete is not None and text:
+                        received.append(text)
+                    frame = frames.add(text)
+                if frame:
+                    yield frame
+
+            tail = frames.flush()
+            if tail:
+                yield tail
+            if on_complete is not None:
+                on_complete(''.join(received))
+            yield format_event({'done': True})
+            outcome = 'completed'
+
+        except Exception as e:
+            outcome = 'error'
+            yield format_event({'error': str(e)})
+    finally:
+        # Runs on normal completion and on client disconnect (GeneratorExit)
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        timer.finish(outcome)
+
+
+async def asse_stream(chunks, provider, metrics_provider=None, on_complete=None):
+    """Turn an async chunk subscription into SSE frames (for the ASGI app)"""
+    timer = StreamTimer(metrics_provider or provider, stream_metrics)
+    frames = _FrameBuffer(provider, timer)
+    outcome = 'disconnected'
+    received = []
+    try:
+        try:
+            async for chunk in chunks:
+                if chunk is IDLE:
+                    frame = frames.tick()
+                else:
+                    _label_resolved_provider(chunks, frames, timer)
+                    text = getattr(chunk, 'content', None)
+                    if on_complete is not None and text:
+                        received.append(text)
+                    frame = frames.add(text)
+                if frame:
+                    yield frame
+
+            tail = frames.flush()
+            if tail:
+                yield tail
+            if on_complete is not None:
+                on_complete(''.join(received))
+            yield format_event({'done': True})
+            outcome = 'completed'
+
+        except Exception as e:
+            outcome = 'error'
+            yield format_event({'error': str(e)})
+    finally:
+        # Runs on normal completion and when the client disconnects
+        await chunks.aclose()
+        timer.finish(outcome)
+
+
+def sse_events(events):
+    """Frame structured-output parser events as SSE (sync, for Flask)
+
+    ``events`` should come from a subscription opened with
+    ``idle_timeout=HEARTBEAT_SECONDS`` so every idle marker is a heartbeat.
+    """
+    try:
+        try:
+            for event in events:
+                yield HEARTBEAT_FRAME if event[0] == 'idle' else format_event(event_payload(event))
+            yield format_event({'done': True})
+        except Exception as e:
+            yield format_event({'error': str(e)})
+    finally:
+        if hasattr(events, 'close'):
+            events.close()
+
+
+async def asse_events(events):
+    """Async counterpart of sse_events()"""
+    try:
+        try:
+            async for event in events:
+                yield HEARTBEAT_FRAME if event[0] == 'idle' else format_event(event_payload(event))
+            yield format_event({'done': True})
+        except Exception as e:
+            yield format_event({'error': str(e)})
+    finally:
+        if hasattr(events, 'aclose'):
+            await events.aclose()
@@ -0,0 +1,425 @@
+"""
+Incremental parsing of the structured scripture guidance completion.
+
+The model is asked for a JSON document (see ``SCRIPTURE_GUIDANCE_PROMPT``).
+Instead of waiting for the full completion and running ``json.loads`` once,
+``GuidanceStreamParser`` scans the text as chunks arrive and reports each
+``verses`` entry and each top-level field the moment its closing bracket or
+quote is seen. Each verse is checked against the bundled corpus (see
+``src.services.verses``): known passages get their canonical text, and
+references that cannot exist are dropped.
+
+Output that cannot become valid JSON is caught early: too much prose before
+the opening brace, or a structural error such as a mismatched bracket. The
+stream is then cancelled so no more tokens are paid for. One cheap local
+repair pass follows: the text is cut back to the last point where the
+document was well-formed and the open brackets are closed. Truncated
+completions are repaired the same way.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from src.services.coalescing import IDLE
+from src.services.metrics import LatencyWindow, _ms
+from src.services.verses import verify_verse
+
+# Characters of non-JSON preamble (e.g. a ```json fence) tolerated before '{'
+PROSE_LIMIT = int(os.getenv('SCRIPTURE_PROSE_LIMIT', 200))
+
+GUIDANCE_TEXT_FIELDS = ('explanation', 'practical_advice', 'prayer')
+
+_CLOSERS = {'{': '}', '[': ']'}
+_SCALAR_START = set('-0123456789tfn')
+_DELIMITERS = set(',}] \t\r\n')
+_EXPECTED = {'key': 'an object key', 'colon': '":"', 'next': '"," or a closing bracket'}
+
+
+class MalformedOutput(ValueError):
+    """The completion can no longer be parsed as guidance JSON"""
+
+
+def validate_verse(verse):
+    """True for a ``{"reference": str, "text": str}`` object with both fields set"""
+    return (
+        isinstance(verse, dict)
+        and isinstance(verse.get('reference'), str) and verse['reference'].strip() != ''
+        and isinstance(verse.get('text'), str) and verse['text'].strip() != ''
+    )
+
+
+def validate_guidance(guidance):
+    """Schema problems with a guidance document; an empty list means it is valid"""
+    if not isinstance(guidance, dict):
+        return ['guidance must be a JSON object']
+    problems = []
+    verses = guidance.get('verses')
+    if not isinstance(verses, list) or not verses:
+        problems.append('verses must be a non-empty list')
+    elif not all(validate_verse(verse) for verse in verses):
+        problems.append('every verse needs a reference and text')
+    for field in GUIDANCE_TEXT_FIELDS:
+        if not isinstance(guidance.get(field), str):
+            problems.append(f'{field} must be a string')
+    return problems
+
+
+class _Frame:
+    __slots__ = ('kind', 'start', 'key', 'state', 'empty')
+
+    def __init__(self, kind, start):
+        self.kind = kind
+        self.start = start
+        self.key = None
+        # What the frame accepts next: 'key' and 'colon' (objects only), 'value',
+        # or 'next' (a comma or the closer) once a member is complete
+        self.state = 'key' if kind == '{' else 'value'
+        self.empty = True
+
+
+class GuidanceStreamParser:
+    """Feed completion text in chunks; completed verses and fields come back as events
+
+    ``feed()`` returns a list of ``('verse', index, verse)`` and
+    ``('field', name, value)`` events and raises ``MalformedOutput`` as soon as
+    the text cannot be valid JSON. ``finish()`` returns ``(guidance, repaired)``.
+    """
+
+    def __init__(self, prose_limit=PROSE_LIMIT, verify=None):
+        self.prose_limit = prose_limit
+        self.verify = verify
+        self.text = ''
+        self.verses = []
+        self.rejected_verses = 0
+        self.document = None
+        self.error = None
+        self._pos = 0
+        self._root_start = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._scalar_start = None
+        # Last offset at which the document could be closed into valid JSON
+        self._safe_end = None
+        self._safe_closers = ''
+
+    @property
+    def complete(self):
+        return self.document is not None
+
+    def feed(self, text):
+        if self.error is not None:
+            raise MalformedOutput(self.error)
+        if self.complete or not text:
+            return []
+        self.text += text
+        events = []
+        try:
+            self._scan(events)
+        except MalformedOutput as e:
+            self.error = str(e)
+            raise
+        return events
+
+    def finish(self):
+        """The parsed document, repairing a truncated or broken one if possible"""
+        if self.complete:
+            return self.document, False
+        repaired = self.repair()
+        if repaired is None:
+            raise MalformedOutput(self.error or 'completion ended before the JSON document closed')
+        return repaired, True
+
+    def repair(self):
+        """Close the document at its last well-formed point; None if nothing is salvageable"""
+        if self._safe_end is None:
+            return None
+        candidate = self.text[self._root_start:self._safe_end].rstrip().rstrip(',') + self._safe_closers
+        try:
+            document = json.loads(candidate)
+        except ValueError:
+            return None
+        if isinstance(document.get('verses'), list):
+            document['verses'] = [verse for verse in document['verses'] if validate_verse(verse)]
+        return document
+
+    def _scan(self, events):
+        text = self.text
+        i = self._pos
+        end = len(text)
+        while i < end and not self.complete:
+            ch = text[i]
+            if self._root_start is None:
+                if ch == '{':
+                    self._root_start = i
+                    self._open('{', i)
+                elif i + 1 > self.prose_limit:
+                    raise MalformedOutput(f'no JSON object in the first {self.prose_limit} characters')
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._close_string(i, events)
+                i += 1
+                continue
+
+            if self._scalar_start is not None:
+                if ch not in _DELIMITERS:
+                    i += 1
+                    continue
+                self._complete_value(self._scalar_start, i, events)
+                self._scalar_start = None
+
+            frame = self._stack[-1]
+            if ch in ' \t\r\n':
+                pass
+            elif ch == '"' and frame.state in ('key', 'value'):
+                self._in_string = True
+                self._string_start = i
+            elif ch == ':' and frame.state == 'colon':
+                frame.state = 'value'
+            elif ch == ',' and frame.state == 'next':
+                frame.key = None
+                frame.state = 'key' if frame.kind == '{' else 'value'
+            elif ch in '}]' and (frame.state == 'next' or frame.empty and frame.key is None):
+                self._close(ch, i, events)
+            elif frame.state != 'value':
+                # Raised here, at the bad token, so repair() can cut back to the last member
+                raise MalformedOutput(f'unexpected {ch!r} at offset {i}, expected {_EXPECTED[frame.state]}')
+            elif ch in '{[':
+                self._open(ch, i)
+            elif ch in _SCALAR_START:
+                self._scalar_start = i
+            else:
+                raise MalformedOutput(f'unexpected {ch!r} at offset {i}')
+            i += 1
+        self._pos = i
+
+    def _open(self, kind, offset):
+        self._stack.append(_Frame(kind, offset))
+        self._mark_safe(offset + 1)
+
+    def _close(self, ch, offset, events):
+        frame = self._stack.pop()
+        if _CLOSERS[frame.kind] != ch:
+            raise MalformedOutput(f'mismatched {ch!r} at offset {offset}')
+        if not self._stack:
+            try:
+                self.document = json.loads(self.text[self._root_start:offset + 1])
+            except ValueError as e:
+                raise MalformedOutput(str(e))
+            return
+        self._complete_value(frame.start, offset + 1, events)
+
+    def _close_string(self, offset, events):
+        frame = self._stack[-1]
+        if frame.state == 'key':
+            frame.key = json.loads(self.text[self._string_start:offset + 1])
+            frame.state = 'colon'
+            return
+        self._complete_value(self._string_start, offset + 1, events)
+
+    def _complete_value(self, start, end, events):
+        """A value spanning text[start:end] just finished inside the current frame"""
+        depth = len(self._stack)
+        parent = self._stack[-1]
+        if depth == 1 and parent.key is not None and parent.key != 'verses':
+            events.append(('field', parent.key, self._loads(start, end)))
+        elif depth == 2 and parent.kind == '[' and self._stack[0].key == 'verses':
+            verse = self._loads(start, end)
+            if validate_verse(verse) and self.verify is not None:
+                verse = self.verify(verse)
+            if verse is not None and validate_verse(verse):
+                events.append(('verse', len(self.verses), verse))
+                self.verses.append(verse)
+            else:
+                self.rejected_verses += 1
+        parent.state = 'next'
+        parent.empty = False
+        self._mark_safe(end)
+
+    def _loads(self, start, end):
+        try:
+            return json.loads(self.text[start:end])
+        except ValueError as e:
+            raise MalformedOutput(str(e))
+
+    def _mark_safe(self, end):
+        self._safe_end = end
+        self._safe_closers = ''.join(_CLOSERS[frame.kind] for frame in reversed(self._stack))
+
+
+def fallback_guidance(topic, text):
+    """Unstructured response returned when the completion could not be parsed"""
+    return {
+        "topic": topic,
+        "response": text,
+        "error": "Could not parse structured response"
+    }
+
+
+class StructuredOutputStats:
+    """Outcome counts and time-to-first-verse for streamed scripture guidance"""
+
+    def __init__(self):
+        self._first_verse = LatencyWindow()
+        self._outcomes = {}
+        self._lock = threading.Lock()
+
+    def record(self, outcome, first_verse_seconds=None):
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+        if first_verse_seconds is not None:
+            self._first_verse.add(first_verse_seconds)
+
+    def summary(self):
+        with self._lock:
+            outcomes = dict(self._outcomes)
+        return {
+            'outcomes': outcomes,
+            'first_verse_p50_ms': _ms(self._first_verse.percentile(50)),
+            'first_verse_p95_ms': _ms(self._first_verse.percentile(95))
+        }
+
+
+def _close_chunks(chunks):
+    if hasattr(chunks, 'close'):
+        chunks.close()
+
+
+def _guidance_result(topic, parser, cancelled):
+    """Final ('guidance', document, outcome) event for a finished or cancelled parse
+
+    Documents with at least one valid verse are kept; other schema problems are
+    listed under ``schema_errors`` so callers can decide whether to cache them.
+    """
+    try:
+        guidance, repaired = parser.finish()
+    except MalformedOutput:
+        return ('guidance', fallback_guidance(topic, parser.text), 'cancelled' if cancelled else 'malformed')
+    # The parser's verses are the validated (and corpus-checked) entries, in order
+    guidance['verses'] = list(parser.verses)
+    problems = validate_guidance(guidance)
+    if not guidance.get('verses'):
+        return ('guidance', fallback_guidance(topic, parser.text), 'invalid')
+    if problems:
+        guidance['schema_errors'] = problems
+    if repaired:
+        guidance['repaired'] = True
+        return ('guidance', guidance, 'repaired')
+    return ('guidance', guidance, 'incomplete' if problems else 'completed')
+
+
+def parse_guidance_stream(topic, chunks, stats=None, on_guidance=None):
+    """Turn a chunk stream into parser events, ending with ``('guidance', doc, outcome)``
+
+    ``IDLE`` markers from a coalesced subscription pass through as ``('idle',)``.
+    On malformed output the chunk stream is closed, which cancels generation.
+    ``on_guidance(document)`` is called with the final document before it is yielded.
+    """
+    parser = GuidanceStreamParser(verify=verify_verse)
+    started = time.perf_counter()
+    first_verse = None
+    cancelled = False
+    outcome = 'disconnected'
+    try:
+        for chunk in chunks:
+            if chunk is IDLE:
+                yield ('idle',)
+                continue
+            try:
+                events = parser.feed(getattr(chunk, 'content', None) or '')
+            except MalformedOutput:
+                cancelled = True
+                break
+            for event in events:
+                if event[0] == 'verse' and first_verse is None:
+                    first_verse = time.perf_counter() - started
+                yield event
+            if parser.complete:
+                # Anything after the top-level object is not read; the stream is closed below
+                break
+        result = _guidance_result(topic, parser, cancelled)
+        outcome = result[2]
+        if on_guidance is not None:
+            on_guidance(result[1])
+        yield result
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        _close_chunks(chunks)
+        if stats is not None:
+            stats.record(outcome, first_verse)
+
+
+async def aparse_guidance_stream(topic, chunks, stats=None, on_guidance=None):
+    """Async counterpart of parse_guidance_stream()"""
+    parser = GuidanceStreamParser(verify=verify_verse)
+    started = time.perf_counter()
+    first_verse = None
+    cancelled = False
+    outcome = 'disconnected'
+    try:
+        async for chunk in chunks:
+            if chunk is IDLE:
+                yield ('idle',)
+                continue
+            try:
+                events = parser.feed(getattr(chunk, 'content', None) or '')
+            except MalformedOutput:
+                cancelled = True
+                break
+            for event in events:
+                if event[0] == 'verse' and first_verse is None:
+                    first_verse = time.perf_counter() - started
+                yield event
+            if parser.complete:
+                # Anything after the top-level object is not read; the stream is closed below
+                break
+        result = _guidance_result(topic, parser, cancelled)
+        outcome = result[2]
+        if on_guidance is not None:
+            # e.g. a cache write that may touch SQLite; keep it off the event loop
+            await asyncio.to_thread(on_guidance, result[1])
+        yield result
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        await chunks.aclose()
+        if stats is not None:
+            stats.record(outcome, first_verse)
+
+
+def guidance_events(guidance, outcome='cached'):
+    """Replay a finished guidance document (e.g. from the cache) as parser events"""
+    for index, verse in enumerate(guidance.get('verses') or []):
+        yield ('verse', index, verse)
+    for field in GUIDANCE_TEXT_FIELDS:
+        if field in guidance:
+            yield ('field', field, guidance[field])
+    yield ('guidance', guidance, outcome)
+
+
+def event_payload(event):
+    """SSE payload for a parser event"""
+    kind = event[0]
+    if kind == 'verse':
+        return {'verse': event[2], 'index': event[1]}
+    if kind == 'field':
+        return {'field': event[1], 'value': event[2]}
+    return {'guidance': event[1], 'outcome': event[2]}
+
+
+# Shared counters for the structured scripture path
+structured_stats = StructuredOutputStats()
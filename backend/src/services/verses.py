@@ -0,0 +1,337 @@
+"""
+Bundled Bible verse corpus with a memory-mapped reference index.
+
+Verses live in one compact binary file that is memory-mapped on first use.
+Nothing is parsed or copied into memory up front, and a lookup is a binary
+search over the fixed-width index followed by one UTF-8 decode.
+
+File layout (little-endian)::
+
+    header  b'VRS1', uint32 verse_count
+    index   verse_count x (uint32 key, uint32 offset, uint32 length), sorted by key
+    text    UTF-8 verse texts, back to back
+
+``key`` packs the book number (1-66), chapter and verse as
+``book << 16 | chapter << 8 | verse``.
+
+The shipped corpus is built from ``src/data/verses.tsv``. A complete
+translation can be compiled into the same format with
+``python -m src.services.verses build SOURCE.tsv [DEST.bin]``.
+"""
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from collections import namedtuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+CORPUS_PATH = os.getenv('VERSE_CORPUS_PATH', os.path.join(DATA_DIR, 'verses.bin'))
+CORPUS_SOURCE = os.path.join(DATA_DIR, 'verses.tsv')
+
+MAGIC = b'VRS1'
+_HEADER = struct.Struct('<4sI')
+_ENTRY = struct.Struct('<III')
+
+# Protestant canon in order, with chapter counts
+BOOKS = (
+    ('Genesis', 50), ('Exodus', 40), ('Leviticus', 27), ('Numbers', 36), ('Deuteronomy', 34),
+    ('Joshua', 24), ('Judges', 21), ('Ruth', 4), ('1 Samuel', 31), ('2 Samuel', 24),
+    ('1 Kings', 22), ('2 Kings', 25), ('1 Chronicles', 29), ('2 Chronicles', 36), ('Ezra', 10),
+    ('Nehemiah', 13), ('Esther', 10), ('Job', 42), ('Psalms', 150), ('Proverbs', 31),
+    ('Ecclesiastes', 12), ('Song of Songs', 8), ('Isaiah', 66), ('Jeremiah', 52), ('Lamentations', 5),
+    ('Ezekiel', 48), ('Daniel', 12), ('Hosea', 14), ('Joel', 3), ('Amos', 9),
+    ('Obadiah', 1), ('Jonah', 4), ('Micah', 7), ('Nahum', 3), ('Habakkuk', 3),
+    ('Zephaniah', 3), ('Haggai', 2), ('Zechariah', 14), ('Malachi', 4),
+    ('Matthew', 28), ('Mark', 16), ('Luke', 24), ('John', 21), ('Acts', 28),
+    ('Romans', 16), ('1 Corinthians', 16), ('2 Corinthians', 13), ('Galatians', 6), ('Ephesians', 6),
+    ('Philippians', 4), ('Colossians', 4), ('1 Thessalonians', 5), ('2 Thessalonians', 3), ('1 Timothy', 6),
+    ('2 Timothy', 4), ('Titus', 3), ('Philemon', 1), ('Hebrews', 13), ('James', 5),
+    ('1 Peter', 5), ('2 Peter', 3), ('1 John', 5), ('2 John', 1), ('3 John', 1),
+    ('Jude', 1), ('Revelation', 22),
+)
+
+# Common abbreviations and alternate names (numbered books get their prefix added)
+_ALIASES = {
+    'Genesis': ('gen', 'gn'), 'Exodus': ('ex', 'exod'), 'Leviticus': ('lev', 'lv'),
+    'Numbers': ('num', 'nm'), 'Deuteronomy': ('deut', 'dt'), 'Joshua': ('josh',),
+    'Judges': ('judg', 'jdg'), 'Samuel': ('sam', 'sm'), 'Kings': ('kgs', 'kings', 'ki'),
+    'Chronicles': ('chr', 'chron'), 'Nehemiah': ('neh',), 'Esther': ('esth', 'est'),
+    'Psalms': ('psalm', 'ps', 'psa', 'pss'), 'Proverbs': ('prov', 'pr', 'prv'),
+    'Ecclesiastes': ('eccl', 'ecc', 'qoh'), 'Song of Songs': ('song', 'songofsolomon', 'sos', 'canticles'),
+    'Isaiah': ('isa',), 'Jeremiah': ('jer',), 'Lamentations': ('lam',), 'Ezekiel': ('ezek', 'eze'),
+    'Daniel': ('dan', 'dn'), 'Hosea': ('hos',), 'Obadiah': ('obad', 'ob'), 'Jonah': ('jon', 'jnh'),
+    'Micah': ('mic',), 'Nahum': ('nah',), 'Habakkuk': ('hab',), 'Zephaniah': ('zeph', 'zep'),
+    'Haggai': ('hag',), 'Zechariah': ('zech', 'zec'), 'Malachi': ('mal',),
+    'Matthew': ('matt', 'mt'), 'Mark': ('mk', 'mrk'), 'Luke': ('lk', 'luk'), 'John': ('jn', 'jhn'),
+    'Romans': ('rom', 'rm'), 'Corinthians': ('cor',), 'Galatians': ('gal',), 'Ephesians': ('eph',),
+    'Philippians': ('phil', 'php'), 'Colossians': ('col',), 'Thessalonians': ('thess', 'thes', 'th'),
+    'Timothy': ('tim', 'tm'), 'Titus': ('tit',), 'Philemon': ('philem', 'phlm', 'phm'),
+    'Hebrews': ('heb',), 'James': ('jas', 'jm'), 'Peter': ('pet', 'pt'), 'Revelation': ('rev', 'revelations'),
+}
+
+_NUMBER_WORDS = {'i': '1', 'ii': '2', 'iii': '3', 'first': '1', 'second': '2', 'third': '3',
+                 '1st': '1', '2nd': '2', '3rd': '3'}
+
+_REFERENCE = re.compile(
+    r'^\s*(?P<book>(?:[1-3]|i{1,3}|first|second|third|1st|2nd|3rd)?\s*[a-z][a-z .]*?)\.?\s*'
+    r'(?P<chapter>\d+)(?:\s*:\s*(?P<start>\d+)(?:\s*[-–—]\s*(?P<end>\d+))?)?\s*$',
+    re.IGNORECASE
+)
+# Trailing translation tags such as "(NIV)" or "ESV"
+_TRANSLATION_TAG = re.compile(r'\s*(?:\(\s*[A-Za-z]{2,5}\s*\)|\b[A-Z]{2,5})\s*$')
+
+
+class InvalidReference(ValueError):
+    """A scripture reference that cannot be parsed or does not exist
+
+    ``reason`` is ``'syntax'``, ``'book'`` or ``'chapter'``.
+    """
+
+    def __init__(self, message, reason='syntax'):
+        super().__init__(message)
+        self.reason = reason
+
+
+class Reference(namedtuple('Reference', 'book chapter start end')):
+    """A parsed reference; ``start``/``end`` are None for a whole chapter"""
+
+    __slots__ = ()
+
+    @property
+    def book_name(self):
+        return BOOKS[self.book - 1][0]
+
+    @property
+    def label(self):
+        """Canonical form, e.g. "Philippians 4:6-7" """
+        # A single psalm is cited as "Psalm 23", not "Psalms 23"
+        name = 'Psalm' if self.book_name == 'Psalms' else self.book_name
+        text = f'{name} {self.chapter}'
+        if self.start is not None:
+            text += f':{self.start}'
+            if self.end != self.start:
+                text += f'-{self.end}'
+        return text
+
+
+def _book_key(name):
+    return re.sub(r'[\s.]+', '', name.lower())
+
+
+def _build_book_index():
+    index = {}
+    for number, (name, _) in enumerate(BOOKS, start=1):
+        index[_book_key(name)] = number
+        prefix, _, base = name.partition(' ') if name[0].isdigit() else ('', '', name)
+        for alias in _ALIASES.get(base, ()):
+            index[prefix + alias] = number
+    return index
+
+
+_BOOK_INDEX = _build_book_index()
+
+
+def find_book(name):
+    """Book number (1-66) for a name or abbreviation, or None"""
+    words = name.strip().lower().split()
+    if len(words) > 1 and words[0] in _NUMBER_WORDS:
+        words[0] = _NUMBER_WORDS[words[0]]
+    return _BOOK_INDEX.get(_book_key(''.join(words)))
+
+
+def parse_reference(text):
+    """Parse "Philippians 4:6-7", "1 Peter 5:7", "1 Pet. 5:7" or "Psalm 23" into a Reference"""
+    match = _REFERENCE.match(_TRANSLATION_TAG.sub('', text or ''))
+    if match is None:
+        raise InvalidReference(f'Could not parse scripture reference: {text!r}')
+
+    book = find_book(match.group('book'))
+    if book is None:
+        raise InvalidReference(f'Unknown book of the Bible: {match.group("book").strip()!r}', 'book')
+
+    chapter = int(match.group('chapter'))
+    start = int(match.group('start')) if match.group('start') else None
+    end = int(match.group('end')) if match.group('end') else start
+    chapters = BOOKS[book - 1][1]
+    if start is None and chapters == 1 and chapter > 1:
+        # Single-chapter books are often cited by verse alone ("Jude 24")
+        chapter, start, end = 1, chapter, chapter
+
+    if not 1 <= chapter <= chapters:
+        raise InvalidReference(f'{BOOKS[book - 1][0]} has {chapters} chapters, not {chapter}', 'chapter')
+    if start is not None and (start < 1 or end < start or end > 255):
+        raise InvalidReference(f'Invalid verse range in {text!r}')
+    return Reference(book, chapter, start, end)
+
+
+def _pack(book, chapter, verse):
+    return book << 16 | chapter << 8 | verse
+
+
+def build_corpus(rows, path):
+    """Write ``(book_name, chapter, verse, text)`` rows to a corpus file; returns the verse count"""
+    entries = {}
+    for book_name, chapter, verse, text in rows:
+        book = find_book(book_name)
+        if book is None:
+            raise InvalidReference(f'Unknown book of the Bible: {book_name!r}', 'book')
+        entries[_pack(book, int(chapter), int(verse))] = text.strip().encode('utf-8')
+
+    keys = sorted(entries)
+    index = bytearray()
+    text = bytearray()
+    for key in keys:
+        index += _ENTRY.pack(key, len(text), len(entries[key]))
+        text += entries[key]
+
+    # Write to a temporary file and rename so readers never see a partial corpus
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(keys)))
+        f.write(index)
+        f.write(text)
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+def read_tsv(path):
+    """Rows from a ``book<TAB>chapter<TAB>verse<TAB>text`` file, skipping ``#`` comments"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            book, chapter, verse, text = line.rstrip('\n').split('\t', 3)
+            yield book, int(chapter), int(verse), text
+
+
+class VerseCorpus:
+    """Read-only verse lookups over a memory-mapped corpus file"""
+
+    def __init__(self, path=CORPUS_PATH, source=None):
+        self.path = path
+        self.source = source
+        self._map = None
+        self._count = 0
+        self._text_start = 0
+        self._lock = threading.Lock()
+        self._lookups = 0
+
+    def _ensure_open(self):
+        if self._map is not None:
+            return self._map
+        with self._lock:
+            if self._map is None:
+                if not os.path.exists(self.path) and self.source and os.path.exists(self.source):
+                    build_corpus(read_tsv(self.source), self.path)
+                with open(self.path, 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count = _HEADER.unpack_from(mapped, 0)
+                if magic != MAGIC:
+                    mapped.close()
+                    raise ValueError(f'{self.path} is not a verse corpus file')
+                self._count = count
+                self._text_start = _HEADER.size + count * _ENTRY.size
+                self._map = mapped
+        return self._map
+
+    def _lower_bound(self, mapped, key):
+        """Index of the first entry whose key is >= ``key``"""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from('<I', mapped, _HEADER.size + mid * _ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _entries_between(self, first_key, last_key):
+        mapped = self._ensure_open()
+        position = self._lower_bound(mapped, first_key)
+        while position < self._count:
+            key, offset, length = _ENTRY.unpack_from(mapped, _HEADER.size + position * _ENTRY.size)
+            if key > last_key:
+                break
+            start = self._text_start + offset
+            yield key, mapped[start:start + length].decode('utf-8')
+            position += 1
+
+    def _entries(self, first_key, last_key):
+        self._lookups += 1
+        for key, text in self._entries_between(first_key, last_key):
+            yield key & 0xFF, text
+
+    def verse(self, book, chapter, verse):
+        """Text of a single verse, or None when it is not in the corpus"""
+        key = _pack(book, chapter, verse)
+        for _, text in self._entries(key, key):
+            return text
+        return None
+
+    def passage(self, reference):
+        """``[(verse_number, text)]`` for a Reference; whole chapters return every verse held"""
+        start = reference.start if reference.start is not None else 0
+        end = reference.end if reference.end is not None else 0xFF
+        return list(self._entries(_pack(reference.book, reference.chapter, start),
+                                  _pack(reference.book, reference.chapter, end)))
+
+    def all_verses(self):
+        """Every ``(Reference, text)`` in the corpus, in canonical order"""
+        for key, text in self._entries_between(0, 0xFFFFFFFF):
+            verse = key & 0xFF
+            yield Reference(key >> 16, (key >> 8) & 0xFF, verse, verse), text
+
+    def stats(self):
+        self._ensure_open()
+        return {
+            'path': os.path.basename(self.path),
+            'verses': self._count,
+            'size_bytes': len(self._map),
+            'lookups': self._lookups
+        }
+
+
+def verify_verse(verse, corpus=None):
+    """Check an LLM-cited verse against the corpus
+
+    Known passages get their canonical reference and text with ``verified: True``.
+    Passages the corpus does not hold are kept with ``verified: False``, and
+    references that cannot exist (e.g. chapter 40 of a 16-chapter book) are
+    rejected by returning None.
+    """
+    corpus = corpus or verse_corpus
+    try:
+        reference = parse_reference(verse.get('reference', ''))
+    except InvalidReference as e:
+        if e.reason == 'chapter':
+            return None
+        return dict(verse, verified=False)
+
+    found = corpus.passage(reference)
+    if reference.start is not None and len(found) == reference.end - reference.start + 1:
+        return {
+            'reference': reference.label,
+            'text': ' '.join(text for _, text in found),
+            'verified': True
+        }
+    return dict(verse, reference=reference.label, verified=False)
+
+
+# Shared corpus; the file is mapped lazily on the first lookup
+verse_corpus = VerseCorpus(CORPUS_PATH, source=CORPUS_SOURCE)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] != 'build':
+        print('Usage: python -m src.services.verses build SOURCE.tsv [DEST.bin]')
+        return 2
+    destination = argv[2] if len(argv) > 2 else CORPUS_PATH
+    count = build_corpus(read_tsv(argv[1]), destination)
+    print(f'Wrote {count} verses to {destination} ({os.path.getsize(destination)} bytes)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Regression tests for incremental calendar sync against the local stand-in server
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.services.calendar_sync import CalendarSync, CalendarSyncStore, content_hash
+from src.services.fake_calendar import FakeCalendar, FakeCalendarServer
+from src.services.google_calendar import CalendarClient
+
+def programs(*keys):
+    event = {
+        'summary': 'Prayer: Morning Prayer',
+        'start': {'dateTime': '2026-10-18T07:00:00', 'timeZone': 'America/New_York'},
+        'end': {'dateTime': '2026-10-18T07:30:00', 'timeZone': 'America/New_York'},
+        'status': 'confirmed'
+    }
+    return {key: (content_hash({'key': key}), lambda key=key: dict(event, summary=f'Prayer: {key}')) for key in keys}
+
+def start():
+    server = FakeCalendarServer(FakeCalendar(call_latency=0, error_rate=0), latency=0).start()
+    client = CalendarClient('test-token', server.api_base, server.batch_url, backoff=0.01)
+    sync = CalendarSync(CalendarSyncStore(os.path.join(tempfile.mkdtemp(), 'calendar_sync.db')))
+    return server, client, sync
+
+def test_simulated_sync_does_not_hide_programs_from_a_real_client():
+    """Programs first synced without a client are inserted by the first real sync"""
+    server, client, sync = start()
+    try:
+        _, summary = sync.sync('owner', programs('a', 'b'))
+        assert summary['created'] == 2
+        results, summary = sync.sync('owner', programs('a', 'b'), client)
+        assert summary['created'] == 2 and summary['failed'] == 0
+        assert {event['id'] for event in server.calendar.live_events()} == {r['event_id'] for r in results.values()}
+    finally:
+        server.stop()
+
+def test_update_of_a_purged_event_inserts_it_again():
+    """A PUT answered with 404 falls back to inserting the event"""
+    server, client, sync = start()
+    try:
+        sync.sync('owner', programs('a'), client)
+        # Google purges an event some time after it was deleted; the sync token no longer lists it
+        server.calendar.calendars['primary'].clear()
+        edited = {'a': (content_hash('edited'), lambda: dict(programs('a')['a'][1](), summary='Prayer: edited'))}
+        results, summary = sync.sync('owner', edited, client)
+        assert results['a']['ok'] and results['a']['action'] == 'created'
+        assert [event['id'] for event in server.calendar.live_events()] == [results['a']['event_id']]
+        _, summary = sync.sync('owner', edited, client)
+        assert summary['unchanged'] == 1 and summary['writes'] == 0
+    finally:
+        server.stop()
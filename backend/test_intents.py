@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Classifier tests for the /chat fast-path intent router
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.services.intents import IntentRouter
+
+router = IntentRouter().build()
+
+def test_questions_with_a_single_keyword_go_to_the_model():
+    """A bare keyword inside a real question does not earn a canned reply"""
+    for message in (
+        'What does Proverbs mean by the fear of the Lord, and how should I live it out?',
+        'My friend has depression, how can I support her?',
+        'Is it a sin to take medication for anxiety?',
+        'My pastor said healing stopped with the apostles, is that true?',
+    ):
+        intent_id, confidence, _ = router.classify(message)
+        assert confidence < router.threshold, (message, intent_id, confidence)
+        assert router.route(message) is None
+
+def test_short_topic_messages_are_served():
+    """Messages that are mostly the intent's own phrases stay on the fast path"""
+    for message, expected in (
+        ('I feel anxious', 'anxiety'),
+        ("I'm afraid of the future", 'fear'),
+        ('Please pray for healing', 'healing'),
+        ('I feel hopeless', 'depression'),
+        ('How do I pray?', 'prayer'),
+        ('hi', 'greeting'),
+    ):
+        intent_id, confidence, _ = router.classify(message)
+        assert intent_id == expected and confidence >= router.threshold, (message, intent_id, confidence)
+
+def test_negated_and_crisis_messages_are_not_served():
+    assert router.classify("I'm not anxious anymore, just curious about Psalm 23")[0] is None
+    assert router.classify('I feel anxious and want to die')[0] == 'crisis'
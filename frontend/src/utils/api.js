@@ -51,6 +51,20 @@ class APIClient {
     return this.request(`/spiritual-programs/${programId}`)
   }
 
+  async searchContent({ q = '', type, category, limit, cursor } = {}) {
+    const params = new URLSearchParams({ q })
+    if (type) params.set('type', type)
+    if (category) params.set('category', category)
+    if (limit) params.set('limit', limit)
+    if (cursor) params.set('cursor', cursor)
+    return this.request(`/content/search?${params}`)
+  }
+
+  async getProgress(userId) {
+    const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone
+    return this.request(`/progress?${new URLSearchParams({ user_id: userId, timezone })}`)
+  }
+
   // Calendar integration endpoints
   async getCalendarEvents() {
     return this.request('/calendar/events')
@@ -63,6 +77,19 @@ class APIClient {
     })
   }
 
+  // Send the full list of programs; only changes are pushed to the calendar
+  async syncCalendar(programs, { userId, timezone, prune = true } = {}) {
+    return this.request('/calendar/sync', {
+      method: 'POST',
+      body: JSON.stringify({
+        programs,
+        user_id: userId,
+        timezone: timezone || Intl.DateTimeFormat().resolvedOptions().timeZone,
+        prune,
+      }),
+    })
+  }
+
   // User endpoints
   async getUserProfile() {
     return this.request('/user/profile')